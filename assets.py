@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import mimetypes
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from astrbot.api import logger
+
+from .cache import DiskCache, LRUCache
+
+# 本地渲染页面与静态资源统一挂在这个虚拟源下，由 Playwright 路由拦截后从内存返回
+ASSET_ORIGIN = "https://astrbot-teacher.local"
+
+KATEX_CDN = "https://cdn.jsdelivr.net/npm/katex@0.16.9/dist"
+MARKED_CDN = "https://cdn.jsdelivr.net/npm/marked@11.1.0"
+
+_CONTENT_TYPES = {
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+    ".woff2": "font/woff2",
+    ".woff": "font/woff",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+}
+
+
+def content_type_for(path: str) -> str:
+    ext = Path(path).suffix.lower()
+    return _CONTENT_TYPES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def cdn_url_for(route_path: str) -> Optional[str]:
+    """本地缺失时的 CDN 回退地址；KaTeX 字体等相对路径资源按同样的目录结构映射。"""
+    if route_path == "/katex/auto-render.min.js":
+        return f"{KATEX_CDN}/contrib/auto-render.min.js"
+    if route_path.startswith("/katex/"):
+        return KATEX_CDN + route_path[len("/katex"):]
+    if route_path == "/marked/marked.min.js":
+        return f"{MARKED_CDN}/marked.min.js"
+    return None
+
+
+class AssetTable:
+    """一份已登记的渲染资源：启动时读入内存的小文件与按需读取的大文件。
+
+    重新加载时在线程中基于当前资源的副本构建新的一份，再由 AssetStore.publish 整体替换，
+    正在渲染的页面始终看到完整的一份资源。
+    """
+
+    def __init__(
+        self,
+        static: Optional[Dict[str, Tuple[bytes, str]]] = None,
+        files: Optional[Dict[str, Path]] = None,
+    ):
+        self.static: Dict[str, Tuple[bytes, str]] = dict(static or {})
+        self.files: Dict[str, Path] = dict(files or {})
+        self._version: Optional[str] = None
+
+    def copy(self) -> "AssetTable":
+        return AssetTable(self.static, self.files)
+
+    def load_file(self, route_path: str, file: Path) -> bool:
+        """立即读入内存；文件不存在返回 False。"""
+        try:
+            data = file.read_bytes()
+        except OSError:
+            return False
+        self.static[route_path] = (data, content_type_for(route_path))
+        self._version = None
+        return True
+
+    def load_dir(self, prefix: str, directory: Path) -> int:
+        """将目录下全部文件读入内存（用于 KaTeX fonts/ 这类小体积目录），返回文件数。"""
+        count = 0
+        if not directory.is_dir():
+            return 0
+        for f in sorted(directory.rglob("*")):
+            if f.is_file() and self.load_file(f"{prefix}/{f.relative_to(directory).as_posix()}", f):
+                count += 1
+        return count
+
+    def register_file(self, route_path: str, file: Path) -> str:
+        """登记一个按需读取的大文件（如 CJK 字体），返回其访问 URL。"""
+        if self.files.get(route_path) != file:
+            self.files[route_path] = file
+            self._version = None
+        return ASSET_ORIGIN + route_path
+
+    def clear(self, prefix: str = "") -> None:
+        """移除指定前缀下已登记的资源（用于配置变化后重新加载）。"""
+        for d in (self.static, self.files):
+            for k in [k for k in d if k.startswith(prefix)]:
+                d.pop(k, None)
+        self._version = None
+
+    @property
+    def version(self) -> str:
+        """已登记资源内容的指纹，用于渲染缓存键。"""
+        if self._version is None:
+            h = hashlib.sha256()
+            for k in sorted(self.static):
+                h.update(k.encode("utf-8"))
+                h.update(hashlib.sha256(self.static[k][0]).digest())
+            for k in sorted(self.files):
+                h.update(k.encode("utf-8"))
+                h.update(str(self.files[k]).encode("utf-8"))
+            self._version = h.hexdigest()[:16]
+        return self._version
+
+
+class AssetStore:
+    """渲染资源的进程内缓存，并作为 Playwright 路由处理器对页面提供服务。
+
+    - KaTeX / marked.js 等小文件启动时一次性读入内存
+    - 自定义字体等大文件按需读取，放入有界 LRU
+    - 本地缺失的资源首次请求时从 CDN 下载，之后持久化在磁盘并常驻内存
+    - 页面 HTML 也经由路由从内存返回，不再逐次落盘
+    - 已登记的资源是一份 AssetTable，重新加载时以 draft / publish 整体替换
+    """
+
+    def __init__(
+        self,
+        cdn_cache_dir: Path,
+        session_factory: Callable[[], aiohttp.ClientSession],
+        *,
+        file_cache_bytes: int = 128 * 1024 * 1024,
+    ):
+        self._session_factory = session_factory
+        self._table = AssetTable()
+        self._remote: Dict[str, Tuple[bytes, str]] = {}
+        self._file_cache = LRUCache(1024, max_bytes=file_cache_bytes, sizeof=lambda v: len(v[0]))
+        self._pages: Dict[str, str] = {}
+        self._cdn = DiskCache(cdn_cache_dir, suffix=".asset")
+        self._cdn_locks: Dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def url(route_path: str) -> str:
+        return ASSET_ORIGIN + route_path
+
+    def has(self, route_path: str) -> bool:
+        table = self._table
+        return route_path in table.static or route_path in table.files or route_path in self._remote
+
+    def draft(self) -> AssetTable:
+        """当前资源的副本，供在线程中修改后 publish；不影响正在使用的资源。"""
+        return self._table.copy()
+
+    def publish(self, table: AssetTable) -> None:
+        """以一次引用替换换上新的资源（在事件循环中调用）。"""
+        if table is self._table:
+            return
+        self._table = table
+        self._file_cache.clear()
+
+    def put_page(self, html: str) -> str:
+        """暂存一份页面 HTML，返回可供 page.goto 的 URL。"""
+        route_path = f"/page/{uuid.uuid4().hex}.html"
+        self._pages[route_path] = html
+        return self.url(route_path)
+
+    def discard_page(self, url: str) -> None:
+        self._pages.pop(urlparse(url).path, None)
+
+    @property
+    def version(self) -> str:
+        """已加载资源内容的指纹，用于渲染缓存键。"""
+        return self._table.version
+
+    async def get(self, route_path: str) -> Optional[Tuple[bytes, str]]:
+        page = self._pages.get(route_path)
+        if page is not None:
+            return page.encode("utf-8"), _CONTENT_TYPES[".html"]
+        table = self._table
+        item = table.static.get(route_path) or self._remote.get(route_path)
+        if item is not None:
+            return item
+        file = table.files.get(route_path)
+        if file is not None:
+            item = self._file_cache.get(route_path)
+            if item is None:
+                try:
+                    data = await asyncio.to_thread(file.read_bytes)
+                except OSError:
+                    logger.warning("渲染资源读取失败: %s", file)
+                    return None
+                item = (data, content_type_for(route_path))
+                self._file_cache.set(route_path, item)
+            return item
+        return await self._get_from_cdn(route_path)
+
+    async def _get_from_cdn(self, route_path: str) -> Optional[Tuple[bytes, str]]:
+        cdn_url = cdn_url_for(route_path)
+        if cdn_url is None:
+            return None
+        lock = self._cdn_locks.setdefault(route_path, asyncio.Lock())
+        async with lock:
+            item = self._remote.get(route_path)
+            if item is not None:
+                return item
+            key = hashlib.sha256(cdn_url.encode("utf-8")).hexdigest()
+            data = await asyncio.to_thread(self._cdn.get_bytes, key)
+            if data is None:
+                try:
+                    session = self._session_factory()
+                    async with session.get(cdn_url, timeout=aiohttp.ClientTimeout(total=20)) as resp:
+                        resp.raise_for_status()
+                        data = await resp.read()
+                except Exception as e:
+                    logger.warning("从 CDN 获取渲染资源失败: %s (%s)", cdn_url, e)
+                    return None
+                await asyncio.to_thread(self._cdn.set_bytes, key, data)
+                logger.info("已从 CDN 下载并缓存渲染资源: %s", cdn_url)
+            # 单独存放且不计入 version：CDN 地址本身带有固定版本号
+            item = (data, content_type_for(route_path))
+            self._remote[route_path] = item
+            return item
+
+    async def prefetch(self, route_paths: Iterable[str]) -> None:
+        """后台预取本地缺失的资源，避免首个渲染请求等待 CDN。"""
+        for p in route_paths:
+            if not self.has(p):
+                await self._get_from_cdn(p)
+
+    async def handle(self, route: Any) -> None:
+        """Playwright 路由处理器：命中则从内存返回，否则 404。"""
+        route_path = urlparse(route.request.url).path
+        try:
+            item = await self.get(route_path)
+        except Exception:
+            logger.exception("渲染资源路由处理失败: %s", route_path)
+            item = None
+        if item is None:
+            await route.fulfill(status=404, body=b"")
+            return
+        body, ctype = item
+        await route.fulfill(
+            status=200,
+            body=body,
+            headers={
+                "Content-Type": ctype,
+                "Access-Control-Allow-Origin": "*",
+                "Cache-Control": "no-store" if route_path.startswith("/page/") else "max-age=31536000",
+            },
+        )
@@ -0,0 +1,387 @@
+"""离线基准测试：以本地 Stub Provider 驱动 TeacherPlugin，测量渲染吞吐、延迟分位数与峰值内存。
+
+两种模式：
+- render：把语料库中的解答套入渲染包后直接调用 _render_locally，只测 Chromium 渲染
+- solve：经 TeacherPlugin.solve 走完整的 /g 流程（调度 → 解题 → 渲染），解题模型为可配置延迟的 Stub
+
+语料库（bench/corpus/*.md）覆盖大量公式、长证明、C++ 代码块、GFM 表格与中文长文本。
+开始计时前先把每篇语料渲染一次（同时预热浏览器），记录页数与图片高度用于发现排版回归。
+
+默认与基线（bench/baseline.json）比较：吞吐下降、p95 延迟或峰值内存上升超过 --tolerance，
+或某篇语料的页数变化、图片高度变化超过 --layout-tolerance 时以退出码 1 结束。
+基线与机器相关，仓库中不附带，需先在固定的机器上用 --save-baseline 生成；
+基线文件不存在时以退出码 2 结束（不会静默通过），只想查看结果时加 --no-compare。
+
+需要在装有 AstrBot、Playwright 与 Chromium 的环境中运行（可选安装 psutil 以统计 Chromium 子进程内存）：
+    python bench/run.py
+    python bench/run.py --mode render -c 1,2,4 -n 40
+    python bench/run.py --mode solve --latency-ms 800 --set stream_sections=true
+    python bench/run.py --save-baseline
+    python bench/run.py --no-compare
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stubs import StubContext, StubEvent, StubProvider, results_of  # noqa: E402
+
+try:
+    import psutil  # type: ignore
+except ImportError:
+    psutil = None
+
+BENCH_DIR = Path(__file__).resolve().parent
+PLUGIN_DIR = BENCH_DIR.parent
+
+# 基准测试的插件配置：关闭各级缓存以免重复请求直接命中，入口不限流；可被 --set 覆盖
+_BENCH_CONFIG: Dict[str, Any] = {
+    "prefer_local_render": True,
+    "solver_cache_enabled": False,
+    "ocr_cache_enabled": False,
+    "image_cache_enabled": False,
+    "max_pending_requests": 0,
+    "max_pending_per_user": 0,
+}
+
+# 与基线比较的指标及其方向（True 表示越大越好）
+_CHECKED_METRICS = {"renders_per_sec": True, "p95_ms": False, "peak_rss_mb": False}
+
+
+def _load_plugin() -> Tuple[Any, Any]:
+    """以包的形式导入插件（相对导入需要），返回 (main 模块, metrics 模块)。"""
+    sys.path.insert(0, str(PLUGIN_DIR.parent))
+    main = importlib.import_module(f"{PLUGIN_DIR.name}.main")
+    metrics = importlib.import_module(f"{PLUGIN_DIR.name}.metrics")
+    return main, metrics
+
+
+def load_corpus(names: Optional[List[str]] = None) -> Dict[str, str]:
+    corpus = {p.stem: p.read_text(encoding="utf-8") for p in sorted((BENCH_DIR / "corpus").glob("*.md"))}
+    if names:
+        unknown = [n for n in names if n not in corpus]
+        if unknown:
+            raise SystemExit(f"语料库中没有: {', '.join(unknown)}（可选: {', '.join(corpus)}）")
+        corpus = {n: corpus[n] for n in names}
+    return corpus
+
+
+def image_height(path: str) -> int:
+    """读取 PNG 文件头中的高度；其他格式返回 0（不参与高度比较）。"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(24)
+    except OSError:
+        return 0
+    if head[:8] != b"\x89PNG\r\n\x1a\n":
+        return 0
+    return struct.unpack(">I", head[20:24])[0]
+
+
+class RssSampler:
+    """周期采样本进程及其子进程（Chromium、渲染 worker）的 RSS 之和，记录峰值。
+
+    未安装 psutil 时退回为本进程的 ru_maxrss（不含子进程，且无法按测试轮次归零）。
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._task: Optional[asyncio.Task] = None
+        self._proc = psutil.Process() if psutil is not None else None
+
+    @property
+    def includes_children(self) -> bool:
+        return self._proc is not None
+
+    def _sample(self) -> int:
+        if self._proc is None:
+            try:
+                import resource
+
+                return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            except (ImportError, AttributeError):
+                return 0
+        total = 0
+        for proc in [self._proc, *self._proc.children(recursive=True)]:
+            try:
+                total += proc.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            self.peak = max(self.peak, await asyncio.to_thread(self._sample))
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self.peak = 0
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> float:
+        """停止采样并返回峰值（MB）。"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.peak = max(self.peak, self._sample())
+        return self.peak / 1024 / 1024
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace, corpus: Dict[str, str]):
+        self.args = args
+        self.corpus = corpus
+        self.names = list(corpus)
+        self.main, self.metrics_mod = _load_plugin()
+        self.provider = StubProvider(
+            corpus,
+            latency=args.latency_ms / 1000,
+            jitter=args.jitter,
+            chunk_chars=args.chunk_chars,
+            chunk_interval=args.chunk_interval_ms / 1000,
+        )
+        self.config = {**_BENCH_CONFIG, **args.set}
+        self._tmp = tempfile.TemporaryDirectory(prefix="astrbot_teacher_bench_")
+        self.plugin = self.main.TeacherPlugin(StubContext(self.provider), self.config)
+        # 缓存与渲染临时文件放在一次性目录中，不碰 AstrBot 的插件数据目录
+        data_dir = Path(self._tmp.name)
+        self.plugin._data_dir = lambda: data_dir
+        self.sampler = RssSampler()
+
+    async def start(self) -> None:
+        await self.plugin.initialize()
+
+    async def close(self) -> None:
+        try:
+            await self.plugin.terminate()
+        finally:
+            self._tmp.cleanup()
+
+    @property
+    def _scale(self) -> int:
+        return int(self.config.get("local_device_scale", 2) or 2)
+
+    async def render_once(self, name: str, index: int) -> List[str]:
+        """渲染模式的一次请求：模板渲染 + 本地截图，阶段耗时计入插件的滚动指标。"""
+        question = f"基准测试 {name} #{index}"
+        trace = self.metrics_mod.Trace()
+        with self.metrics_mod.tracing(trace):
+            bundle = await self.plugin._get_bundle()
+            with self.metrics_mod.stage("template"):
+                html = bundle.render_local(question=question, content=self.corpus[name])
+            outs = await self.plugin._render_locally(
+                html,
+                device_scale=self._scale,
+                full_page=True,
+                max_page_height=int(self.config.get("page_max_height", 0) or 0),
+            )
+        for stage_name, seconds in trace.stages.items():
+            self.plugin._metrics.observe("stage_seconds", stage_name, seconds)
+        return outs
+
+    async def solve_once(self, name: str, index: int) -> List[str]:
+        """完整流程的一次请求；每个请求使用不同的题目与用户，避免被合并或被单用户限流。"""
+        event = StubEvent(f"[corpus:{name}] 基准测试题目 #{index}", user=f"bench-{index}")
+        results = [r async for r in self.plugin.solve(event)]
+        images = results_of("image", results) + [img for chain in results_of("chain", results) for img in chain]
+        if not images:
+            raise RuntimeError("未产出图片: " + " | ".join(p[:80] for p in results_of("plain", results)[-1:]))
+        return images
+
+    async def layout_pass(self) -> Dict[str, Dict[str, int]]:
+        """逐篇渲染一次语料（兼作预热），记录页数与图片总高度。"""
+        layout: Dict[str, Dict[str, int]] = {}
+        for name in self.names:
+            outs = await self.render_once(name, 0)
+            layout[name] = {"pages": len(outs), "height": sum(image_height(o) for o in outs)}
+            print(f"  {name}: {len(outs)} 页，高 {layout[name]['height']}px")
+        return layout
+
+    async def run_level(self, mode: str, concurrency: int, requests: int) -> Dict[str, Any]:
+        once = self.render_once if mode == "render" else self.solve_once
+        latencies = self.metrics_mod.Metrics(window=requests)
+        failures: List[str] = []
+        counter = iter(range(requests))
+        self.plugin._metrics.reset()
+
+        async def worker() -> None:
+            for i in counter:
+                t0 = time.perf_counter()
+                try:
+                    await once(self.names[i % len(self.names)], i + 1)
+                except Exception as e:
+                    failures.append(f"{type(e).__name__}: {e}")
+                    continue
+                latencies.observe("latency", "ok", time.perf_counter() - t0)
+
+        self.sampler.start()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+        peak_mb = await self.sampler.stop()
+
+        count, _total, qs = latencies.snapshot().get("latency", {}).get("ok", (0, 0.0, [0.0, 0.0, 0.0]))
+        stages = self.plugin._metrics.snapshot().get("stage_seconds", {})
+        return {
+            "requests": requests,
+            "ok": count,
+            "failed": len(failures),
+            "errors": sorted(set(failures))[:3],
+            "renders_per_sec": count / wall if wall > 0 else 0.0,
+            "p50_ms": qs[0] * 1000,
+            "p95_ms": qs[1] * 1000,
+            "p99_ms": qs[2] * 1000,
+            "peak_rss_mb": peak_mb,
+            "stages_p50_ms": {label: s[2][0] * 1000 for label, s in stages.items()},
+        }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, layout_tolerance: float) -> List[str]:
+    """返回超出容差的回归项；基线中没有的测试项不比较。"""
+    problems: List[str] = []
+    for key, result in current.get("levels", {}).items():
+        base = baseline.get("levels", {}).get(key)
+        if not base:
+            continue
+        if result["failed"]:
+            problems.append(f"{key}: {result['failed']} 个请求失败")
+        for metric, higher_is_better in _CHECKED_METRICS.items():
+            old, new = float(base.get(metric) or 0), float(result.get(metric) or 0)
+            if not old:
+                continue
+            if higher_is_better and new < old * (1 - tolerance):
+                problems.append(f"{key}: {metric} {new:.2f} 低于基线 {old:.2f}")
+            elif not higher_is_better and new > old * (1 + tolerance):
+                problems.append(f"{key}: {metric} {new:.1f} 高于基线 {old:.1f}")
+    for name, item in current.get("layout", {}).items():
+        base = baseline.get("layout", {}).get(name)
+        if not base:
+            continue
+        if item["pages"] != base["pages"]:
+            problems.append(f"语料 {name}: 页数 {item['pages']}，基线为 {base['pages']}")
+        elif base["height"] and item["height"] and abs(item["height"] - base["height"]) > base["height"] * layout_tolerance:
+            problems.append(f"语料 {name}: 图片高度 {item['height']}px，基线为 {base['height']}px")
+    return problems
+
+
+def _print_level(key: str, result: Dict[str, Any], with_children: bool) -> None:
+    rss_note = "" if with_children else "（仅本进程）"
+    print(
+        f"{key}: {result['renders_per_sec']:.2f} 次/秒，"
+        f"p50 {result['p50_ms']:.0f}ms / p95 {result['p95_ms']:.0f}ms / p99 {result['p99_ms']:.0f}ms，"
+        f"峰值 RSS {result['peak_rss_mb']:.0f} MB{rss_note}，"
+        f"成功 {result['ok']}/{result['requests']}"
+    )
+    stages = result["stages_p50_ms"]
+    if stages:
+        print("  阶段 p50: " + ", ".join(f"{k} {v:.0f}ms" for k, v in sorted(stages.items(), key=lambda kv: -kv[1])))
+    for err in result["errors"]:
+        print(f"  错误: {err}")
+
+
+async def run(args: argparse.Namespace) -> int:
+    baseline_path = Path(args.baseline)
+    if not (args.save_baseline or args.no_compare or baseline_path.is_file()):
+        print(
+            f"❌ 未找到基线文件 {baseline_path}，无法进行回归比较。\n"
+            "请先在固定的机器上生成基线：python bench/run.py --save-baseline"
+            "（参数需与比较时一致），或加 --no-compare 只查看本次结果。"
+        )
+        return 2
+    corpus = load_corpus(args.corpus)
+    bench = Bench(args, corpus)
+    if psutil is None:
+        print("未安装 psutil：峰值内存仅统计本进程，不含 Chromium（pip install psutil 以启用）")
+    current: Dict[str, Any] = {"levels": {}, "layout": {}}
+    await bench.start()
+    try:
+        print("排版检查（兼作预热）:")
+        current["layout"] = await bench.layout_pass()
+        for mode in (["render", "solve"] if args.mode == "all" else [args.mode]):
+            for concurrency in args.concurrency:
+                requests = max(args.requests, concurrency)
+                key = f"{mode}@{concurrency}"
+                result = await bench.run_level(mode, concurrency, requests)
+                current["levels"][key] = result
+                _print_level(key, result, bench.sampler.includes_children)
+    finally:
+        await bench.close()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.save_baseline:
+        saved = {
+            "levels": {
+                k: {m: round(v[m], 3) for m in ("renders_per_sec", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb")}
+                for k, v in current["levels"].items()
+            },
+            "layout": current["layout"],
+        }
+        baseline_path.write_text(json.dumps(saved, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"基线已写入 {baseline_path}")
+        return 0
+    if args.no_compare:
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    problems = compare(current, baseline, args.tolerance, args.layout_tolerance)
+    if problems:
+        print("❌ 相对基线出现回归:\n  - " + "\n  - ".join(problems))
+        return 1
+    print("✅ 未超出基线容差")
+    return 0
+
+
+def _parse_set(items: List[str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for item in items:
+        key, sep, raw = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--set 需要 key=value 形式: {item}")
+        try:
+            out[key.strip()] = json.loads(raw)
+        except ValueError:
+            out[key.strip()] = raw
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="astrbot_teacher 离线基准测试")
+    parser.add_argument("--mode", choices=("render", "solve", "all"), default="all")
+    parser.add_argument("-c", "--concurrency", default="1,4,8", help="并发级别，逗号分隔")
+    parser.add_argument("-n", "--requests", type=int, default=24, help="每个并发级别的请求数（不少于并发数）")
+    parser.add_argument("--corpus", default="", help="只使用这些语料，逗号分隔（默认全部）")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Stub 解题模型的延迟（流式时为首个分片前）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟随机浮动比例")
+    parser.add_argument("--chunk-chars", type=int, default=64, help="流式分片大小（字符）")
+    parser.add_argument("--chunk-interval-ms", type=float, default=20, help="流式分片间隔")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖插件配置项（值按 JSON 解析）")
+    parser.add_argument("--baseline", default=str(BENCH_DIR / "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写为基线")
+    parser.add_argument("--no-compare", action="store_true", help="不与基线比较（基线不存在时也不报错）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="吞吐/延迟/内存相对基线的容差")
+    parser.add_argument("--layout-tolerance", type=float, default=0.05, help="语料图片高度相对基线的容差")
+    parser.add_argument("--json", default="", help="把完整结果另存为 JSON")
+    args = parser.parse_args(argv)
+    args.concurrency = [max(1, int(c)) for c in str(args.concurrency).split(",") if c.strip()]
+    args.corpus = [c.strip() for c in args.corpus.split(",") if c.strip()]
+    args.set = _parse_set(args.set)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""基准测试用的替身对象：本地 Stub Provider、AstrBot Context 与消息事件。
+
+不发起任何网络请求，可在离线环境中驱动 TeacherPlugin.solve。
+"""
+import asyncio
+import random
+import re
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+# 题目中的 [corpus:名称] 标记决定 Stub Provider 返回语料库中的哪篇解答
+_CORPUS_TAG = re.compile(r"\[corpus:([\w-]+)\]")
+
+
+@dataclass
+class StubResponse:
+    completion_text: str
+    is_chunk: bool = False
+
+
+class StubProvider:
+    """实现 text_chat / text_chat_stream 的本地 Provider，按配置的延迟返回语料库中的解答。
+
+    - latency：text_chat 的整体延迟，流式时为首个分片前的延迟（秒）
+    - jitter：延迟的随机浮动比例（0.2 表示 ±20%）
+    - chunk_chars / chunk_interval：流式分片的大小（字符）与间隔（秒）
+    """
+
+    def __init__(
+        self,
+        answers: Dict[str, str],
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        chunk_chars: int = 64,
+        chunk_interval: float = 0.0,
+    ):
+        self.answers = answers
+        self.latency = max(0.0, latency)
+        self.jitter = max(0.0, jitter)
+        self.chunk_chars = max(1, int(chunk_chars))
+        self.chunk_interval = max(0.0, chunk_interval)
+        self.provider_config = {"id": "bench-stub", "model_config": {"model": "stub"}}
+        self.calls = 0
+
+    def _delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _answer(self, prompt: str) -> str:
+        m = _CORPUS_TAG.search(prompt or "")
+        if m and m.group(1) in self.answers:
+            return self.answers[m.group(1)]
+        return next(iter(self.answers.values()), "")
+
+    async def text_chat(self, prompt: str = "", context: Any = None, system_prompt: str = "", image_urls: Any = None, model: Optional[str] = None, **kwargs: Any) -> StubResponse:
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        return StubResponse(self._answer(prompt))
+
+    async def text_chat_stream(self, prompt: str = "", context: Any = None, system_prompt: str = "", image_urls: Any = None, model: Optional[str] = None, **kwargs: Any) -> AsyncIterator[StubResponse]:
+        self.calls += 1
+        text = self._answer(prompt)
+        await asyncio.sleep(self._delay())
+        for i in range(0, len(text), self.chunk_chars):
+            if i and self.chunk_interval:
+                await asyncio.sleep(self.chunk_interval)
+            yield StubResponse(text[i:i + self.chunk_chars], is_chunk=True)
+        yield StubResponse(text)
+
+
+class StubContext:
+    """只提供插件用到的 Provider 查找接口，任何 ID 都返回同一个 Stub Provider。"""
+
+    def __init__(self, provider: StubProvider):
+        self.provider = provider
+
+    def get_provider_by_id(self, provider_id: str = "") -> StubProvider:
+        return self.provider
+
+    def get_using_provider(self, umo: Any = None) -> StubProvider:
+        return self.provider
+
+
+@dataclass
+class _Plain:
+    text: str
+
+
+class _MessageObj:
+    def __init__(self, text: str):
+        self.message = [_Plain(text)]
+
+
+class StubEvent:
+    """一条私聊 `/g` 消息；plain_result / image_result / chain_result 返回 (类型, 内容) 元组供统计。"""
+
+    def __init__(self, question: str, user: str):
+        self.message_str = f"/g {question}"
+        self.message_obj = _MessageObj(self.message_str)
+        self.unified_msg_origin = f"bench:FriendMessage:{user}"
+        self._user = user
+
+    def get_sender_id(self) -> str:
+        return self._user
+
+    def get_group_id(self) -> str:
+        return ""
+
+    def plain_result(self, text: str) -> Tuple[str, str]:
+        return ("plain", text)
+
+    def image_result(self, path: str) -> Tuple[str, str]:
+        return ("image", path)
+
+    def chain_result(self, chain: List[Any]) -> Tuple[str, List[Any]]:
+        return ("chain", chain)
+
+
+def results_of(kind: str, results: List[Tuple[str, Any]]) -> List[Any]:
+    return [payload for k, payload in results if k == kind]
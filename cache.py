@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from astrbot.api import logger
+
+
+def make_key(*parts: Any) -> str:
+    """将若干部分拼接后取 sha256，作为缓存键（同时可直接用作文件名）。"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(str(part if part is not None else "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """题目文本归一化：NFKC 全半角统一、合并空白，使仅有排版差异的重复题目命中同一缓存。"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _default_sizeof(value: Any) -> int:
+    """缓存值的字节数：字符串按 UTF-8 编码后的长度计，使 max_bytes 的单位确为字节。"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, bytes):
+        return len(value)
+    return 0
+
+
+class LRUCache:
+    """有界内存 LRU，支持条目数、总字节数与 TTL 三种限制（0 表示不限制）。"""
+
+    def __init__(
+        self,
+        max_items: int = 256,
+        *,
+        max_bytes: int = 0,
+        ttl_seconds: float = 0,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.max_items = max(0, int(max_items))
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self._sizeof = sizeof or _default_sizeof
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, created, _size = item
+        if self.ttl_seconds and time.time() - created > self.ttl_seconds:
+            self.pop(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_items == 0:
+            return
+        size = int(self._sizeof(value))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        self.pop(key)
+        self._data[key] = (value, time.time(), size)
+        self._bytes += size
+        while self._data and (
+            len(self._data) > self.max_items or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            _k, (_v, _c, old_size) = self._data.popitem(last=False)
+            self._bytes -= old_size
+
+    def pop(self, key: str) -> Any:
+        item = self._data.pop(key, None)
+        if item is None:
+            return None
+        self._bytes -= item[2]
+        return item[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+
+class DiskCache:
+    """以文件为单位的持久化缓存目录。
+
+    - 文件 mtime 记录写入时间（用于 TTL），atime 记录最近一次命中（用于 LRU 淘汰）
+    - 超过条目数或总字节数上限时，按最近使用时间从旧到新删除
+    - 全部为同步 IO，异步代码中请经 asyncio.to_thread 调用
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        suffix: str = ".bin",
+        ttl_seconds: float = 0,
+        max_entries: int = 0,
+        max_bytes: int = 0,
+    ):
+        self.root = Path(root)
+        self.suffix = suffix
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._entries = -1
+        self._bytes = 0
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}{self.suffix}"
+
+    def _iter_files(self) -> Iterator[Path]:
+        if not self.root.is_dir():
+            return iter(())
+        return (p for p in self.root.glob(f"*/*{self.suffix}") if p.is_file())
+
+    def _ensure_counted(self) -> None:
+        if self._entries >= 0:
+            return
+        entries, total = 0, 0
+        for p in self._iter_files():
+            try:
+                total += p.stat().st_size
+                entries += 1
+            except OSError:
+                pass
+        self._entries, self._bytes = entries, total
+
+    def _expired(self, st: os.stat_result, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - st.st_mtime > self.ttl_seconds
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """命中时刷新最近使用时间并返回文件路径；过期或不存在返回 None。"""
+        path = self.path_for(key)
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        now = time.time()
+        if self._expired(st, now):
+            self.delete(key)
+            return None
+        try:
+            os.utime(path, (now, st.st_mtime))
+        except OSError:
+            pass
+        return path
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def set_bytes(self, key: str, data: bytes) -> Path:
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        with self._lock:
+            self._ensure_counted()
+            try:
+                old = path.stat().st_size
+                self._entries -= 1
+                self._bytes -= old
+            except OSError:
+                pass
+            os.replace(tmp, path)
+            self._entries += 1
+            self._bytes += len(data)
+            over = (self.max_entries and self._entries > self.max_entries) or (
+                self.max_bytes and self._bytes > self.max_bytes
+            )
+        if over:
+            self.prune()
+        return path
+
+    def delete(self, key: str) -> None:
+        path = self.path_for(key)
+        with self._lock:
+            try:
+                size = path.stat().st_size
+                path.unlink()
+                if self._entries >= 0:
+                    self._entries -= 1
+                    self._bytes -= size
+            except OSError:
+                pass
+
+    def prune(self) -> int:
+        """删除过期文件，并按 LRU 淘汰到上限以内（留 10% 余量避免频繁扫描）。返回删除数量。"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            alive = []
+            for p in self._iter_files():
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                if self._expired(st, now):
+                    try:
+                        p.unlink()
+                        removed += 1
+                    except OSError:
+                        pass
+                    continue
+                alive.append((st.st_atime, st.st_size, p))
+            alive.sort(key=lambda x: x[0])
+            entries = len(alive)
+            total = sum(x[1] for x in alive)
+            target_entries = int(self.max_entries * 0.9) if self.max_entries else 0
+            target_bytes = int(self.max_bytes * 0.9) if self.max_bytes else 0
+            for _atime, size, p in alive:
+                if not ((target_entries and entries > target_entries) or (target_bytes and total > target_bytes)):
+                    break
+                try:
+                    p.unlink()
+                    removed += 1
+                    entries -= 1
+                    total -= size
+                except OSError:
+                    pass
+            self._entries, self._bytes = entries, total
+        if removed:
+            logger.debug("缓存目录 %s 清理 %d 个文件", self.root, removed)
+        return removed
+
+    def clear(self) -> int:
+        removed = 0
+        with self._lock:
+            for p in list(self._iter_files()):
+                try:
+                    p.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+            self._entries, self._bytes = 0, 0
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._ensure_counted()
+            return {"entries": self._entries, "bytes": self._bytes}
+
+
+class TieredCache:
+    """内存 LRU + 磁盘缓存的两级缓存，值为可 JSON 序列化的对象。"""
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache]):
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is None:
+            return None
+        raw = await asyncio.to_thread(self.disk.get_bytes, key)
+        if raw is None:
+            return None
+        try:
+            value = json.loads(raw.decode("utf-8"))
+        except Exception:
+            await asyncio.to_thread(self.disk.delete, key)
+            return None
+        self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.disk is None:
+            return
+        raw = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        try:
+            await asyncio.to_thread(self.disk.set_bytes, key, raw)
+        except Exception:
+            logger.exception("写入磁盘缓存失败: %s", self.disk.root)
+
+    async def clear(self) -> int:
+        self.memory.clear()
+        if self.disk is None:
+            return 0
+        return await asyncio.to_thread(self.disk.clear)
+
+    def stats(self) -> Dict[str, int]:
+        out = {
+            "memory_entries": len(self.memory),
+            "memory_hits": self.memory.hits,
+            "memory_misses": self.memory.misses,
+        }
+        if self.disk is not None:
+            disk = self.disk.stats()
+            out["disk_entries"] = disk["entries"]
+            out["disk_bytes"] = disk["bytes"]
+        return out
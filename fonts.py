@@ -0,0 +1,107 @@
+import os
+import re
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from astrbot.api import logger
+
+from .assets import AssetTable
+from .cache import make_key
+
+FONT_SUFFIXES = (".ttf", ".otf", ".woff", ".woff2")
+
+_FONT_FORMATS = {".ttf": "truetype", ".otf": "opentype", ".woff": "woff", ".woff2": "woff2"}
+
+
+def css_font_families(css: str) -> Set[str]:
+    """从 CSS 的 font-family / --font 声明中提取引号包裹的字体族名。"""
+    families: Set[str] = set()
+    for decl in re.findall(r"(?:font-family|--font)\s*:\s*([^;}]+)", css):
+        families.update(re.findall(r"['\"]([^'\"]+)['\"]", decl))
+    return families
+
+
+class FontIndex:
+    """自定义字体目录的索引，启动时构建一次并预编译为 @font-face 样式表。
+
+    - 字体文件登记到资源表（AssetTable），由路由按需读取，不再以 file:// 引用
+    - 仅在目录树的修改时间变化时重建（最多每 check_interval 秒检查一次）
+    - 指定 used_families 时只为这些字体族生成 @font-face，其余字体不会出现在页面中
+    """
+
+    def __init__(
+        self,
+        dirs: Iterable[str],
+        *,
+        used_families: Optional[Set[str]] = None,
+        check_interval: float = 60,
+    ):
+        self.dirs = [d for d in (str(x).strip() for x in dirs or []) if d]
+        self.used_families = used_families
+        self.check_interval = max(0.0, float(check_interval))
+        self.stylesheet = ""
+        self.families: List[str] = []
+        self.version = ""
+        self._signature: Tuple = ()
+        self._checked_at = 0.0
+
+    def _scan_signature(self) -> Tuple:
+        """目录树中每个子目录的 mtime：增删或重命名字体文件都会改变所在目录的 mtime。"""
+        sig = []
+        for d in self.dirs:
+            if not os.path.isdir(d):
+                sig.append((d, None))
+                continue
+            for root, _subdirs, _files in os.walk(d):
+                try:
+                    sig.append((root, os.stat(root).st_mtime_ns))
+                except OSError:
+                    pass
+        return tuple(sig)
+
+    def build(self, table: AssetTable) -> None:
+        """扫描字体目录并把字体文件登记到 table（会遍历目录树，应在线程中调用）。"""
+        self._signature = self._scan_signature()
+        self._checked_at = time.monotonic()
+        table.clear("/fonts/")
+        faces: List[str] = []
+        families: List[str] = []
+        for d in self.dirs:
+            font_dir = Path(d)
+            if not font_dir.is_dir():
+                logger.warning("自定义字体目录不存在: %s", d)
+                continue
+            for font_file in sorted(font_dir.rglob("*")):
+                suffix = font_file.suffix.lower()
+                if suffix not in FONT_SUFFIXES or not font_file.is_file():
+                    continue
+                family = font_file.stem  # 使用文件名作为字体族名
+                if self.used_families is not None and family not in self.used_families:
+                    continue
+                url = table.register_file(f"/fonts/{make_key(font_file.as_posix())[:16]}{suffix}", font_file)
+                family_css = family.replace("\\", "\\\\").replace("'", "\\'")
+                faces.append(
+                    f"@font-face {{ font-family: '{family_css}'; src: url('{url}') format('{_FONT_FORMATS[suffix]}'); }}"
+                )
+                families.append(family)
+        self.stylesheet = "\n".join(faces)
+        self.families = families
+        self.version = make_key(self.stylesheet, *self._signature)[:16]
+        if self.dirs:
+            logger.info("自定义字体索引已构建：%d 个字体，来自 %d 个目录", len(faces), len(self.dirs))
+
+    def check_due(self) -> bool:
+        """是否到了下一次检查目录变化的时间（不访问文件系统）。"""
+        return bool(self.dirs) and time.monotonic() - self._checked_at >= self.check_interval
+
+    def changed(self) -> bool:
+        """到了检查时间且目录有变化时返回 True，由调用方在新的资源表上重新 build。会遍历目录树，应在线程中调用。"""
+        now = time.monotonic()
+        if not self.dirs or now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        if self._scan_signature() == self._signature:
+            return False
+        logger.info("检测到自定义字体目录变化，重建字体索引")
+        return True
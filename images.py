@@ -0,0 +1,150 @@
+import asyncio
+import base64
+import io
+from pathlib import Path
+from typing import Tuple
+from urllib.parse import unquote, urlparse
+
+import aiohttp
+
+
+async def load_image_bytes(
+    session: aiohttp.ClientSession,
+    src: str,
+    *,
+    timeout: float = 15.0,
+    max_bytes: int = 20 * 1024 * 1024,
+) -> bytes:
+    """按来源类型读取图片原始字节：http(s) URL、base64:// / data: URI、file:// 或本地路径。"""
+    if src.startswith("base64://"):
+        return base64.b64decode(src[len("base64://"):])
+    if src.startswith("data:"):
+        return base64.b64decode(src.split(",", 1)[1])
+    if src.startswith(("http://", "https://")):
+        async with session.get(src, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            resp.raise_for_status()
+            if resp.content_length and resp.content_length > max_bytes:
+                raise ValueError(f"图片过大: {resp.content_length} bytes")
+            data = await resp.content.read(max_bytes + 1)
+            if len(data) > max_bytes:
+                raise ValueError(f"图片过大: 超过 {max_bytes} bytes")
+            return data
+
+    path = Path(unquote(urlparse(src).path)) if src.startswith("file://") else Path(src)
+    size = await asyncio.to_thread(lambda: path.stat().st_size)
+    if size > max_bytes:
+        raise ValueError(f"图片过大: {size} bytes")
+    return await asyncio.to_thread(path.read_bytes)
+
+
+def to_base64_uri(data: bytes) -> str:
+    """转为 AstrBot Provider 可直接识别的 base64:// 形式，避免 Provider 再次下载。"""
+    return "base64://" + base64.b64encode(data).decode("ascii")
+
+
+def preprocess_image(
+    data: bytes,
+    *,
+    max_edge: int = 2048,
+    grayscale: bool = False,
+    crop_margins: bool = True,
+    quality: int = 85,
+) -> Tuple[bytes, int, int]:
+    """OCR 前的图片瘦身：按 EXIF 摆正、裁掉纯色边距、缩放到最长边不超过 max_edge、可选灰度，再重新压缩。
+
+    返回 (新字节, 处理前像素数, 处理后像素数)；结果不比原图小且未缩放时返回原图。
+    依赖 Pillow，未安装时抛出 ImportError。CPU 密集，应在线程中调用。
+    """
+    from PIL import Image, ImageChops, ImageOps  # type: ignore
+
+    with Image.open(io.BytesIO(data)) as src:
+        img = ImageOps.exif_transpose(src)
+        before_pixels = img.width * img.height
+        if img.mode not in ("RGB", "L"):
+            # 透明背景按白底处理，避免转 RGB 后变成黑底
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        if grayscale:
+            img = img.convert("L")
+
+        if crop_margins:
+            gray = img.convert("L")
+            bg = Image.new("L", gray.size, gray.getpixel((0, 0)))
+            # 与左上角底色差异明显的像素才算内容，忽略纸张的轻微噪点
+            bbox = ImageChops.difference(gray, bg).point(lambda p: 255 if p > 32 else 0).getbbox()
+            if bbox:
+                pad = max(8, min(img.size) // 50)
+                left, top, right, bottom = bbox
+                bbox = (max(0, left - pad), max(0, top - pad), min(img.width, right + pad), min(img.height, bottom + pad))
+                if (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) < img.width * img.height * 0.9:
+                    img = img.crop(bbox)
+
+        resized = False
+        if max_edge > 0 and max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            resized = True
+
+        after_pixels = img.width * img.height
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=max(1, min(95, int(quality))), optimize=True)
+        result = out.getvalue()
+
+    if len(result) >= len(data) and not resized and after_pixels == before_pixels:
+        return data, before_pixels, before_pixels
+    return result, before_pixels, after_pixels
+
+
+OUTPUT_FORMATS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+
+def sniff_format(data: bytes) -> str:
+    """按文件头识别 png / jpeg / webp，无法识别时返回空字符串。"""
+    if data.startswith(b"\x89PNG"):
+        return "png"
+    if data.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return ""
+
+
+def encode_output(
+    data: bytes,
+    *,
+    fmt: str = "png",
+    quality: int = 85,
+    quantize: bool = False,
+    max_bytes: int = 0,
+) -> Tuple[bytes, int, int]:
+    """把截图重新编码为目标格式，超出 max_bytes 时按比例逐步缩小，返回 (字节, 宽, 高)。
+
+    quantize 仅对 PNG 生效：结果卡片以白底和少量文字颜色为主，调色板化后体积通常能减半。
+    依赖 Pillow，未安装时抛出 ImportError。CPU 密集，应在线程中调用。
+    """
+    from PIL import Image  # type: ignore
+
+    with Image.open(io.BytesIO(data)) as src:
+        img = src.convert("RGB")
+    quality = max(1, min(95, int(quality)))
+
+    def encode(im: "Image.Image") -> bytes:
+        buf = io.BytesIO()
+        if fmt == "jpeg":
+            im.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+        elif fmt == "webp":
+            im.save(buf, format="WEBP", quality=quality, method=4)
+        else:
+            if quantize:
+                im = im.quantize(colors=128, method=2)  # 2 = FASTOCTREE，RGB 图像上最快
+            im.save(buf, format="PNG", optimize=True)
+        return buf.getvalue()
+
+    out = encode(img)
+    for _ in range(4):
+        if not max_bytes or len(out) <= max_bytes:
+            break
+        factor = max(0.3, min(0.95, (max_bytes / len(out)) ** 0.5 * 0.95))
+        img = img.resize((max(1, int(img.width * factor)), max(1, int(img.height * factor))), Image.LANCZOS)
+        out = encode(img)
+    return out, img.width, img.height
@@ -1,22 +1,56 @@
 import asyncio
+import base64
+import hashlib
 import tempfile
+import time
 from pathlib import Path
-from typing import List, Optional, Any, Awaitable, Callable, cast
+from typing import Deque, Dict, List, Mapping, Optional, Any, Tuple, cast
 import re
+from collections import deque
+from dataclasses import dataclass
+from types import MappingProxyType
 
+import aiohttp
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent, filter
-from astrbot.api.star import Context, Star, register
+from astrbot.api.message_components import Image
+from astrbot.api.star import Context, Star, StarTools, register
 from jinja2 import Template
 
+from .assets import ASSET_ORIGIN, KATEX_CDN, MARKED_CDN, AssetStore, AssetTable
+from .cache import DiskCache, LRUCache, TieredCache, make_key, normalize_text
+from .fonts import FontIndex, css_font_families
+from .images import (
+    OUTPUT_FORMATS,
+    encode_output,
+    load_image_bytes,
+    preprocess_image,
+    sniff_format,
+    to_base64_uri,
+)
+from .metrics import Metrics, Trace, current_trace, record_size, record_stage, stage, tracing
+from .pagination import capture_pages
+from .pipeline import SolveJob, StageTimeout, run_stage, start_background
+from .prerender import KatexPrerenderer
+from .prompts import SOLVER_PROMPT_VERSIONS, SOLVER_PROMPTS, classify_question
+from .providers import ProviderChoice, ProviderRouter, parse_provider_spec
+from .render_pool import BrowserPool
+from .render_service import RenderWorkerPool
+from .resilience import CircuitBreaker, hedged
+from .scheduler import RequestScheduler, SchedulerBusy, SingleFlight
+from .spool import SpoolDir
+from .streaming import SectionSplitter
+from .textimage import find_cjk_font, is_simple_markdown, render_text_image, to_plain_text
+
 
 TMPL = """
 <!doctype html>
-<html>
+<html{% if PRERENDERED %} data-prerendered="1"{% endif %}>
     <head>
         <meta charset="utf-8" />
         <meta name="viewport" content="width=device-width, initial-scale=1" />
         {{ KATEX_CSS | safe }}
+        {% if FONT_CSS %}<style>{{ FONT_CSS | safe }}</style>{% endif %}
         <style>
             :root { --font: 'Noto Sans', 'Noto Serif CJK SC',-apple-system,BlinkMacSystemFont,'Segoe UI',Roboto,'Helvetica Neue',Arial; }
             body { font-family: var(--font); background: #fff; color: #222; padding: 32px; font-size: 16px; line-height: 1.7;}
@@ -48,41 +82,54 @@ TMPL = """
             .katex .mtable {border-collapse: separate !important;border-spacing: 0 0.5em !important;}
 
         </style>
+        {% if not PRERENDERED %}
         {{ KATEX_JS | safe }}
         {{ AUTORENDER_JS | safe }}
         {{ MARKED_JS | safe }}
         <script>
             document.addEventListener('DOMContentLoaded', function() {
-                // 从 script[type="text/plain"] 读取原始 Markdown
-                // 这样可以防止浏览器将 <iostream> 当作 HTML 标签处理
-                const sourceEl = document.getElementById('markdown-source');
-                const contentEl = document.getElementById('markdown-content');
-                
-                if (sourceEl && contentEl && window.marked) {
-                    // 读取原始 Markdown 文本
-                    const mdText = sourceEl.textContent;
+                try {
+                    // 从 script[type="text/plain"] 读取原始 Markdown
+                    // 这样可以防止浏览器将 <iostream> 当作 HTML 标签处理
+                    const sourceEl = document.getElementById('markdown-source');
+                    const contentEl = document.getElementById('markdown-content');
                     
-                    // marked.js 会自动转义代码块中的 HTML
-                    const htmlResult = marked.parse(mdText);
+                    if (sourceEl && contentEl && window.marked) {
+                        // 读取原始 Markdown 文本
+                        const mdText = sourceEl.textContent;
+                        
+                        // marked.js 会自动转义代码块中的 HTML
+                        const htmlResult = marked.parse(mdText);
+                        
+                        contentEl.innerHTML = htmlResult;
+                    }
                     
-                    contentEl.innerHTML = htmlResult;
-                }
-                
-                // 用 KaTeX 渲染数学公式
-                if (window.renderMathInElement) {
-                    renderMathInElement(document.body, {
-                        delimiters: [
-                            {left: '$$', right: '$$', display: true},
-                            {left: '$', right: '$', display: false}
-                        ],
-                        throwOnError: false
-                    });
+                    // 用 KaTeX 渲染数学公式
+                    if (window.renderMathInElement) {
+                        renderMathInElement(document.body, {
+                            delimiters: [
+                                {left: '$$', right: '$$', display: true},
+                                {left: '$', right: '$', display: false}
+                            ],
+                            throwOnError: false
+                        });
+                    }
+                } finally {
+                    // 渲染完成标记：Markdown 与公式处理完毕且字体就绪后置位，供截图端等待
+                    const markDone = function() { window.__teacherRenderDone = true; };
+                    if (document.fonts && document.fonts.ready) {
+                        document.fonts.ready.then(markDone, markDone);
+                    } else {
+                        markDone();
+                    }
                 }
             });
         </script>
+        {% endif %}
     </head>
     <body>
         <div class="card">
+            {% if question %}
             <div class="header">
                 <h1>📚 题目解析</h1>
                 <div class="small">由 AstrBot 插件 <strong>astrbot_teacher</strong> 生成</div>
@@ -90,27 +137,574 @@ TMPL = """
 
             <div class="question-box">
                 <h2>📝 题目</h2>
+                {% if PRERENDERED %}
+                <div class="question-text">{{ QUESTION_HTML | safe }}</div>
+                {% else %}
                 <div class="question-text">{{ question }}</div>
+                {% endif %}
             </div>
+            {% endif %}
 
+            {% if PRERENDERED %}
+            <!-- 预渲染模式：Markdown 与公式已转换为静态 HTML，页面无需执行脚本 -->
+            <div class="content" id="markdown-content">{{ CONTENT_HTML | safe }}</div>
+            {% else %}
             <!-- 使用 script type="text/plain" 保存原始 Markdown，防止被浏览器解析 -->
             <script type="text/plain" id="markdown-source">{{ content }}</script>
             <div class="content" id="markdown-content"></div>
+            {% endif %}
         </div>
     </body>
     </html>
 """
 
 
+OCR_PROMPT = '''你是一个视觉识别模型，任务是从图像中提取所有有意义的文字信息，包括题目文字、符号、公式和标注。
+
+要求：
+1. 尽可能完整、准确地转录所有文字内容。
+2. 对数学公式使用 LaTeX 语法输出，保持原有结构（不要简化或改写）。
+3. 保留题目排版顺序（上到下、左到右），适当添加换行。
+4. 如果有表格、图示标签或编号，保留其文本信息。
+5. 不要解释内容，不要做任何推理。
+6. 如果遇到模糊区域，请以 `[可能为: ...]` 形式标注。
+
+输出格式：
+[OCR_TEXT]
+(在这里输出提取到的文字与公式)
+注意：
+- **不得使用\(\)和\[\]包裹任何东西，请用别的方式替代**
+- 例如："这是 $ r $ 的半径"
+- 仅限简短表达，复杂公式应放入 `$$...$$`
+- 正确示例：
+  - "函数的值域为 $ g(x) \\in [a,b] $"
+  - "设 $ a = 1 $，$ b = 2 $"
+  - "在区间 $ x \\in (0, 1) $ 上"
+- **错误示例**（不会渲染）：
+  - "(g(x) \\in [a,b])" ← 缺少 $ 符号
+  - "$g(x) \\in [a,b]$" ← 紧贴文字，缺少空格
+  - "\( R \)"← 使用\( \) 语法导致最后渲染不成功
+
+积分、求和、分式、矩阵、对齐推导等复杂表达式使用块级公式：
+
+$$
+... 
+$$
+
+- 独占一行，上下各留空行
+- 块内可使用 `aligned`、`cases` 等环境进行多行排版
+- 禁止在块级公式中嵌套 `$...$`
+
+
+### 其他说明
+**不要输出额外说明或前后缀。**
+**输出中的 LaTeX 代码不做任何字符清理或转义，保持原样。**
+
+'''
+OCR_PROMPT_VERSION = hashlib.sha256(OCR_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+# 各阶段单次模型调用的默认超时（秒），可被 {stage}_timeout_seconds 与备用项的 @秒数 覆盖
+_STAGE_TIMEOUTS = {"ocr": 60.0, "solver": 180.0}
+
+# 单次渲染最多切分的页数，超出的内容并入最后一页
+_MAX_RENDER_PAGES = 20
+
+# /g_stats 中各阶段的展示顺序（未列出的排在最后）
+_STAGE_ORDER = (
+    "select", "fetch", "preprocess", "ocr", "solver_wait", "first_chunk", "solver",
+    "render_wait", "text_render", "prerender", "template", "acquire", "goto", "wait_ready", "layout", "screenshot",
+    "remote_render", "render", "encode", "send", "total",
+)
+
+# Prometheus 导出的指标名前缀与各指标族的标签名
+_METRICS_PREFIX = "astrbot_teacher"
+_METRICS_LABELS = {"stage_seconds": "stage", "size": "kind", "requests": "outcome", "render_backend": "backend", "solver_prompt": "prompt", "cache_hits": "cache"}
+
+# 各处理阶段的整体时间上限（秒），可被 {stage}_stage_timeout_seconds 覆盖
+_PIPELINE_TIMEOUTS = {"fetch": 20.0, "ocr": 120.0, "solver": 300.0, "render": 90.0}
+
+# 流式解题出错时，已在渲染的段落最多再等待的时间（秒），之后未完成的段落被取消
+_STREAM_FLUSH_SECONDS = 5.0
+
+
+# 影响渲染包内容的配置项；任一变化时重建渲染包
+_BUNDLE_CONFIG_KEYS = (
+    "offline_katex_assets",
+    "offline_marked_assets",
+    "katex_assets_dir",
+    "marked_assets_path",
+    "custom_font_dirs",
+    "custom_font_only_used",
+    "simple_render_mode",
+    "simple_render_font",
+)
+
+
+@dataclass(frozen=True)
+class RenderBundle:
+    """启动时（及配置变化时）构建一次的不可变渲染包。
+
+    - template: 已编译的 Jinja2 模板，本地渲染每次只需一次 render 调用
+    - source: 模板源码，供远端 html_render 使用
+    - local_assets / remote_assets: 本地与远端渲染各自的资源片段
+    - asset_version: 渲染缓存键使用的资源指纹
+    - text_font: 轻量渲染使用的中文字体文件，未启用或未找到时为空
+    - missing: 资源检查发现的缺失项
+    """
+
+    source: str
+    template: Template
+    local_assets: Mapping[str, str]
+    remote_assets: Mapping[str, str]
+    asset_version: str
+    config_fingerprint: str
+    fonts_version: str
+    text_font: str
+    missing: Tuple[str, ...]
+
+    def render_local(self, **data: Any) -> str:
+        return self.template.render(**data, **self.local_assets)
+
+
 @register("astrbot_teacher", "lipsc", "智能题目解析助手，支持文字/图片输入并输出美观解析图片（完全离线）", "0.2.5")
 class TeacherPlugin(Star):
     def __init__(self, context: Context, config: Optional[dict] = None):
         super().__init__(context)
         self.config = config or {}
+        self._browser_pool: Optional[BrowserPool] = None
+        self._render_workers: Optional[RenderWorkerPool] = None
+        self._solver_cache: Optional[TieredCache] = None
+        self._ocr_cache: Optional[TieredCache] = None
+        self._image_cache: Optional[DiskCache] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._spool: Optional[SpoolDir] = None
+        self._assets: Optional[AssetStore] = None
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self._prerenderer: Optional[KatexPrerenderer] = None
+        self._fonts: Optional[FontIndex] = None
+        self._render_bundle: Optional[RenderBundle] = None
+        self._bundle_task: Optional["asyncio.Task[RenderBundle]"] = None
+        self._text_font: Optional[Tuple[Tuple[str, Tuple[str, ...]], str]] = None
+        cfg = self.config
+        self._scheduler = RequestScheduler({})
+        self._flights = SingleFlight()
+        self._metrics = Metrics()
+        self._pillow_warned = False
+        breaker_opts = {
+            "failure_threshold": int(cfg.get("render_breaker_failures", 3) or 1),
+            "cooldown_seconds": float(cfg.get("render_breaker_cooldown_seconds", 60) or 0),
+            "slow_seconds": float(cfg.get("render_breaker_slow_ms", 20000) or 0) / 1000,
+        }
+        self._render_breakers = {name: CircuitBreaker(name, **breaker_opts) for name in ("local", "remote")}
+        self._routers = {stage: ProviderRouter(stage) for stage in ("ocr", "solver")}
+        self._apply_limits()
+
+    def _apply_limits(self) -> None:
+        """按当前配置更新并发与积压上限、LLM 对冲延迟；每个请求开始时调用，配置的修改无需重载插件即可生效。"""
+        cfg = self.config or {}
+        self._scheduler.configure(
+            {
+                "ocr": int(cfg.get("max_concurrent_ocr", 2) or 1),
+                "solver": int(cfg.get("max_concurrent_solver", 4) or 1),
+                "render": int(cfg.get("max_concurrent_render", 2) or 1),
+            },
+            max_pending=int(cfg.get("max_pending_requests", 20) or 0),
+            max_pending_per_user=int(cfg.get("max_pending_per_user", 2) or 0),
+        )
+        llm_hedge_ms = int(cfg.get("llm_hedge_delay_ms", 0) or 0)
+        for router in self._routers.values():
+            router.hedge_delay = llm_hedge_ms / 1000 if llm_hedge_ms > 0 else None
 
     async def initialize(self):
+        cfg = self.config or {}
+        assets = self._get_assets()
+        self._install_bundle(*await asyncio.to_thread(self._build_bundle))
+        # 本地缺失的资源在后台先从 CDN 取一次，避免首个渲染请求等待网络
+        self._prefetch_task = asyncio.create_task(assets.prefetch([
+            "/katex/katex.min.css", "/katex/katex.min.js", "/katex/auto-render.min.js", "/marked/marked.min.js",
+        ]))
+        self._browser_pool = BrowserPool(
+            pages_per_scale=int(cfg.get("browser_pool_size", 2) or 2),
+            max_page_uses=int(cfg.get("browser_page_max_uses", 50) or 50),
+            max_page_heap_mb=int(cfg.get("browser_page_max_heap_mb", 256) or 0),
+            on_new_context=lambda ctx: ctx.route(f"{ASSET_ORIGIN}/**", assets.handle),
+        )
+        worker_count = int(cfg.get("render_workers", 0) or 0)
+        if worker_count > 0:
+            self._render_workers = RenderWorkerPool(
+                assets,
+                {
+                    "asset_origin": ASSET_ORIGIN,
+                    "pages_per_scale": int(cfg.get("browser_pool_size", 2) or 2),
+                    "max_page_uses": int(cfg.get("browser_page_max_uses", 50) or 50),
+                    "max_page_heap_mb": int(cfg.get("browser_page_max_heap_mb", 256) or 0),
+                    "prewarm_scales": [int(cfg.get("local_device_scale", 2) or 2)],
+                },
+                size=worker_count,
+                job_timeout=float(cfg.get("render_worker_job_timeout_seconds", 60) or 60),
+                health_interval=float(cfg.get("render_worker_health_interval_seconds", 30) or 30),
+            )
+            if bool(cfg.get("prerender_mode", False)):
+                logger.warning("已启用进程外渲染，预渲染模式需要在插件进程内运行 Chromium，已忽略")
+        elif bool(cfg.get("prerender_mode", False)):
+            self._prerenderer = KatexPrerenderer(
+                self._browser_pool,
+                assets,
+                cache_items=int(cfg.get("formula_cache_items", 4096) or 0),
+            )
+        # 优先本地渲染时提前启动浏览器并预热页面；否则在首次本地渲染时再启动
+        if bool(cfg.get("prefer_local_render", False)):
+            local_scale = int(cfg.get("local_device_scale", 2) or 2)
+            try:
+                if self._render_workers is not None:
+                    await self._render_workers.start()
+                else:
+                    await self._browser_pool.start(prewarm_scales=[local_scale])
+            except Exception:
+                logger.exception("常驻 Chromium 启动失败，将在首次渲染时重试")
+        self._init_caches()
+        spool = self._get_spool()
+        # 顺带清理旧版本直接写在系统临时目录中的 astrbot_teacher_*.html/png
+        legacy = Path(tempfile.gettempdir()).glob("astrbot_teacher_*.*")
+        await asyncio.to_thread(spool.gc, legacy)
+        spool.start()
         logger.info("astrbot_teacher 初始化完成（Markdown 模式）")
 
+    def _data_dir(self) -> Path:
+        """插件数据目录（缓存等持久化文件存放处）。"""
+        try:
+            data_dir = Path(StarTools.get_data_dir("astrbot_teacher"))
+        except Exception:
+            data_dir = Path(tempfile.gettempdir()) / "astrbot_teacher"
+        data_dir.mkdir(parents=True, exist_ok=True)
+        return data_dir
+
+    def _get_assets(self) -> AssetStore:
+        if self._assets is None:
+            self._assets = AssetStore(self._data_dir() / "cache" / "cdn", self._http_session)
+        return self._assets
+
+    def _get_spool(self) -> SpoolDir:
+        if self._spool is None:
+            cfg = self.config or {}
+            self._spool = SpoolDir(
+                self._data_dir() / "spool",
+                max_age_seconds=float(cfg.get("spool_max_age_minutes", 60) or 0) * 60,
+                max_bytes=int(cfg.get("spool_max_mb", 200) or 0) * 1024 * 1024,
+            )
+        return self._spool
+
+    def _init_caches(self) -> None:
+        cfg = self.config or {}
+        if bool(cfg.get("solver_cache_enabled", True)):
+            ttl_hours = float(cfg.get("solver_cache_ttl_hours", 168) or 0)
+            self._solver_cache = TieredCache(
+                LRUCache(int(cfg.get("solver_cache_memory_items", 256) or 0), ttl_seconds=ttl_hours * 3600),
+                DiskCache(
+                    self._data_dir() / "cache" / "solver",
+                    suffix=".json",
+                    ttl_seconds=ttl_hours * 3600,
+                    max_entries=int(cfg.get("solver_cache_max_entries", 5000) or 0),
+                    max_bytes=int(cfg.get("solver_cache_max_mb", 100) or 0) * 1024 * 1024,
+                ),
+            )
+        if bool(cfg.get("ocr_cache_enabled", True)):
+            max_entries = int(cfg.get("ocr_cache_max_entries", 2000) or 0)
+            max_bytes = int(cfg.get("ocr_cache_max_mb", 20) or 0) * 1024 * 1024
+            self._ocr_cache = TieredCache(
+                LRUCache(min(max_entries or 256, 256), max_bytes=max_bytes),
+                DiskCache(
+                    self._data_dir() / "cache" / "ocr",
+                    suffix=".json",
+                    max_entries=max_entries,
+                    max_bytes=max_bytes,
+                ),
+            )
+
+        if bool(cfg.get("image_cache_enabled", True)):
+            fmt = self._output_options()[0]
+            self._image_cache = DiskCache(
+                # 每种输出格式单独一个目录，切换格式不会混用不同后缀的缓存文件
+                self._data_dir() / "cache" / ("images" if fmt == "png" else f"images-{fmt}"),
+                suffix=OUTPUT_FORMATS[fmt],
+                max_entries=int(cfg.get("image_cache_max_entries", 0) or 0),
+                max_bytes=int(cfg.get("image_cache_max_mb", 200) or 0) * 1024 * 1024,
+            )
+
+    def _output_options(self) -> Tuple[str, int, bool, int]:
+        """结果图片的 (格式, 质量, 是否调色板量化, 字节预算)。"""
+        cfg = self.config or {}
+        fmt = str(cfg.get("output_format", "png") or "png").lower()
+        fmt = "jpeg" if fmt == "jpg" else fmt
+        if fmt not in OUTPUT_FORMATS:
+            fmt = "png"
+        return (
+            fmt,
+            int(cfg.get("output_quality", 85) or 85),
+            bool(cfg.get("output_quantize", False)),
+            int(cfg.get("output_max_kb", 0) or 0) * 1024,
+        )
+
+    async def _finalize_output(self, out: str) -> str:
+        """按配置转换结果图片的格式并控制在字节预算内，记录最终格式与大小；远端返回的 URL 原样返回。"""
+        path = Path(out[len("file://"):] if out.startswith("file://") else out)
+        try:
+            if not path.is_file():
+                return out
+            data = await asyncio.to_thread(path.read_bytes)
+        except OSError:
+            return out
+        fmt, quality, quantize, max_bytes = self._output_options()
+        actual = sniff_format(data)
+        if actual == fmt and not (fmt == "png" and quantize) and (not max_bytes or len(data) <= max_bytes):
+            logger.info("渲染输出：%s，%.1f KB", actual, len(data) / 1024)
+            record_size("image_bytes", len(data))
+            return out
+        try:
+            encoded, width, height = await asyncio.to_thread(
+                encode_output, data, fmt=fmt, quality=quality, quantize=quantize, max_bytes=max_bytes
+            )
+        except ImportError:
+            if not self._pillow_warned:
+                self._pillow_warned = True
+                logger.warning("未安装 Pillow，无法转换输出格式或压缩结果图片（pip install Pillow 以启用）")
+            logger.info("渲染输出：%s，%.1f KB", actual or "未知格式", len(data) / 1024)
+            record_size("image_bytes", len(data))
+            return out
+        except Exception:
+            logger.exception("结果图片转码失败，发送原图")
+            record_size("image_bytes", len(data))
+            return out
+        new_path = self._get_spool().new_path(OUTPUT_FORMATS[fmt])
+        await asyncio.to_thread(new_path.write_bytes, encoded)
+        record_size("image_bytes", len(encoded))
+        logger.info(
+            "渲染输出：%s，%dx%d，%.1f KB（原 %s %.1f KB）",
+            fmt,
+            width,
+            height,
+            len(encoded) / 1024,
+            actual or "未知格式",
+            len(data) / 1024,
+        )
+        return str(new_path)
+
+    def _image_cache_lookup(self, key: str) -> Optional[List[str]]:
+        """查找渲染缓存（同步，需在线程中调用）。
+
+        单张结果以 key 存放；分为 n 页的结果第 i 页存放在 make_key(key, i, n)，必须全部命中才算命中。
+        """
+        cache = cast(DiskCache, self._image_cache)
+        path = cache.lookup(key)
+        if path is not None:
+            return [str(path)]
+        for n in range(2, _MAX_RENDER_PAGES + 1):
+            first = cache.lookup(make_key(key, 0, n))
+            if first is None:
+                continue
+            rest = [cache.lookup(make_key(key, i, n)) for i in range(1, n)]
+            return [str(p) for p in [first, *rest]] if all(p is not None for p in rest) else None
+        return None
+
+    async def _image_cache_store_pages(self, key: str, outs: List[str]) -> None:
+        if len(outs) == 1:
+            await self._image_cache_store(key, outs[0])
+            return
+        for i, out in enumerate(outs):
+            await self._image_cache_store(make_key(key, i, len(outs)), out)
+
+    async def _image_cache_store(self, key: str, src: str) -> None:
+        """将渲染产物复制进图片缓存目录；远端返回 URL（非本地文件）时跳过。"""
+        if self._image_cache is None:
+            return
+        src_path = Path(src[len("file://"):] if src.startswith("file://") else src)
+        try:
+            if src_path.is_file():
+                await asyncio.to_thread(lambda: self._image_cache.set_bytes(key, src_path.read_bytes()))
+        except Exception:
+            logger.exception("写入渲染缓存失败")
+
+    def _http_session(self) -> aiohttp.ClientSession:
+        """插件共享的 HTTP 连接池（延迟创建，需在事件循环内调用）。"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+        return self._http
+
+    async def _fetch_images(self, sources: List[str]) -> List[Optional[bytes]]:
+        """并发取回图片字节，失败的位置返回 None。"""
+        session = self._http_session()
+
+        async def one(src: str) -> Optional[bytes]:
+            try:
+                return await load_image_bytes(session, src)
+            except Exception as e:
+                logger.warning("获取图片失败，将直接传递原始地址: %s (%s)", src[:120], e)
+                return None
+
+        return list(await asyncio.gather(*(one(s) for s in sources)))
+
+    def _preprocess_options(self) -> Optional[dict]:
+        """OCR 前图片预处理参数；未启用时返回 None。"""
+        cfg = self.config or {}
+        if not bool(cfg.get("image_preprocess_enabled", True)):
+            return None
+        return {
+            "max_edge": int(cfg.get("image_max_edge", 2048) or 0),
+            "grayscale": bool(cfg.get("image_grayscale", False)),
+            "crop_margins": bool(cfg.get("image_crop_margins", True)),
+            "quality": int(cfg.get("image_jpeg_quality", 85) or 85),
+        }
+
+    async def _preprocess_images(self, images: List[Optional[bytes]]) -> List[Optional[bytes]]:
+        """在线程中并发预处理图片以减少上传字节与视觉 token；单张失败时保留原图。"""
+        opts = self._preprocess_options()
+        if opts is None or not any(images):
+            return images
+
+        async def one(data: Optional[bytes]) -> Tuple[Optional[bytes], int, int]:
+            if not data:
+                return data, 0, 0
+            try:
+                return await asyncio.to_thread(preprocess_image, data, **opts)
+            except ImportError:
+                raise
+            except Exception as e:
+                logger.warning("图片预处理失败，使用原图: %s", e)
+                return data, 0, 0
+
+        try:
+            results = await asyncio.gather(*(one(b) for b in images))
+        except ImportError:
+            if not self._pillow_warned:
+                self._pillow_warned = True
+                logger.warning("未安装 Pillow，跳过 OCR 前的图片预处理（pip install Pillow 以启用）")
+            return images
+
+        out = [r[0] for r in results]
+        before = sum(len(b) for b in images if b)
+        after = sum(len(b) for b in out if b)
+        px_before = sum(r[1] for r in results)
+        px_after = sum(r[2] for r in results)
+        logger.info(
+            "图片预处理：%d 张，%.1f KB → %.1f KB（节省 %.0f%%），%.2f MP → %.2f MP",
+            sum(1 for b in images if b),
+            before / 1024,
+            after / 1024,
+            (1 - after / before) * 100 if before else 0,
+            px_before / 1e6,
+            px_after / 1e6,
+        )
+        return out
+
+    def _ocr_cache_key(self, choice: ProviderChoice, images: List[bytes]) -> str:
+        """OCR 缓存键：按给出识别结果的 Provider/模型区分。"""
+        return make_key(
+            "ocr",
+            *self._provider_identity(choice.provider, choice.model),
+            OCR_PROMPT_VERSION,
+            # 预处理参数变化会影响 OCR 输入，一并计入
+            repr(sorted((self._preprocess_options() or {}).items())),
+            *(hashlib.sha256(b).hexdigest() for b in images),
+        )
+
+    async def _prepare_ocr_images(self, images: List[Optional[bytes]]) -> List[Optional[bytes]]:
+        """预处理待 OCR 的图片并记录上传字节数；每张图片只需处理一次，重试时复用结果。"""
+        with stage("preprocess"):
+            prepared = await self._preprocess_images(images)
+        record_size("ocr_upload_bytes", sum(len(b) for b in prepared if b))
+        return prepared
+
+    async def _ocr_call(
+        self, chain: List[ProviderChoice], urls: List[str], prepared: List[Optional[bytes]], group: str, user: str
+    ) -> Tuple[str, ProviderChoice]:
+        """以已预处理的图片发起一次 OCR 请求（可包含多张图片），返回 (识别文本, 实际使用的候选)；失败时抛出异常。"""
+        # 已取回的图片直接以 base64 传给 Provider，避免二次下载；取回失败的保留原始地址
+        ocr_inputs = [to_base64_uri(b) if b else u for u, b in zip(urls, prepared)]
+        async with self._scheduler.stage("ocr").slot(group, user):
+            ocr_resp, used = await self._routers["ocr"].chat(
+                chain,
+                prompt=OCR_PROMPT,
+                context=[],
+                system_prompt="OCR: 将图片中的题目转为可编辑文本。",
+                image_urls=ocr_inputs,
+            )
+        return (ocr_resp.completion_text.strip() if ocr_resp else ""), used
+
+    async def _ocr(
+        self, chain: List[ProviderChoice], urls: List[str], images: List[Optional[bytes]], group: str, user: str
+    ) -> str:
+        """识别图片中的题目文本；OCR 失败时返回空字符串。"""
+        if len(urls) > 1 and bool((self.config or {}).get("ocr_per_image", False)):
+            return await self._ocr_per_image(chain, urls, images, group, user)
+
+        cacheable = self._ocr_cache is not None and all(images)
+        if cacheable:
+            ocr_cache_key = self._ocr_cache_key(chain[0], cast(List[bytes], images))
+            ocr_text = await self._ocr_cache.get(ocr_cache_key) or ""
+            if ocr_text:
+                logger.info("OCR 缓存命中: %s", ocr_cache_key[:12])
+                self._metrics.count("cache_hits", "ocr")
+                return ocr_text
+        try:
+            ocr_text, used = await self._ocr_call(chain, urls, await self._prepare_ocr_images(images), group, user)
+        except Exception:
+            logger.exception("OCR 请求失败")
+            return ""
+        if ocr_text and cacheable:
+            await self._ocr_cache.set(self._ocr_cache_key(used, cast(List[bytes], images)), ocr_text)
+        return ocr_text
+
+    async def _ocr_per_image(
+        self, chain: List[ProviderChoice], urls: List[str], images: List[Optional[bytes]], group: str, user: str
+    ) -> str:
+        """逐张并发 OCR（单条消息内并发受 ocr_image_concurrency 限制），按消息顺序合并；失败的图片被跳过。"""
+        cfg = self.config or {}
+        sem = asyncio.Semaphore(max(1, int(cfg.get("ocr_image_concurrency", 3) or 1)))
+        retries = max(0, int(cfg.get("ocr_image_retries", 1) or 0))
+        images = images or [None] * len(urls)
+
+        async def lookup(data: Optional[bytes]) -> str:
+            if self._ocr_cache is None or not data:
+                return ""
+            return await self._ocr_cache.get(self._ocr_cache_key(chain[0], [data])) or ""
+
+        cached = await asyncio.gather(*(lookup(b) for b in images))
+        # 未命中缓存的图片一次性并发预处理，预处理阶段按整体耗时记录一次；重试时复用结果
+        prepared = await self._prepare_ocr_images([None if hit else b for b, hit in zip(images, cached)])
+
+        async def one(index: int, url: str, data: Optional[bytes], ready: Optional[bytes], hit: str) -> str:
+            if hit:
+                self._metrics.count("cache_hits", "ocr")
+                return hit
+            for attempt in range(retries + 1):
+                try:
+                    async with sem:
+                        text, used = await self._ocr_call(chain, [url], [ready], group, user)
+                except Exception as e:
+                    logger.warning("第 %d 张图片 OCR 失败（第 %d 次尝试）: %s", index + 1, attempt + 1, e)
+                    continue
+                if text:
+                    if self._ocr_cache is not None and data:
+                        await self._ocr_cache.set(self._ocr_cache_key(used, [data]), text)
+                    return text
+            return ""
+
+        texts = await asyncio.gather(
+            *(one(i, u, b, r, h) for i, (u, b, r, h) in enumerate(zip(urls, images, prepared, cached)))
+        )
+        failed = sum(1 for t in texts if not t)
+        if failed:
+            logger.warning("%d/%d 张图片 OCR 失败，保留其余图片的识别结果", failed, len(texts))
+        return "\n\n".join(t for t in texts if t)
+
+    def _provider_identity(self, provider: object, model: Optional[str]) -> tuple[str, str]:
+        """返回 (provider_id, model)，用于缓存键与日志。"""
+        prov_info = getattr(provider, "provider_config", {}) or {}
+        provider_id = prov_info.get("id") or type(provider).__name__
+        model_name = model or (prov_info.get("model_config", {}) or {}).get("model") or ""
+        return str(provider_id), str(model_name)
+
     def _pick_llm_provider(self, preferred_id: str, event: AstrMessageEvent):
         """根据优先 ID 或当前会话选择可用的 LLM Provider（具备 text_chat 方法）。"""
         prov = None
@@ -128,24 +722,47 @@ class TeacherPlugin(Star):
             logger.exception("选择 Provider 失败")
             return None
 
-    async def _text_chat(self, provider: object, **kwargs) -> Any:
-        """以更安全的方式调用 provider.text_chat，避免类型检查器误报。"""
-        func = getattr(provider, "text_chat", None)
-        if not callable(func):
-            raise RuntimeError("所选 Provider 不支持 text_chat 方法")
-        func_typed = cast(Callable[..., Awaitable[Any]], func)
-        return await func_typed(**kwargs)
-
-    def _build_template(self) -> tuple[str, str, str, str, str]:
-        """根据配置决定使用本地 KaTeX 和 marked.js 资源或 CDN。
-
-        返回:
-        - tpl: 模板字符串
-        - katex_css_tag: 最终 CSS 片段
-        - katex_js_tag: 最终 KaTeX JS 片段
-        - autorender_js_tag: 最终 KaTeX auto-render JS 片段
-        - marked_js_tag: 最终 marked.js 片段
+    def _provider_chain(self, stage: str, event: AstrMessageEvent) -> List[ProviderChoice]:
+        """组装 stage（ocr / solver）的 Provider 候选链。
+
+        首项为 {stage}_provider_id（未配置时为当前会话 Provider）与 {stage}_model，
+        其后依次为 {stage}_fallback_providers 中的备用项；不存在或不支持 text_chat 的项被跳过。
+        """
+        cfg = self.config or {}
+        default_timeout = float(cfg.get(f"{stage}_timeout_seconds", _STAGE_TIMEOUTS[stage]) or _STAGE_TIMEOUTS[stage])
+        chain: List[ProviderChoice] = []
+
+        def add(prov: Any, model: Optional[str], timeout: Optional[float]) -> None:
+            provider_id, _model = self._provider_identity(prov, None)
+            choice = ProviderChoice(prov, provider_id, model, timeout or default_timeout)
+            if all(c.name != choice.name for c in chain):
+                chain.append(choice)
+
+        primary = self._pick_llm_provider(cfg.get(f"{stage}_provider_id") or "", event)
+        if primary:
+            add(primary, cfg.get(f"{stage}_model") or None, None)
+        for entry in cfg.get(f"{stage}_fallback_providers") or []:
+            provider_id, model, timeout = parse_provider_spec(entry)
+            if not provider_id:
+                continue
+            try:
+                prov = self.context.get_provider_by_id(provider_id=provider_id)
+            except Exception:
+                prov = None
+            if not prov or not hasattr(prov, "text_chat"):
+                logger.warning("备用 Provider 不存在或不支持 text_chat，已跳过: %s", provider_id)
+                continue
+            add(prov, model, timeout)
+        return chain
+
+    def _load_assets(self, assets: AssetTable) -> List[str]:
+        """按配置将本地 KaTeX 与 marked.js 资源读入资源表，返回缺失项列表。
+
+        缺失的资源渲染时经 CDN 下载一次后缓存。
         """
+        assets.clear("/katex")
+        assets.clear("/marked")
+        missing: List[str] = []
         use_offline_katex = bool((self.config or {}).get("offline_katex_assets", True))
         use_offline_marked = bool((self.config or {}).get("offline_marked_assets", True))
         assets_dir_cfg = (self.config or {}).get("katex_assets_dir", "assets/katex")
@@ -156,16 +773,6 @@ class TeacherPlugin(Star):
             assets_dir = plugin_dir / assets_dir
 
         # KaTeX 资源
-        katex_css_tag = (
-            '<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.css" crossorigin="anonymous">'
-        )
-        katex_js_tag = (
-            '<script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.js" crossorigin="anonymous"></script>'
-        )
-        autorender_js_tag = (
-            '<script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/contrib/auto-render.min.js" crossorigin="anonymous"></script>'
-        )
-
         if use_offline_katex:
             css_path = (assets_dir / "katex.min.css").resolve()
             js_path = (assets_dir / "katex.min.js").resolve()
@@ -173,95 +780,234 @@ class TeacherPlugin(Star):
             fonts_dir = assets_dir / "fonts"
 
             if css_path.exists() and js_path.exists() and auto_path.exists():
-                if not fonts_dir.exists():
-                    logger.warning("离线 KaTeX 字体目录缺失，将退回系统字体，显示效果可能有差异。缺少: %s", fonts_dir)
-                katex_css_tag = f"<link rel=\"stylesheet\" href=\"file://{css_path.as_posix()}\">"
-                katex_js_tag = f"<script defer src=\"file://{js_path.as_posix()}\"></script>"
-                autorender_js_tag = f"<script defer src=\"file://{auto_path.as_posix()}\"></script>"
+                assets.load_file("/katex/katex.min.css", css_path)
+                assets.load_file("/katex/katex.min.js", js_path)
+                assets.load_file("/katex/auto-render.min.js", auto_path)
+                if not assets.load_dir("/katex/fonts", fonts_dir):
+                    missing.append(f"KaTeX 字体目录（将从 CDN 获取）: {fonts_dir}")
             else:
-                logger.warning("离线 KaTeX 资源未找到或不完整，回退使用 CDN。路径: %s", assets_dir)
+                missing.append(f"KaTeX CSS/JS（将从 CDN 获取）: {assets_dir}")
 
         # marked.js 资源
-        marked_js_tag = '<script src="https://cdn.jsdelivr.net/npm/marked@11.1.0/marked.min.js"></script>'
-        
         if use_offline_marked:
             marked_path = Path(marked_path_cfg)
             if not marked_path.is_absolute():
                 marked_path = plugin_dir / marked_path
             marked_path = marked_path.resolve()
             
-            if marked_path.exists():
-                marked_js_tag = f"<script src=\"file://{marked_path.as_posix()}\"></script>"
-                logger.info("使用本地 marked.js: %s", marked_path)
+            if not assets.load_file("/marked/marked.min.js", marked_path):
+                missing.append(f"marked.js（将从 CDN 获取）: {marked_path}")
+        return missing
+
+    def _bundle_fingerprint(self) -> str:
+        cfg = self.config or {}
+        return make_key(*(repr(cfg.get(k)) for k in _BUNDLE_CONFIG_KEYS))
+
+    def _build_bundle(self, *, reload: bool = True) -> Tuple[RenderBundle, AssetTable, Optional[FontIndex]]:
+        """构建渲染包。reload=True 时重新读取资源与字体目录，并输出资源检查报告；否则只重建字体索引。
+
+        资源写入当前资源表的副本，不改动渲染中正在使用的资源；返回 (渲染包, 资源表, 字体索引)，
+        由 _install_bundle 在事件循环中一并换上。会读取文件与遍历目录，需在线程中调用。
+        """
+        cfg = self.config or {}
+        assets = self._get_assets()
+        table = assets.draft()
+        fonts = self._fonts
+        missing = self._render_bundle.missing if (self._render_bundle and not reload) else ()
+        text_font = self._render_bundle.text_font if (self._render_bundle and not reload) else ""
+        if reload:
+            missing = tuple(self._load_assets(table))
+            font_dirs = [d for d in (cfg.get("custom_font_dirs") or []) if str(d).strip()]
+            fonts = None
+            if font_dirs:
+                fonts = FontIndex(
+                    font_dirs,
+                    used_families=css_font_families(TMPL) if bool(cfg.get("custom_font_only_used", False)) else None,
+                )
+                missing += tuple(f"自定义字体目录: {d}" for d in font_dirs if not Path(d).is_dir())
+            if self._simple_render_mode() in ("image", "auto"):
+                text_font = self._resolve_text_font(str(cfg.get("simple_render_font", "") or "").strip(), font_dirs)
+                if not text_font:
+                    missing += ("轻量渲染的中文字体（简单解答仍使用浏览器渲染，可通过 simple_render_font 指定）",)
+        if fonts is not None:
+            fonts.build(table)
+        else:
+            table.clear("/fonts/")
+
+        local_assets = {
+            "KATEX_CSS": f'<link rel="stylesheet" href="{assets.url("/katex/katex.min.css")}">',
+            "KATEX_JS": f'<script defer src="{assets.url("/katex/katex.min.js")}"></script>',
+            "AUTORENDER_JS": f'<script defer src="{assets.url("/katex/auto-render.min.js")}"></script>',
+            "MARKED_JS": f'<script src="{assets.url("/marked/marked.min.js")}"></script>',
+            "FONT_CSS": fonts.stylesheet if fonts is not None else "",
+        }
+        remote_assets = {
+            "KATEX_CSS": f'<link rel="stylesheet" href="{KATEX_CDN}/katex.min.css" crossorigin="anonymous">',
+            "KATEX_JS": f'<script defer src="{KATEX_CDN}/katex.min.js" crossorigin="anonymous"></script>',
+            "AUTORENDER_JS": f'<script defer src="{KATEX_CDN}/contrib/auto-render.min.js" crossorigin="anonymous"></script>',
+            "MARKED_JS": f'<script src="{MARKED_CDN}/marked.min.js"></script>',
+        }
+        fonts_version = fonts.version if fonts is not None else ""
+        bundle = RenderBundle(
+            source=TMPL,
+            template=Template(TMPL),
+            local_assets=MappingProxyType(local_assets),
+            remote_assets=MappingProxyType(remote_assets),
+            asset_version=make_key(TMPL, table.version, fonts_version),
+            config_fingerprint=self._bundle_fingerprint(),
+            fonts_version=fonts_version,
+            text_font=text_font,
+            missing=missing,
+        )
+        if reload:
+            if missing:
+                logger.warning("渲染资源检查：以下资源缺失\n  - %s", "\n  - ".join(missing))
             else:
-                logger.warning("离线 marked.js 资源未找到，回退使用 CDN。路径: %s", marked_path)
+                logger.info("渲染资源检查通过（本地资源齐全）")
+        return bundle, table, fonts
+
+    def _install_bundle(self, bundle: RenderBundle, table: AssetTable, fonts: Optional[FontIndex]) -> RenderBundle:
+        """在事件循环中换上新构建的资源表、字体索引与渲染包；各为一次引用替换，渲染中的页面不会看到半成品。"""
+        self._get_assets().publish(table)
+        self._fonts = fonts
+        self._render_bundle = bundle
+        return bundle
+
+    def _resolve_text_font(self, preferred: str, font_dirs: List[str]) -> str:
+        """轻量渲染的中文字体路径；只在 simple_render_font 或 custom_font_dirs 变化时重新查找（会遍历系统字体目录，需在线程中调用）。"""
+        key = (preferred, tuple(font_dirs))
+        if self._text_font is None or self._text_font[0] != key:
+            self._text_font = (key, find_cjk_font(preferred, font_dirs))
+        return self._text_font[1]
+
+    def _refresh_bundle(self) -> Optional[Tuple[RenderBundle, AssetTable, Optional[FontIndex]]]:
+        """配置变化时重建渲染包，字体目录变化时重建字体索引，无变化返回 None（同步，会读文件与遍历目录，需在线程中调用）。"""
+        bundle = self._render_bundle
+        if bundle is None or bundle.config_fingerprint != self._bundle_fingerprint():
+            return self._build_bundle()
+        if self._fonts is not None and self._fonts.changed():
+            return self._build_bundle(reload=False)
+        return None
+
+    async def _rebuild_bundle(self) -> RenderBundle:
+        staged = await asyncio.to_thread(self._refresh_bundle)
+        if staged is not None:
+            return self._install_bundle(*staged)
+        return cast(RenderBundle, self._render_bundle)
+
+    def _start_bundle_refresh(self) -> "asyncio.Task[RenderBundle]":
+        """在线程中执行 _refresh_bundle 并换上结果；已有进行中的刷新时复用它。"""
+        task = self._bundle_task
+        if task is None or task.done():
+            task = self._bundle_task = asyncio.ensure_future(self._rebuild_bundle())
+        return task
+
+    async def _get_bundle(self) -> RenderBundle:
+        """返回当前渲染包，请求路径上不做文件系统操作。
+
+        配置变化时本次请求需要新的渲染包，等待线程中的重建（并发请求共享同一次重建）；
+        字体目录到了检查时间时只在后台线程中检查并按需重建，本次请求仍使用已缓存的渲染包。
+        """
+        bundle = self._render_bundle
+        while bundle is None or bundle.config_fingerprint != self._bundle_fingerprint():
+            bundle = await asyncio.shield(self._start_bundle_refresh())
+        if self._fonts is not None and self._fonts.check_due():
+            self._start_bundle_refresh()
+        return bundle
 
-        tpl = TMPL
-        return tpl, katex_css_tag, katex_js_tag, autorender_js_tag, marked_js_tag
+    def _simple_render_mode(self) -> str:
+        mode = str((self.config or {}).get("simple_render_mode", "off") or "off").lower()
+        return mode if mode in ("text", "image", "auto") else "off"
 
-    async def _render_locally(self, html: str, *, device_scale: int = 2, full_page: bool = True) -> str:
-        """使用本地 Playwright 渲染 HTML 为图片，返回本地文件路径。
+    def _simple_backend(self, bundle: RenderBundle, question: str, content: str) -> str:
+        """简单解答（不含公式、代码块、表格等）可改用的轻量后端。
 
-        注意：为确保 file:// 资源（KaTeX CSS/JS 与 fonts/）可加载，这里先将 HTML 写入临时文件，
-        再以 file:// 协议打开该页面（避免 about:blank 环境下的"Not allowed to load local resource"）。
+        返回 "text"（直接以文字发送）、"image"（Pillow 排版，不经浏览器），不适用或未启用时返回空字符串。
+        """
+        mode = self._simple_render_mode()
+        if mode == "off" or not is_simple_markdown(question) or not is_simple_markdown(content):
+            return ""
+        short = len(content) <= int((self.config or {}).get("simple_text_max_chars", 300) or 0)
+        if mode == "text" or (mode == "auto" and short):
+            return "text" if short else ""
+        return "image" if bundle.text_font else ""
+
+    def _render_text_image(self, font_path: str, question: str, content: str) -> List[str]:
+        """用 Pillow 渲染简单解答并写入渲染临时目录（同步，需在线程中调用）。"""
+        cfg = self.config or {}
+        fmt, quality, _quantize, _max_bytes = self._output_options()
+        pages = render_text_image(
+            question,
+            content,
+            font_path=font_path,
+            scale=int(cfg.get("local_device_scale", 2) or 2),
+            max_page_height=int(cfg.get("page_max_height", 0) or 0),
+            max_pages=_MAX_RENDER_PAGES,
+            fmt=fmt,
+            quality=quality,
+        )
+        spool = self._get_spool()
+        outs = []
+        for data in pages:
+            path = spool.new_path(OUTPUT_FORMATS[fmt])
+            path.write_bytes(data)
+            outs.append(str(path))
+        return outs
+
+    async def _render_locally(
+        self, html: str, *, device_scale: int = 2, full_page: bool = True, max_page_height: int = 0
+    ) -> List[str]:
+        """使用本地 Playwright 渲染 HTML 为图片，返回本地文件路径列表（按顺序）。
+
+        页面 HTML 与 KaTeX/marked.js/字体等资源都挂在虚拟源 ASSET_ORIGIN 下，由浏览器上下文上的
+        路由拦截直接从内存返回，不落盘 HTML，也不受 file:// 权限限制；
+        输出图片写入渲染临时目录，由后台清理任务按时间与总量回收。
+        页面从常驻浏览器池借出，不再每次启动/关闭 Chromium。
+        max_page_height > 0 时，高于该值的页面在 .content 的块边界处分页，逐页裁剪截图。
+        配置了 render_workers 时交给进程外的渲染 worker 执行，资源仍由本进程的 AssetStore 提供。
 
         需要：pip install playwright && playwright install chromium
         """
-        try:
-            from playwright.async_api import async_playwright  # type: ignore
-        except Exception as e:
-            raise RuntimeError("本地渲染需要安装 playwright，请先 pip install playwright 并执行 playwright install chromium") from e
-
-        tmp_dir = Path(tempfile.gettempdir())
-        ts = int(asyncio.get_event_loop().time() * 1000)
-        out_path = str(tmp_dir / f"astrbot_teacher_{ts}.png")
-        html_file = tmp_dir / f"astrbot_teacher_{ts}.html"
-        html_file.write_text(html, encoding="utf-8")
-
-        async with async_playwright() as p:
-            browser = await p.chromium.launch()
-            page = await browser.new_page(device_scale_factor=device_scale)
-            await page.goto(f"file://{html_file.as_posix()}", wait_until="load")
-
-            # -- 注入自定义字体 --
-            custom_font_dirs = (self.config or {}).get("custom_font_dirs") or []
-            if custom_font_dirs:
-                font_faces = []
-                for font_dir_str in custom_font_dirs:
-                    font_dir = Path(font_dir_str)
-                    if not font_dir.is_dir():
-                        logger.warning(f"自定义字体目录不存在: {font_dir_str}")
-                        continue
-                    
-                    logger.info(f"正在从目录加载字体: {font_dir_str}")
-                    for font_file in font_dir.rglob('*'):
-                        if font_file.suffix.lower() in ['.ttf', '.otf', '.woff', '.woff2']:
-                            font_family_name = font_file.stem  # 使用文件名作为字体族名
-                            font_faces.append(f"""
-                                @font-face {{
-                                    font-family: '{font_family_name}';
-                                    src: url('file://{font_file.as_posix()}');
-                                }}
-                            """)
-                
-                if font_faces:
-                    style_content = "\n".join(font_faces)
-                    await page.add_style_tag(content=style_content)
-                    logger.info(f"成功注入 {len(font_faces)} 个自定义字体。")
-
-            # 等待字体与渲染加载
-            try:
-                await page.wait_for_function("() => document.fonts && document.fonts.status === 'loaded'", timeout=1500)
-            except Exception:
-                pass
-            try:
-                await page.wait_for_selector('.katex', timeout=2000)
-            except Exception:
-                pass
-            await page.wait_for_timeout(500)
-            await page.screenshot(path=out_path, full_page=full_page, type="png")
-            await browser.close()
-        return out_path
+        fmt, quality, _quantize, max_bytes = self._output_options()
+        shot_type = "jpeg" if fmt == "jpeg" else "png"
+        shot_options = {
+            "device_scale": device_scale,
+            "full_page": full_page,
+            "max_page_height": max_page_height,
+            "max_pages": _MAX_RENDER_PAGES,
+            "shot_type": shot_type,
+            "quality": quality,
+            "size_format": fmt,
+            "max_bytes": max_bytes,
+            "ready_timeout_ms": int((self.config or {}).get("render_ready_timeout_ms", 5000) or 5000),
+        }
+        spool = self._get_spool()
+
+        timings: Dict[str, float] = {}
+        if self._render_workers is not None:
+            outs, timings = await self._render_workers.render(
+                html, out_dir=spool.root, suffix=OUTPUT_FORMATS[shot_type], options=shot_options
+            )
+        else:
+            if self._browser_pool is None:
+                raise RuntimeError("浏览器池尚未初始化")
+            assets = self._get_assets()
+            page_url = assets.put_page(html)
+            t0 = time.perf_counter()
+            async with self._browser_pool.page(device_scale) as page:
+                t1 = time.perf_counter()
+                timings["acquire"] = t1 - t0
+                try:
+                    await page.goto(page_url, wait_until="load")
+                finally:
+                    assets.discard_page(page_url)
+                timings["goto"] = time.perf_counter() - t1
+                outs = await capture_pages(
+                    page, lambda: str(spool.new_path(OUTPUT_FORMATS[shot_type])), **shot_options, timings=timings
+                )
+        for name, seconds in timings.items():
+            record_stage(name, seconds)
+        return outs
 
     def _get_full_plain_text(self, event: AstrMessageEvent) -> str:
         """从消息链重建完整纯文本，避免仅拿到第一个参数的情况。"""
@@ -309,429 +1055,723 @@ class TeacherPlugin(Star):
             logger.exception("提取图片 URL 时出错")
         return urls
 
+    def _request_keys(self, event: AstrMessageEvent) -> tuple[str, str]:
+        """调度用的 (群, 用户) 标识；私聊以用户自身作为“群”。"""
+        user = str(event.get_sender_id() or event.unified_msg_origin)
+        group = event.get_group_id()
+        return (f"group:{group}" if group else f"private:{user}"), user
+
+    async def _render_answer(
+        self, bundle: RenderBundle, question: str, content: str, group: str, user: str
+    ) -> List[str]:
+        """把题目与解答渲染为图片，返回按顺序排列的图片路径或 URL；远端与本地渲染均失败时抛出异常。
+
+        question 为空时页面不显示标题与题目框（用于分段发送的后续段落）。
+        本地渲染在配置了 page_max_height 时会把长页面分为多张图片；远端渲染始终为单张。
+        启用 simple_render_mode 且解答足够简单时改用 Pillow 排版，不占用浏览器与渲染并发名额。
+        """
+        # 不做任何转义，直接传递给模板
+        # marked.js 会自动转义代码块中的 HTML 字符（如 <iostream>）
+        # Jinja2 注释标记 {# #} 在实际内容中极少出现，暂不处理
+        html_data = {
+            "question": question,
+            "content": content,  # 直接使用原始文本
+        }
+
+        # 使用 Star.html_render 或本地渲染生成图片
+        prefer_local = bool((self.config or {}).get("prefer_local_render", False))
+        local_scale = int((self.config or {}).get("local_device_scale", 2) or 2)
+        page_height = int((self.config or {}).get("page_max_height", 0) or 0)
+
+        out_fmt, out_quality, out_quantize, out_max_bytes = self._output_options()
+        backend = "image" if self._simple_backend(bundle, question, content) == "image" else "browser"
+
+        # 渲染结果缓存：输入、缩放倍率、输出设置与资源版本均一致时直接返回已有图片，不经过浏览器
+        render_cache_key = ""
+        if self._image_cache is not None:
+            render_cache_key = make_key(
+                "image",
+                bundle.asset_version,
+                local_scale,
+                out_fmt,
+                out_quality,
+                out_quantize,
+                out_max_bytes,
+                page_height,
+                self._prerenderer is not None,
+                backend,
+                bundle.text_font if backend == "image" else "",
+                question,
+                content,
+            )
+            cached = await asyncio.to_thread(self._image_cache_lookup, render_cache_key)
+            if cached:
+                logger.info("渲染缓存命中: %s（%d 张）", render_cache_key[:12], len(cached))
+                return cached
+
+        async def do_remote():
+            with stage("remote_render"):
+                return [
+                    await self.html_render(
+                        bundle.source,
+                        {**html_data, **bundle.remote_assets},
+                        # 启用渲染缓存时取回本地文件以便入库
+                        return_url=not render_cache_key,
+                        options={
+                            "full_page": True,
+                            **({"type": "jpeg", "quality": out_quality} if out_fmt == "jpeg" else {"type": "png"}),
+                            "scale": "device",
+                        },
+                    )
+                ]
+
+        async def do_local():
+            prerendered = {}
+            if self._prerenderer is not None:
+                try:
+                    with stage("prerender"):
+                        prerendered = {
+                            "PRERENDERED": True,
+                            "QUESTION_HTML": await self._prerenderer.render_text(question),
+                            "CONTENT_HTML": await self._prerenderer.render_markdown(content),
+                        }
+                except Exception:
+                    logger.exception("预渲染失败，改由页面脚本渲染")
+                    prerendered = {}
+            with stage("template"):
+                html_str = bundle.render_local(**html_data, **prerendered)
+            return await self._render_locally(
+                html_str, device_scale=local_scale, full_page=True, max_page_height=page_height
+            )
+
+        out: List[str] = []
+        if backend == "image":
+            try:
+                with stage("text_render"):
+                    out = await asyncio.to_thread(self._render_text_image, bundle.text_font, question, content)
+            except ImportError:
+                if not self._pillow_warned:
+                    self._pillow_warned = True
+                    logger.warning("未安装 Pillow，简单解答仍使用浏览器渲染（pip install Pillow 以启用）")
+            except Exception:
+                logger.exception("轻量渲染失败，改用浏览器渲染")
+            if not out:
+                backend = "browser"
+        self._metrics.count("render_backend", backend)
+
+        if not out:
+            # 首选渲染器失败时换用另一个；配置了对冲延迟时首选渲染器超时未完成即并行启动另一个，先完成者胜出
+            attempts = [("local", do_local), ("remote", do_remote)]
+            if not prefer_local:
+                attempts.reverse()
+            hedge_ms = int((self.config or {}).get("render_hedge_delay_ms", 0) or 0)
+            t0 = time.perf_counter()
+            async with self._scheduler.stage("render").slot(group, user):
+                record_stage("render_wait", time.perf_counter() - t0)
+                with stage("render"):
+                    out = await run_stage(
+                        "render",
+                        hedged(
+                            attempts,
+                            breakers=self._render_breakers,
+                            delay=hedge_ms / 1000 if hedge_ms > 0 else None,
+                        ),
+                        self._stage_timeout("render"),
+                    )
+        with stage("encode"):
+            out = list(await asyncio.gather(*(self._finalize_output(o) for o in out)))
+        record_size("images", len(out))
+
+        if render_cache_key:
+            await self._image_cache_store_pages(render_cache_key, out)
+        return out
+
+    async def _render_section(
+        self, bundle: RenderBundle, question: str, section: str, group: str, user: str
+    ) -> List[Tuple[str, Any]]:
+        """流式模式下渲染单个段落，返回 [(类型, 内容), ...]；渲染失败时退回为该段落的文本。"""
+        if self._simple_backend(bundle, question, section) == "text":
+            self._metrics.count("render_backend", "text")
+            return [("plain", to_plain_text(section))]
+        try:
+            return [await self._image_payload(await self._render_answer(bundle, question, section, group, user))]
+        except Exception:
+            logger.exception("段落渲染失败，退回为文本结果")
+            return [("plain", (f"题目：\n{question}\n\n{section}" if question else section))]
+
+    @staticmethod
+    def _image_component(out: str) -> Image:
+        """把渲染结果转为消息图片组件：URL 原样引用，本地文件以 base64 内联（同步读文件，需在线程中调用）。"""
+        if out.startswith(("http://", "https://")):
+            return Image.fromURL(out)
+        path = Path(out[len("file://"):] if out.startswith("file://") else out)
+        return Image.fromBase64(base64.b64encode(path.read_bytes()).decode("ascii"))
+
+    async def _image_payload(self, outs: List[str]) -> Tuple[str, Any]:
+        """一次渲染的结果：单张为 ("image", 路径)；分页的多张合为一条按顺序排列的多图消息 ("chain", [Image, ...])。"""
+        if len(outs) == 1:
+            return ("image", outs[0])
+        return ("chain", await asyncio.to_thread(lambda: [self._image_component(o) for o in outs]))
+
+    @staticmethod
+    def _result(event: AstrMessageEvent, kind: str, payload: Any):
+        if kind == "image":
+            return event.image_result(payload)
+        if kind == "chain":
+            return event.chain_result(payload)
+        return event.plain_result(payload)
+
+    @classmethod
+    def _final(cls, event: AstrMessageEvent, shared: List[Tuple[str, Any]], kind: str, payload: Any):
+        """最终结果：同时记录下来，供合并到本次处理的相同请求复用。"""
+        shared.append((kind, payload))
+        return cls._result(event, kind, payload)
+
     @filter.command("g")
     async def solve(self, event: AstrMessageEvent, question: str = ""):
         """/g <题目内容>
 
         如果附带图片，会先对图片进行 OCR（由模型做图片理解），再统一交给解题模型。
         """
+        group, user = self._request_keys(event)
+        trace = Trace()
+        self._apply_limits()
         try:
-            # 1. 准备 provider
-            solver_provider_id = (self.config or {}).get("solver_provider_id") or ""
-            ocr_provider_id = (self.config or {}).get("ocr_provider_id") or ""
-
-            prov_solver = self._pick_llm_provider(solver_provider_id, event)
-            prov_ocr = self._pick_llm_provider(ocr_provider_id, event)
-
-            if not prov_solver:
-                yield event.plain_result("❌ 未找到可用的解题 Provider，请在 AstrBot 管理界面配置模型提供商或在插件配置中指定 solver_provider_id。")
-                return
-            if not prov_ocr:
-                logger.warning("未找到 OCR Provider，将仅使用文字输入进行解题。")
-
-            # 2. 收集图片
-            image_urls = self._extract_image_urls(event)
-            ocr_text = ""
-
-            # 3. 如果有图片，先调用模型做图片到文本的提取（OCR）
-            if image_urls and prov_ocr:
-                ocr_model = (self.config or {}).get("ocr_model") or None
-                ocr_prompt = '''你是一个视觉识别模型，任务是从图像中提取所有有意义的文字信息，包括题目文字、符号、公式和标注。
-
-要求：
-1. 尽可能完整、准确地转录所有文字内容。
-2. 对数学公式使用 LaTeX 语法输出，保持原有结构（不要简化或改写）。
-3. 保留题目排版顺序（上到下、左到右），适当添加换行。
-4. 如果有表格、图示标签或编号，保留其文本信息。
-5. 不要解释内容，不要做任何推理。
-6. 如果遇到模糊区域，请以 `[可能为: ...]` 形式标注。
-
-输出格式：
-[OCR_TEXT]
-(在这里输出提取到的文字与公式)
-注意：
-- **不得使用\(\)和\[\]包裹任何东西，请用别的方式替代**
-- 例如："这是 $ r $ 的半径"
-- 仅限简短表达，复杂公式应放入 `$$...$$`
-- 正确示例：
-  - "函数的值域为 $ g(x) \\in [a,b] $"
-  - "设 $ a = 1 $，$ b = 2 $"
-  - "在区间 $ x \\in (0, 1) $ 上"
-- **错误示例**（不会渲染）：
-  - "(g(x) \\in [a,b])" ← 缺少 $ 符号
-  - "$g(x) \\in [a,b]$" ← 紧贴文字，缺少空格
-  - "\( R \)"← 使用\( \) 语法导致最后渲染不成功
+            with tracing(trace):
+                async with self._scheduler.admit(group, user):
+                    async for result in self._solve(event, question, group, user):
+                        yield result
+        except SchedulerBusy as e:
+            trace.outcome = "rejected"
+            logger.warning("/g 请求被拒绝: %s", e)
+            yield event.plain_result("⏳ 当前排队的题目过多（或你已有题目在处理中），请稍后再试。")
+        finally:
+            self._finish_trace(trace, group, user)
+
+    def _finish_trace(self, trace: Trace, group: str, user: str) -> None:
+        """把一次请求的各阶段耗时与大小计入滚动指标，并按需记录慢请求、导出 Prometheus 文本文件。"""
+        cfg = self.config or {}
+        total = trace.elapsed
+        self._metrics.count("requests", trace.outcome)
+        self._metrics.observe("stage_seconds", "total", total)
+        for name, seconds in trace.stages.items():
+            self._metrics.observe("stage_seconds", name, seconds)
+        for name, value in trace.sizes.items():
+            self._metrics.observe("size", name, value)
+
+        slow_ms = int(cfg.get("slow_request_log_ms", 0) or 0)
+        if slow_ms and total * 1000 >= slow_ms:
+            logger.warning("慢请求（%s / %s）%s", group, user, trace.summary())
+        else:
+            logger.info("/g 请求完成：%s", trace.summary())
+
+        textfile = str(cfg.get("metrics_textfile", "") or "").strip()
+        if textfile:
+            start_background("指标导出", asyncio.to_thread(self._write_metrics_file, Path(textfile)))
+
+    def _write_metrics_file(self, path: Path) -> None:
+        """原子地写入 Prometheus 文本文件（供 node_exporter textfile collector 等采集）。"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(self._metrics.prometheus(_METRICS_PREFIX, _METRICS_LABELS), encoding="utf-8")
+        tmp.replace(path)
+
+    def _stage_timeout(self, stage: str) -> float:
+        """阶段时间上限（秒），0 为不限。"""
+        default = _PIPELINE_TIMEOUTS[stage]
+        return float((self.config or {}).get(f"{stage}_stage_timeout_seconds", default) or 0)
+
+    async def _collect(self, event: AstrMessageEvent, question: str, group: str, user: str) -> SolveJob:
+        """阶段 1：组装 Provider 候选链、提取文字题目并取回图片。"""
+        with stage("select"):
+            solver_chain = self._provider_chain("solver", event)
+            ocr_chain = self._provider_chain("ocr", event)
+        if not ocr_chain:
+            logger.warning("未找到 OCR Provider，将仅使用文字输入进行解题。")
+
+        image_urls = self._extract_image_urls(event)
+        base_q = (question or "").strip()
+        q_from_event = self._extract_text_after_command(event, "g")
+        if q_from_event:
+            if (len(q_from_event) > len(base_q)) or (base_q and q_from_event.startswith(base_q)):
+                base_q = q_from_event
+
+        images: List[Optional[bytes]] = []
+        if image_urls and ocr_chain:
+            # 先取回图片字节，后续按内容哈希去重/查缓存（QQ 转发后 URL 会变化，不能以 URL 为键）
+            try:
+                with stage("fetch"):
+                    images = await run_stage("fetch", self._fetch_images(image_urls), self._stage_timeout("fetch"))
+            except StageTimeout as e:
+                logger.warning("%s，将直接传递原始图片地址", e)
+                images = [None] * len(image_urls)
+            record_size("input_image_bytes", sum(len(b) for b in images if b))
+        return SolveJob(group, user, base_q, image_urls, images, solver_chain, ocr_chain)
+
+    def _flight_timeout(self) -> float:
+        """合并请求等待首个请求结果的上限：OCR、解题、渲染阶段上限之和；任一阶段不限时为 0（不限）。"""
+        limits = [self._stage_timeout(s) for s in ("ocr", "solver", "render")]
+        return 0.0 if any(t <= 0 for t in limits) else sum(limits)
+
+    def _solver_cache_key(self, choice: ProviderChoice, job: SolveJob) -> str:
+        """解题缓存键：按给出解答的 Provider/模型区分，备用模型的解答不会被当作首选模型的解答复用。"""
+        return make_key(
+            "solver",
+            *self._provider_identity(choice.provider, choice.model),
+            SOLVER_PROMPT_VERSIONS[job.prompt_kind],
+            normalize_text(job.question),
+        )
 
-积分、求和、分式、矩阵、对齐推导等复杂表达式使用块级公式：
+    def _flight_key(self, job: SolveJob) -> str:
+        head = job.solver_chain[0]
+        return make_key(
+            "flight",
+            *self._provider_identity(head.provider, head.model),
+            normalize_text(job.base_question),
+            *(
+                hashlib.sha256(b).hexdigest() if b else u
+                for u, b in zip(job.image_urls, job.images or [None] * len(job.image_urls))
+            ),
+        )
 
-$$
-... 
-$$
+    async def _warm_render(self) -> RenderBundle:
+        """与 OCR/解题重叠执行的渲染准备：校验渲染包，预热浏览器页面与预渲染 worker。"""
+        bundle = await self._get_bundle()
+        cfg = self.config or {}
+        # 本地渲染可能被用到（首选，或作为对冲/回退）时才预热，避免仅用远端渲染时白白启动浏览器
+        if self._render_workers is not None:
+            if bool(cfg.get("prefer_local_render", False)) or self._render_workers.running:
+                await self._render_workers.start()
+        elif self._browser_pool is not None and (
+            bool(cfg.get("prefer_local_render", False)) or self._browser_pool.running
+        ):
+            await self._browser_pool.warm(int(cfg.get("local_device_scale", 2) or 2))
+            if self._prerenderer is not None:
+                await self._prerenderer.warm()
+        return bundle
+
+    async def _job_bundle(self, job: SolveJob) -> RenderBundle:
+        if job.warmup is not None:
+            try:
+                return await job.warmup
+            except Exception:
+                pass
+        return await self._get_bundle()
+
+    async def _solve_text(self, job: SolveJob) -> str:
+        """阶段 3（非流式）：请求解题模型，返回 Markdown 解答。"""
+        solver_resp, job.solver_used = await run_stage(
+            "solver",
+            self._routers["solver"].chat(
+                job.solver_chain,
+                prompt=job.question,
+                context=[],
+                system_prompt=SOLVER_PROMPTS[job.prompt_kind],
+                image_urls=[],
+            ),
+            self._stage_timeout("solver"),
+        )
+        return solver_resp.completion_text if solver_resp else ""
+
+    async def _stream_solution(self, event: AstrMessageEvent, job: SolveJob, shared: List[Tuple[str, Any]], ticket: Any):
+        """阶段 3（流式）：每完成一个 ## 段落立即渲染发送，后续段落仍在生成；完成后写入 job.solver_text。"""
+        splitter = SectionSplitter()
+        pending: Deque[asyncio.Task] = deque()
+        loop = asyncio.get_running_loop()
+        timeout = self._stage_timeout("solver")
+        deadline = loop.time() + timeout if timeout > 0 else None
+        bundle: Optional[RenderBundle] = None
+        started = time.perf_counter()
+        first_chunk = True
+
+        async def render(question_box: str, section: str) -> List[Tuple[str, Any]]:
+            nonlocal bundle
+            if bundle is None:
+                bundle = await self._job_bundle(job)
+            return await self._render_section(bundle, question_box, section, job.group, job.user)
+
+        def schedule(section: str) -> None:
+            question_box = "" if job.sections else job.question
+            job.sections += 1
+            pending.append(asyncio.create_task(render(question_box, section)))
+
+        chunks = self._routers["solver"].stream(
+            job.solver_chain,
+            prompt=job.question,
+            context=[],
+            system_prompt=SOLVER_PROMPTS[job.prompt_kind],
+            image_urls=[],
+            on_choice=lambda choice: setattr(job, "solver_used", choice),
+        )
 
-- 独占一行，上下各留空行
-- 块内可使用 `aligned`、`cases` 等环境进行多行排版
-- 禁止在块级公式中嵌套 `$...$`
+        async def next_chunk() -> str:
+            return await chunks.__anext__()
 
+        chunk_task: Optional["asyncio.Task[str]"] = None
+        try:
+            while True:
+                if chunk_task is None:
+                    chunk_task = asyncio.create_task(next_chunk())
+                # 同时等待下一个分片与队首段落的渲染：段落渲染完即发送，不必等到下一个分片到达；
+                # 阶段上限作用于每次等待，中途停止输出的 Provider 也会按时超时
+                waiters = {chunk_task, pending[0]} if pending else {chunk_task}
+                remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait(waiters, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise StageTimeout("solver", timeout)
+                while pending and pending[0].done():
+                    for item in pending.popleft().result():
+                        t0 = time.perf_counter()
+                        yield self._final(event, shared, *item)
+                        record_stage("send", time.perf_counter() - t0)
+                if not chunk_task.done():
+                    continue
+                finished, chunk_task = chunk_task, None
+                try:
+                    delta = finished.result()
+                except StopAsyncIteration:
+                    break
+                if first_chunk:
+                    first_chunk = False
+                    record_stage("first_chunk", time.perf_counter() - started)
+                for section in splitter.feed(delta):
+                    schedule(section)
+            record_stage("solver", time.perf_counter() - started)
+            ticket.release()
+            for section in splitter.flush():
+                schedule(section)
+            while pending:
+                for item in await pending.popleft():
+                    t0 = time.perf_counter()
+                    yield self._final(event, shared, *item)
+                    record_stage("send", time.perf_counter() - t0)
+        except Exception:
+            # 超时或出错：已渲染完的段落按顺序发出（队首未完成的最多再等片刻），其余段落随后取消
+            flush_deadline = loop.time() + _STREAM_FLUSH_SECONDS
+            while pending:
+                head = pending[0]
+                if not head.done():
+                    await asyncio.wait({head}, timeout=max(0.0, flush_deadline - loop.time()))
+                    if not head.done():
+                        break
+                pending.popleft()
+                if head.cancelled() or head.exception() is not None:
+                    continue
+                for item in head.result():
+                    yield self._final(event, shared, *item)
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+            if chunk_task is not None:
+                # 先结束进行中的取分片任务，生成器未在运行时才能关闭
+                chunk_task.cancel()
+                try:
+                    await chunk_task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            await chunks.aclose()
+        job.solver_text = splitter.text
+
+    @staticmethod
+    def _set_outcome(outcome: str) -> None:
+        trace = current_trace()
+        if trace is not None:
+            trace.outcome = outcome
+
+    def _solver_prompt_kind(self, question: str) -> str:
+        """solver_prompt_mode 为 auto 时按题型选择提示词变体，否则使用完整提示词。"""
+        mode = str((self.config or {}).get("solver_prompt_mode", "full") or "full").lower()
+        if mode != "auto":
+            return "full"
+        kind = classify_question(question)
+        logger.info("题型判别：%s（系统提示词 %d 字符）", kind, len(SOLVER_PROMPTS[kind]))
+        return kind
+
+    def _solver_error_hint(self, job: SolveJob, emsg: str) -> str:
+        """针对常见的解题模型错误给出排查提示；无对应提示时返回空字符串。"""
+        prov_solver = job.solver_chain[0].provider
+        solver_model = job.solver_chain[0].model
+
+        # 检查是否是 JSON 解析错误
+        if "Expecting value" in emsg or "JSON" in emsg:
+            prov_info = getattr(prov_solver, "provider_config", {}) or {}
+            provider_id = prov_info.get("id") or "(unknown)"
+            model_name = solver_model or prov_info.get("model_config", {}).get("model")
+
+            return (
+                "❌ 模型响应解析失败（可能是 API 返回格式问题）\n"
+                f"Provider: {provider_id}\n"
+                f"Model: {model_name}\n"
+                f"错误详情: {emsg}\n\n"
+                "💡 可能的原因:\n"
+                "1. deepseek-reasoner 等推理模型可能返回特殊格式\n"
+                "2. API 返回了错误响应而非正常的聊天完成\n"
+                "3. 网络问题导致响应不完整\n\n"
+                "🔧 建议:\n"
+                "- 尝试切换到 deepseek-chat 等标准模型\n"
+                "- 检查 API key 和网络连接\n"
+                "- 查看 AstrBot 日志获取完整错误信息"
+            )
+
+        if "resource_not_found_error" in emsg or "Not found the model" in emsg:
+            prov_info = getattr(prov_solver, "provider_config", {}) or {}
+            model_hint = solver_model or prov_info.get("model_config", {}).get("model")
+            api_base = prov_info.get("api_base")
+            provider_id = prov_info.get("id") or "(unknown)"
+            return (
+                "❌ 解题模型不可用：当前 Provider 未找到该模型或无权限。\n"
+                f"Provider: {provider_id}\nModel: {model_hint}\nAPI Base: {api_base}\n"
+                "请在插件配置中正确设置 solver_provider_id/solver_model，或切换会话 Provider。"
+            )
+        return ""
+
+    async def _solve(self, event: AstrMessageEvent, question: str, group: str, user: str):
+        """按阶段处理一次 /g 请求：收集输入 → OCR → 解题 → 渲染。
+
+        渲染准备（渲染包校验、浏览器页面与预渲染 worker 预热）在 OCR/解题期间并行进行，
+        每个阶段有各自的时间上限。
+        """
+        leader_key = ""
+        shared: List[Tuple[str, Any]] = []
+        try:
+            # 1. 收集输入：Provider 候选链（首选在前，备用依次在后）、文字题目与图片
+            job = await self._collect(event, question, group, user)
+            if not job.solver_chain:
+                yield event.plain_result("❌ 未找到可用的解题 Provider，请在 AstrBot 管理界面配置模型提供商或在插件配置中指定 solver_provider_id。")
+                return
 
-### 其他说明
-**不要输出额外说明或前后缀。**
-**输出中的 LaTeX 代码不做任何字符清理或转义，保持原样。**
+            # 相同题目（文字 + 图片内容）正在处理时，直接等待同一份结果，不重复 OCR/解题/渲染
+            flight_key = self._flight_key(job)
+            flight, is_leader = self._flights.join(flight_key)
+            if not is_leader:
+                logger.info("相同题目正在处理中，合并请求: %s", flight_key[:12])
+                self._set_outcome("coalesced")
+                yield event.plain_result("收到！相同的题目正在处理中，完成后一并发送结果...")
+                try:
+                    shared_results = await run_stage("coalesced", asyncio.shield(flight), self._flight_timeout())
+                except StageTimeout as e:
+                    logger.warning("等待相同题目的结果超时（%s）: %s", e, flight_key[:12])
+                    shared_results = []
+                if not shared_results:
+                    yield event.plain_result("❌ 相同题目的处理未能完成，请稍后重试。")
+                for kind, payload in shared_results:
+                    yield self._result(event, kind, payload)
+                return
+            leader_key = flight_key
+            job.warmup = start_background("渲染预热", self._warm_render())
 
-'''
+            # 2. 如果有图片，先调用模型做图片到文本的提取（OCR）
+            if job.image_urls and job.ocr_chain:
                 try:
-                    ocr_resp = await self._text_chat(
-                        prov_ocr,
-                        prompt=ocr_prompt,
-                        context=[],
-                        system_prompt="OCR: 将图片中的题目转为可编辑文本。",
-                        image_urls=image_urls,
-                        model=ocr_model,
-                    )
-                    ocr_text = ocr_resp.completion_text.strip() if ocr_resp else ""
-                except Exception:
-                    logger.exception("OCR 请求失败")
-                    ocr_text = ""
-
-            # 4. 合并用户输入的文字题目与 OCR 结果
-            base_q = (question or "").strip()
-            q_from_event = self._extract_text_after_command(event, "g")
-            if q_from_event:
-                if (len(q_from_event) > len(base_q)) or (base_q and q_from_event.startswith(base_q)):
-                    base_q = q_from_event
-
-            combined_question = "\n".join([s for s in (base_q, ocr_text) if s]).strip()
-            logger.debug(f"astrbot_teacher: extracted question length={len(combined_question)}")
-            logger.info(combined_question)
+                    with stage("ocr"):
+                        job.ocr_text = await run_stage(
+                            "ocr",
+                            self._ocr(job.ocr_chain, job.image_urls, job.images, group, user),
+                            self._stage_timeout("ocr"),
+                        )
+                except StageTimeout as e:
+                    logger.warning("%s，仅使用文字题目", e)
+                record_size("ocr_chars", len(job.ocr_text))
+
+            combined_question = job.question
+            logger.debug("题目文本（%d 字符）：%s", len(combined_question), combined_question)
             if not combined_question:
-                yield event.plain_result(
+                self._set_outcome("empty")
+                yield self._final(
+                    event,
+                    shared,
+                    "plain",
                     "未检测到题目文本。请直接在 /g 后输入题目，例如：\n"
                     "/g 求解方程 x^2 + 2x + 1 = 0\n"
-                    "或发送 /g 并附带题目图片。"
+                    "或发送 /g 并附带题目图片。",
                 )
                 return
-            else:
-                yield event.plain_result("收到！正在处理题目...")
-
-            # 5. 请求解题模型（输出 Markdown）
-            solver_model = (self.config or {}).get("solver_model") or None
-
-            solver_system = """你是智能题目讲解助手。你的任务不是只给出结果，而是像一位认真讲题的老师那样，把思路讲清楚，让听的人能跟上、听懂、学会。
-
-如果输入中包含来自图片的 OCR 文本或公式识别结果，请将其与题干内容整合，一并理解后进行讲解。
-
-## 总体目标
-
-输出清晰、准确、逻辑连贯的题目解析。重点在于让人理解推理过程，而非堆砌结论或定义。
-
-## 输出格式 — 纯 Markdown
 
-直接输出 Markdown 格式的讲解内容，不要输出 JSON、代码围栏或其他包装。
+            # 3. 请求解题模型（输出 Markdown），按题型选用精简的系统提示词
+            job.prompt_kind = self._solver_prompt_kind(combined_question)
+            if self._solver_cache is not None:
+                solver_cache_key = self._solver_cache_key(job.solver_chain[0], job)
+                job.solver_text = await self._solver_cache.get(solver_cache_key) or ""
+                if job.solver_text:
+                    logger.info("解题缓存命中: %s", solver_cache_key[:12])
+                    self._metrics.count("cache_hits", "solver")
 
-建议按以下结构组织（但可根据题目特点灵活调整）：
-
-1. **## 题目分析**：分析知识点、已知条件、求解目标、隐藏信息
-2. **## 解题思路**：总体策略、关键直觉、思路转折点
-3. **## 详细步骤**：逐步推导，清晰说明每一步的逻辑
-4. **## 最终答案**：明确、规范的答案
-5. **## 知识点总结**：规律、易错点、思维推广
-
-## 讲解语气与风格
-
-- 像老师在讲黑板题：有节奏，有过渡，有解释
-- 使用 Markdown 的标题、列表、引用等语法组织内容
-- 核心概念或结论用 **粗体** 强调
-- 在思路转折处提示"我们换个角度看""此处需特别注意"等自然过渡
-- 不写空洞套话（如"由定义可得"），要点出"为什么这样定义"
-
-## 数学规范 — KaTeX 渲染
-
-### 行间公式
-
-积分、求和、分式、矩阵、对齐推导等复杂表达式使用块级公式：
-
-$$
-... 
-$$
-
-- 独占一行，上下各留空行
-- 块内可使用 `aligned`、`cases` 等环境进行多行排版
-- 禁止在块级公式中嵌套 `$...$`
-
-为避免在 Markdown→HTML→KaTeX 管道中 \\ 被吞掉或转义，请严格使用以下约定：
-
-行间（display）公式 使用 $$ ... $$（独占一行，且上/下空行）。
-
-在需要换行处必须使用 \\newline（即反斜杠 + 单词 newline）
-
-不要使用 \\ 或单独 \ 来换行。（说明：模板端会对数学区块做额外保护，但请优先用 \\newline 以避免兼容问题。）
-
-复杂多行结构（cases、aligned 等）仍使用 LaTeX 环境，但换行位置请用 \\newline
-
-	
-### 行内公式
-- **不得使用\(\)和\[\]包裹任何东西，必须使用 `$...$` 包围**，结束前开始后各留一个空格
-- 例如："这是 $ r $ 的半径"
-- 仅限简短表达，复杂公式应放入 `$$...$$`
-- 正确示例：
-  - "函数的值域为 $ g(x) \\in [a,b] $"
-  - "设 $ a = 1 $，$ b = 2 $"
-  - "在区间 $ x \\in (0, 1) $ 上"
-- **错误示例**（不会渲染）：
-  - "(g(x) \\in [a,b])" ← 缺少 $ 符号
-  - "$g(x) \\in [a,b]$" ← 紧贴文字，缺少空格
-  - "\( R \)"← 使用\( \) 语法导致最后渲染不成功
-- 行内矩阵公式使用 \displaystyle 保证正常渲染；如：
-$\displaystyle
-A=\begin{bmatrix}2&1\\1&2\end{bmatrix}
-$
-
-### 粗体与符号
-
-- 普通文字用 Markdown：`**文字**`
-- 数学符号在公式中使用 `\\mathbf{r}` 或 `\\boldsymbol{\\alpha}`
-- 不混用 Markdown 粗体与数学模式
-
-### 表格表达
-- 若输出包含结构化数据或对比信息，优先使用表格表达。
-- 所有表格使用标准 Markdown 表格语法（不输出 HTML）。
-- 表头、列对齐需符合 GitHub Flavored Markdown (GFM) 语法，例如：
-
-| 项目 | 数值 | 单位 |
-|------|------:|:----:|
-| 长度 | 10 | cm |
-| 宽度 | 5 | cm  |
-
-数字列右对齐，文字列左对齐。
-
-- 不在表格外额外加 代码块 标记（```）。
-
-### 分数与一致性
-
-- 优先使用最简分数（ `$ 1/2 $` 而非 `$ 2/4 $` ）
-- 简单分式可写作斜线分数；复杂分式使用 `\\frac{a}{b}` 并独立成行
-
-### 多行推导
-
-多步相关推导可写为：
-
-$$
-\\begin{aligned}
-A &= B + C \\newline
-&= D
-\\end{aligned}
-$$
-
-避免每步单独一个 `$$...$$`。
-
-多步相关推导或分段方程可写为：
-
-$$
-\\begin{cases}
-A = B + C \\newline
-D = E - F
-\\end{cases}
-$$
-
-⚠️ 注意
--**每行末尾使用 \\newline 来换行（例如：A = B + C \\newline D = E - F）。**
-- 避免使用 \\\\，部分 Markdown 渲染器会自动合并或转义它。
-- 不要在行尾直接写单反斜杠 `\` 或双反斜杠 `\\`，会导致行间不分行。
-
-### 书写规范与函数格式
-
-- 相邻数字和函数必须显式分隔，如 $ 3 \\ln 2 $、$ \\frac{\\pi}{2} \\cdot 3\\ln 2 $
-- 所有函数都需加反斜杠：`\\sin`、`\\cos`、`\\ln`、`\\log`、`\\tan`、`\\exp` 等
-- 连乘项需加 `\\cdot` 或空格，避免粘连
-
-## 解释优先级
-
-- 关键决策步骤：说明为什么这样做
-- 机械运算步骤：可简略
-- 若信息不足，在分析中说明假设或不确定性
-
-针对**数学证明题**的增强要求（必须遵守）
-
-先写明要证明的命题（Theorem），把结论用数学符号写清楚，列出所有已知前提与定义。
-
-若题目涉及特定定义或定理（如柯西不等式、极限定理、拓扑概念等），先列出或引用定义/定理（带简短说明），并在需要时说明可用性与前置条件。
-
-将证明拆成Claim / Lemma / Step：先声明引理，再给出证明（每个引理都写清楚“证明”二字），最后由引理合并得主结论。
-
-对于 归纳法：明确基底（base case）、归纳假设（IH）、归纳步骤（show n→n+1），并检查边界 n 值与可用性。
-
-对于 反证法：写出假设的反面、推导矛盾点，并明确指出矛盾来自何处（与已知条件冲突或违反定义）。
-
-对于 构造性证明：给出构造步骤并证明构造合法性与满足性（包括存在性/唯一性证明）。
-
-说明 必要性与充分性：若命题含双向条件，分清“必要性证明”与“充分性证明”。
-
-提供反例/边界分析：若条件不可省略，给出最小修改导致命题不成立的反例；若命题可放宽，说明如何放宽并给出新的结论。
-
-结尾处写上“证毕”或“QED”。
-
-## 针对 **算法题** 的增强要求（必须遵守）
-
-- 在 **解题思路** 内明确给出算法类型（贪心 / 分治 / 动态规划 / 回溯 / 图算法 / 数学推导 等）以及为什么适用该方法。  
-- 给出 **清晰的C++代码**(除非指定用其他语言）（可用缩进的 Markdown 代码块形式），例如：
-
-```Cpp
-int main()
-{
- return 0;
-}
-...
-
-复制代码
-（注意：最终输出以 Markdown 为主，但不要用反引号包裹整个回答——伪码块可以用三反引号包含伪码段落。）
-
-提供 时间复杂度 与 空间复杂度 的渐进分析（大 O 表示法），并说明最坏/平均/最好情况。
-
-证明算法正确性：给出不变式（invariant）或归纳不变性，证明初始成立、保持性与终止性。
-
-指出 边界条件、特殊输入、以及至少 2 个 示例测试用例（含输入输出），必要时给出手算推导。
-
-若算法有多种实现（例如递归与迭代），简短比较优缺点。
-
-若题目涉及数值精度或近似算法，请说明误差范围与稳定性。
-
-若题目为竞赛/面试风格，给出可提交/可跑的参考代码思路（语言无必须，以伪码为主）并注明关键实现注意点（例如边界索引、整数溢出、并发安全等）。
-
-## 准确性与安全性
-
-- 所有推导逻辑必须可复核；涉及近似须注明范围与理由
-- 仅使用 KaTeX 支持的命令；不定义新宏、不写 HTML 标签
-- **在任何内容中都不得使用\(\)和\[\]包裹任何东西，必须使用 `$...$` 包围**，结束前开始后各留一个空格
-- 对于多行推导，每行末尾使用 \\newline 来换行（例如：A = B + C \\newline D = E - F）。避免使用 \\\\，部分 Markdown 渲染器会自动合并或转义它。
-- 矩阵输出时优先使用 \begin{bmatrix}...\end{bmatrix} 而不是 \begin{matrix}
-- 行内矩阵使用 \displaystyle 保证正常渲染；如：$ \displaystyle A=\begin{bmatrix} 2 & 1 \\ 1 & 2 \end{bmatrix} $
-
-## 总结
-
-你的目标不是"写报告"，而是"把题讲明白"。像课堂讲题那样，让思路自然展开，每一步都能被理解。
-"""
-
-            try:
-                solver_resp = await self._text_chat(
-                    prov_solver,
-                    prompt=combined_question,
-                    context=[],
-                    system_prompt=solver_system,
-                    image_urls=[],
-                    model=solver_model,
-                )
-            except Exception as e:
-                emsg = str(e)
-                logger.error(f"调用解题模型时出错: {emsg}", exc_info=True)
-                
-                # 检查是否是 JSON 解析错误
-                if "Expecting value" in emsg or "JSON" in emsg:
-                    prov_info = getattr(prov_solver, "provider_config", {}) or {}
-                    provider_id = prov_info.get("id") or "(unknown)"
-                    model_name = solver_model or prov_info.get("model_config", {}).get("model")
-                    
-                    hint = (
-                        "❌ 模型响应解析失败（可能是 API 返回格式问题）\n"
-                        f"Provider: {provider_id}\n"
-                        f"Model: {model_name}\n"
-                        f"错误详情: {emsg}\n\n"
-                        "💡 可能的原因:\n"
-                        "1. deepseek-reasoner 等推理模型可能返回特殊格式\n"
-                        "2. API 返回了错误响应而非正常的聊天完成\n"
-                        "3. 网络问题导致响应不完整\n\n"
-                        "🔧 建议:\n"
-                        "- 尝试切换到 deepseek-chat 等标准模型\n"
-                        "- 检查 API key 和网络连接\n"
-                        "- 查看 AstrBot 日志获取完整错误信息"
-                    )
-                    yield event.plain_result(hint)
-                    return
-                
-                if "resource_not_found_error" in emsg or "Not found the model" in emsg:
-                    prov_info = getattr(prov_solver, "provider_config", {}) or {}
-                    model_hint = solver_model or prov_info.get("model_config", {}).get("model")
-                    api_base = prov_info.get("api_base")
-                    provider_id = prov_info.get("id") or "(unknown)"
-                    hint = (
-                        "❌ 解题模型不可用：当前 Provider 未找到该模型或无权限。\n"
-                        f"Provider: {provider_id}\nModel: {model_hint}\nAPI Base: {api_base}\n"
-                        "请在插件配置中正确设置 solver_provider_id/solver_model，或切换会话 Provider。"
-                    )
-                    yield event.plain_result(hint)
-                    return
-                raise
-
-            solver_text = solver_resp.completion_text if solver_resp else ""
-            logger.info("Markdown solver output (first 1000 chars): %s", solver_text[:1000])
+            if job.solver_text:
+                yield event.plain_result("收到！正在处理题目...")
+            else:
+                solver_ticket = self._scheduler.stage("solver").request(group, user)
+                try:
+                    position = solver_ticket.position
+                    if position:
+                        yield event.plain_result(f"收到！当前排队第 {position} 位，轮到后将开始解题...")
+                    else:
+                        yield event.plain_result("收到！正在处理题目...")
+                    with stage("solver_wait"):
+                        await solver_ticket.wait()
+                    self._metrics.count("solver_prompt", job.prompt_kind)
+                    record_size("prompt_chars", len(SOLVER_PROMPTS[job.prompt_kind]) + len(combined_question))
+                    if bool((self.config or {}).get("stream_sections", False)):
+                        async for result in self._stream_solution(event, job, shared, solver_ticket):
+                            yield result
+                    else:
+                        with stage("solver"):
+                            job.solver_text = await self._solve_text(job)
+                except Exception as e:
+                    emsg = str(e)
+                    logger.error(f"调用解题模型时出错: {emsg}", exc_info=True)
+                    hint = self._solver_error_hint(job, emsg)
+                    if hint:
+                        self._set_outcome("error")
+                        yield self._final(event, shared, "plain", hint)
+                        return
+                    raise
+                finally:
+                    solver_ticket.release()
+
+                # 按实际给出解答的候选存入缓存
+                if job.solver_text and job.solver_used is not None and self._solver_cache is not None:
+                    await self._solver_cache.set(self._solver_cache_key(job.solver_used, job), job.solver_text)
+
+            solver_text = job.solver_text
+            record_size("completion_chars", len(solver_text))
+            logger.debug("解答（前 1000 字符）：%s", solver_text[:1000])
 
             if not solver_text:
-                yield event.plain_result("❌ 解题模型未返回任何内容。")
+                self._set_outcome("error")
+                yield self._final(event, shared, "plain", "❌ 解题模型未返回任何内容。")
                 return
 
-            yield event.plain_result("获取完毕，开始渲染...")
-
-            # 6. 不做任何转义，直接传递给模板
-            # marked.js 会自动转义代码块中的 HTML 字符（如 <iostream>）
-            # Jinja2 注释标记 {# #} 在实际内容中极少出现，暂不处理
-            
-            # 7. 构建 HTML 渲染数据
-            html_data = {
-                "question": combined_question,
-                "content": solver_text,  # 直接使用原始文本
-            }
+            if job.sections:
+                logger.info("流式模式：解答已分 %d 段发送", job.sections)
+                return
 
-            # 8. 使用 Star.html_render 或本地渲染生成图片并返回
-            prefer_local = bool((self.config or {}).get("prefer_local_render", False))
-            local_scale = int((self.config or {}).get("local_device_scale", 2) or 2)
+            # 4. 渲染为图片并返回；足够简短的纯文字解答直接以文字发送
+            bundle = await self._job_bundle(job)
+            if self._simple_backend(bundle, combined_question, solver_text) == "text":
+                logger.info("简单解答（%d 字符），直接以文字发送", len(solver_text))
+                self._metrics.count("render_backend", "text")
+                yield self._final(event, shared, "plain", to_plain_text(solver_text))
+                return
 
+            yield event.plain_result("获取完毕，开始渲染...")
             try:
-                final_tpl, _katex_css, _katex_js, _autorender_js, _marked_js = self._build_template()
-
-                html_data_with_assets = {
-                    **html_data,
-                    "KATEX_CSS": _katex_css,
-                    "KATEX_JS": _katex_js,
-                    "AUTORENDER_JS": _autorender_js,
-                    "MARKED_JS": _marked_js,
-                }
-
-                async def do_remote():
-                    return await self.html_render(
-                        final_tpl,
-                        html_data_with_assets,
-                        options={
-                            "full_page": True,
-                            "type": "png",
-                            "scale": "device",
-                        },
-                    )
-
-                async def do_local():
-                    html_str = Template(final_tpl).render(**html_data_with_assets)
-                    return await self._render_locally(html_str, device_scale=local_scale, full_page=True)
-
-                if prefer_local:
-                    try:
-                        path = await do_local()
-                        yield event.image_result(path)
-                    except Exception:
-                        logger.exception("本地渲染失败，尝试远端渲染...")
-                        url = await do_remote()
-                        yield event.image_result(url)
-                else:
-                    try:
-                        url = await do_remote()
-                        yield event.image_result(url)
-                    except Exception:
-                        logger.exception("远端渲染失败，尝试本地渲染...")
-                        path = await do_local()
-                        yield event.image_result(path)
+                # 分页的多张图片作为一条消息按顺序发送，不会被其他消息插入其间
+                outs = await self._render_answer(bundle, combined_question, solver_text, group, user)
+                kind, payload = await self._image_payload(outs)
+                t0 = time.perf_counter()
+                yield self._final(event, shared, kind, payload)
+                record_stage("send", time.perf_counter() - t0)
             except Exception:
                 logger.exception("渲染全部失败，退回为文本结果")
-                yield event.plain_result(f"题目：\n{combined_question}\n\n{solver_text}")
+                self._set_outcome("render_failed")
+                yield self._final(event, shared, "plain", f"题目：\n{combined_question}\n\n{solver_text}")
 
         except Exception as e:
             logger.exception("处理 /g 指令出错")
-            yield event.plain_result(f"发生错误: {e}")
+            self._set_outcome("error")
+            yield self._final(event, shared, "plain", f"发生错误: {e}")
+        finally:
+            # 预热任务不取消：它很快结束，中途取消反而可能留下半创建的页面
+            if leader_key:
+                self._flights.finish(leader_key, shared)
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("g_cache")
+    async def manage_cache(self, event: AstrMessageEvent, action: str = "", target: str = "all"):
+        """/g_cache [clear [solver|ocr|image|all]]  查看或清空插件缓存（仅管理员）。"""
+        caches = {"solver": self._solver_cache, "ocr": self._ocr_cache, "image": self._image_cache}
+        if action == "clear":
+            if target != "all" and target not in caches:
+                yield event.plain_result(f"未知的缓存类型: {target}，可选: {', '.join(caches)} 或 all")
+                return
+            lines = []
+            for name, cache in caches.items():
+                if cache is None or target not in ("all", name):
+                    continue
+                if isinstance(cache, DiskCache):
+                    removed = await asyncio.to_thread(cache.clear)
+                else:
+                    removed = await cache.clear()
+                lines.append(f"{name}: 已清除 {removed} 个磁盘条目")
+            yield event.plain_result("🧹 缓存已清空\n" + ("\n".join(lines) or "（未启用任何缓存）"))
+            return
+
+        lines = ["📦 缓存状态"]
+        for name, cache in caches.items():
+            if cache is None:
+                lines.append(f"{name}: 未启用")
+                continue
+            st = await asyncio.to_thread(cache.stats) if isinstance(cache, DiskCache) else cache.stats()
+            lines.append(f"{name}: " + ", ".join(f"{k}={v}" for k, v in st.items()))
+        lines.append("用法: /g_cache clear [solver|ocr|image|all]")
+        yield event.plain_result("\n".join(lines))
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("g_stats")
+    async def show_stats(self, event: AstrMessageEvent, action: str = ""):
+        """/g_stats [prom|reset]  查看 /g 各阶段耗时与大小的滚动分位数（仅管理员）。"""
+        if action == "reset":
+            self._metrics.reset()
+            yield event.plain_result("📊 统计已清空")
+            return
+        if action == "prom":
+            yield event.plain_result(self._metrics.prometheus(_METRICS_PREFIX, _METRICS_LABELS))
+            return
+
+        snapshot = self._metrics.snapshot()
+        requests = self._metrics.counters().get("requests", {})
+        lines = [f"📊 /g 请求统计（分位数取最近 {self._metrics.window} 次）"]
+        lines.append("请求: " + (", ".join(f"{k}={v}" for k, v in sorted(requests.items())) or "暂无"))
+        backends = self._metrics.counters().get("render_backend", {})
+        if backends:
+            lines.append("渲染方式: " + ", ".join(f"{k}={v}" for k, v in sorted(backends.items())))
+        prompts = self._metrics.counters().get("solver_prompt", {})
+        if prompts:
+            lines.append("解题提示词: " + ", ".join(f"{k}={v}" for k, v in sorted(prompts.items())))
+        cache_hits = self._metrics.counters().get("cache_hits", {})
+        if cache_hits:
+            lines.append("缓存命中: " + ", ".join(f"{k}={v}" for k, v in sorted(cache_hits.items())))
+
+        def order(label: str) -> Tuple[int, str]:
+            return (_STAGE_ORDER.index(label) if label in _STAGE_ORDER else len(_STAGE_ORDER), label)
+
+        stages = snapshot.get("stage_seconds", {})
+        if stages:
+            lines.append("阶段耗时（p50 / p95 / p99）:")
+            for label in sorted(stages, key=order):
+                count, _total, qs = stages[label]
+                lines.append(f"  {label}: " + " / ".join(f"{q * 1000:.0f}ms" for q in qs) + f"（{count} 次）")
+        sizes = snapshot.get("size", {})
+        if sizes:
+            lines.append("大小（p50 / p95 / p99）:")
+            for label in sorted(sizes):
+                count, _total, qs = sizes[label]
+                lines.append(f"  {label}: " + " / ".join(f"{q:.0f}" for q in qs) + f"（{count} 次）")
+        lines.append("用法: /g_stats [prom|reset]")
+        yield event.plain_result("\n".join(lines))
 
     async def terminate(self):
+        # 预取任务使用 self._http，须在关闭会话前结束
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            try:
+                await self._prefetch_task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                logger.warning("渲染资源预取失败", exc_info=True)
+            self._prefetch_task = None
+        if self._render_workers is not None:
+            await self._render_workers.close()
+            self._render_workers = None
+        if self._prerenderer is not None:
+            await self._prerenderer.close()
+        if self._browser_pool is not None:
+            await self._browser_pool.close()
+            self._browser_pool = None
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        if self._spool is not None:
+            await self._spool.stop()
         logger.info("astrbot_teacher 卸载")
@@ -0,0 +1,169 @@
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+# 对外展示的分位数
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Series:
+    __slots__ = ("values", "count", "total")
+
+    def __init__(self, window: int):
+        self.values: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def quantile(self, q: float) -> float:
+        if not self.values:
+            return 0.0
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class Metrics:
+    """进程内的滚动指标。
+
+    - observe(family, label, value)：记录一次观测，每个序列保留最近 window 个值用于计算分位数，
+      另外累计全部观测的次数与总和
+    - count(family, label)：单调递增计数
+    - snapshot() / prometheus()：供管理员命令与 Prometheus 文本格式导出
+    """
+
+    def __init__(self, window: int = 512):
+        self.window = max(1, int(window))
+        self._series: Dict[str, Dict[str, _Series]] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def observe(self, family: str, label: str, value: float) -> None:
+        series = self._series.setdefault(family, {}).get(label)
+        if series is None:
+            series = self._series[family][label] = _Series(self.window)
+        series.values.append(float(value))
+        series.count += 1
+        series.total += float(value)
+
+    def count(self, family: str, label: str, n: int = 1) -> None:
+        counters = self._counters.setdefault(family, {})
+        counters[label] = counters.get(label, 0) + n
+
+    def reset(self) -> None:
+        self._series.clear()
+        self._counters.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, Tuple[int, float, List[float]]]]:
+        """{family: {label: (次数, 总和, [p50, p95, p99])}}，分位数基于最近 window 次观测。"""
+        return {
+            family: {
+                label: (s.count, s.total, [s.quantile(q) for q in QUANTILES])
+                for label, s in series.items()
+            }
+            for family, series in self._series.items()
+        }
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        return {family: dict(c) for family, c in self._counters.items()}
+
+    def prometheus(self, prefix: str, label_names: Optional[Dict[str, str]] = None) -> str:
+        """导出为 Prometheus 文本格式：观测序列为 summary，计数为 counter。
+
+        label_names 指定每个 family 使用的标签名，未指定时为 "name"。
+        """
+        label_names = label_names or {}
+        lines: List[str] = []
+        for family, series in sorted(self._series.items()):
+            metric = f"{prefix}_{family}"
+            label = label_names.get(family, "name")
+            lines.append(f"# TYPE {metric} summary")
+            for value_label, s in sorted(series.items()):
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{{label}="{value_label}",quantile="{q}"}} {s.quantile(q):.6g}')
+                lines.append(f'{metric}_sum{{{label}="{value_label}"}} {s.total:.6g}')
+                lines.append(f'{metric}_count{{{label}="{value_label}"}} {s.count}')
+        for family, counters in sorted(self._counters.items()):
+            metric = f"{prefix}_{family}_total"
+            label = label_names.get(family, "name")
+            lines.append(f"# TYPE {metric} counter")
+            for value_label, n in sorted(counters.items()):
+                lines.append(f'{metric}{{{label}="{value_label}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """一次请求的分阶段耗时（秒）与大小记录；同名阶段多次出现时累加。"""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.sizes: Dict[str, float] = {}
+        self.outcome = "ok"
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + max(0.0, float(seconds))
+
+    def add_size(self, name: str, value: float) -> None:
+        self.sizes[name] = self.sizes.get(name, 0.0) + float(value)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - t0)
+
+    def summary(self) -> str:
+        parts = [f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.stages.items()]
+        parts += [f"{name}={value:.0f}" for name, value in self.sizes.items()]
+        return f"{self.outcome}，总计 {self.elapsed * 1000:.0f}ms：" + ", ".join(parts)
+
+
+# 当前请求的 Trace；asyncio 任务创建时复制上下文，因此并发的子任务记录到同一个 Trace
+_current: ContextVar[Optional[Trace]] = ContextVar("astrbot_teacher_trace", default=None)
+
+
+@contextmanager
+def tracing(trace: Trace) -> Iterator[Trace]:
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # 异步生成器在其他上下文中被关闭（如被回收时），此时无需恢复
+            pass
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """在当前请求的 Trace 中为一个阶段计时；不在请求上下文中时什么也不做。"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def record_stage(name: str, seconds: float) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+
+
+def record_size(name: str, value: float) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.add_size(name, value)
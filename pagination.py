@@ -0,0 +1,148 @@
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# 本模块也会被独立的渲染 worker 进程导入，因此不依赖 AstrBot；在插件进程内与 astrbot.api.logger 为同一个 logger
+logger = logging.getLogger("astrbot")
+
+# 截图体积预估用的每设备像素字节数（白底卡片的经验值），仅用于决定是否降到 1 倍缩放
+BYTES_PER_PIXEL = {"png": 0.3, "jpeg": 0.15, "webp": 0.08}
+
+# 页面脚本置位完成标记（预渲染页面无脚本，只需等字体），且自定义字体已加载
+READY_JS = (
+    "() => (window.__teacherRenderDone === true || document.documentElement.dataset.prerendered === '1')"
+    " && (!document.fonts || document.fonts.status === 'loaded')"
+)
+
+# 在页面中收集分页所需的布局信息：页面尺寸与 .content 下每个块级元素的顶部位置（是否为标题）
+LAYOUT_JS = """
+() => {
+    const doc = document.documentElement;
+    const content = document.getElementById('markdown-content');
+    const blocks = [];
+    if (content) {
+        for (const el of content.children) {
+            const top = el.getBoundingClientRect().top + window.scrollY;
+            blocks.push([top, /^H[1-6]$/.test(el.tagName)]);
+        }
+    }
+    return {width: doc.scrollWidth, height: doc.scrollHeight, blocks: blocks};
+}
+"""
+
+
+def plan_pages(
+    blocks: Sequence[Tuple[float, bool]],
+    total_height: float,
+    max_height: float,
+    *,
+    max_pages: int = 20,
+) -> List[Tuple[float, float]]:
+    """按块边界把页面切成若干段，返回 [(起点, 高度), ...]。
+
+    只在块级元素的顶部下刀，不切开段落、公式或代码块；窗口后半段有标题时优先在标题处分页。
+    单个块高于 max_height 时该页允许超高；页数达到 max_pages 后剩余内容并入最后一页。
+    """
+    if max_height <= 0 or total_height <= max_height:
+        return [(0.0, float(total_height))]
+
+    candidates = sorted({(float(top), heading) for top, heading in blocks if 0 < top < total_height})
+    cuts: List[float] = [0.0]
+    start = 0.0
+    while total_height - start > max_height and len(cuts) < max_pages:
+        window = [(top, heading) for top, heading in candidates if start < top <= start + max_height]
+        headings = [top for top, heading in window if heading and top >= start + max_height / 2]
+        if headings:
+            cut = headings[-1]
+        elif window:
+            cut = window[-1][0]
+        else:
+            # 窗口内没有任何块边界：当前块本身超高，在它结束（下一个边界）处分页
+            later = [top for top, _heading in candidates if top > start]
+            if not later:
+                break
+            cut = later[0]
+        cuts.append(cut)
+        start = cut
+
+    bounds = cuts + [float(total_height)]
+    return [(top, bottom - top) for top, bottom in zip(bounds, bounds[1:]) if bottom > top]
+
+
+async def capture_pages(
+    page: Any,
+    new_path: Callable[[], str],
+    *,
+    device_scale: int = 2,
+    full_page: bool = True,
+    max_page_height: int = 0,
+    max_pages: int = 20,
+    shot_type: str = "png",
+    quality: int = 85,
+    size_format: str = "png",
+    max_bytes: int = 0,
+    ready_timeout_ms: int = 5000,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[str]:
+    """对已打开的页面截图，返回按顺序排列的图片路径；new_path 为每一页生成输出路径。
+
+    max_page_height > 0 时，高于该值的页面在 .content 的块边界处分页，逐页裁剪截图。
+    size_format 为最终输出格式，用于按字节预算预估是否降到 1 倍缩放。
+    给出 timings 时写入 wait_ready / layout / screenshot 各步耗时（秒）。
+    """
+    timings = timings if timings is not None else {}
+    t0 = time.perf_counter()
+    # 等待完成标记，超时则按现状截图
+    try:
+        await page.wait_for_function(READY_JS, timeout=ready_timeout_ms)
+    except Exception:
+        logger.warning("等待渲染完成标记超时（%d ms），直接截图", ready_timeout_ms)
+
+    t1 = time.perf_counter()
+    timings["wait_ready"] = t1 - t0
+    layout = await page.evaluate(LAYOUT_JS)
+    width, height = layout["width"], layout["height"]
+    pages = [(0.0, float(height))]
+    if full_page and max_page_height > 0:
+        pages = plan_pages(
+            [(top, heading) for top, heading in layout["blocks"]],
+            height,
+            max_page_height,
+            max_pages=max_pages,
+        )
+        if len(pages) > 1:
+            logger.info("页面高 %d px，按块边界分为 %d 页截图", height, len(pages))
+
+    # 按（最高一页的）尺寸预估截图体积，明显超出字节预算时改用 1 倍（CSS 像素）截图，省去大图的编码与缩放
+    scale_mode = "device"
+    if max_bytes and device_scale > 1:
+        tallest = max(h for _top, h in pages)
+        estimate = width * tallest * device_scale * device_scale * BYTES_PER_PIXEL.get(size_format, 0.3)
+        if estimate > max_bytes:
+            logger.info(
+                "页面 %dx%d 预估 %.0f KB 超出预算 %.0f KB，以 1 倍缩放截图",
+                width, tallest, estimate / 1024, max_bytes / 1024,
+            )
+            scale_mode = "css"
+
+    t2 = time.perf_counter()
+    timings["layout"] = t2 - t1
+    outs: List[str] = []
+    for top, page_height in pages:
+        out_path = new_path()
+        shot_opts = {
+            "path": out_path,
+            "type": shot_type,
+            "quality": quality if shot_type == "jpeg" else None,
+            "scale": scale_mode,
+        }
+        if len(pages) > 1:
+            # full_page 下 clip 以整页左上角为原点，可截取视口之外的区域
+            shot_opts["clip"] = {"x": 0, "y": top, "width": width, "height": page_height}
+            shot_opts["full_page"] = True
+        else:
+            shot_opts["full_page"] = full_page
+        await page.screenshot(**shot_opts)
+        outs.append(out_path)
+    timings["screenshot"] = time.perf_counter() - t2
+    return outs
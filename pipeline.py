@@ -0,0 +1,63 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, List, Optional, TypeVar
+
+from astrbot.api import logger
+
+T = TypeVar("T")
+
+
+class StageTimeout(Exception):
+    """某个处理阶段超过了它的时间上限。"""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"{stage} 阶段超过 {timeout:.0f} 秒未完成")
+        self.stage = stage
+        self.timeout = timeout
+
+
+async def run_stage(stage: str, awaitable: Awaitable[T], timeout: float) -> T:
+    """以 timeout 秒为上限执行一个阶段，超时抛出 StageTimeout；timeout <= 0 表示不限。"""
+    if timeout <= 0:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        raise StageTimeout(stage, timeout) from None
+
+
+def start_background(name: str, awaitable: Awaitable[T]) -> "asyncio.Task[T]":
+    """启动与主流程重叠执行的准备工作；失败只记录日志，由使用方决定是否退回同步路径。"""
+    task = asyncio.ensure_future(awaitable)
+
+    def _done(t: "asyncio.Task[T]") -> None:
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("后台准备任务 %s 失败: %s", name, t.exception())
+
+    task.add_done_callback(_done)
+    return task
+
+
+@dataclass
+class SolveJob:
+    """一次 /g 请求在各阶段之间传递的状态。"""
+
+    group: str
+    user: str
+    base_question: str
+    image_urls: List[str]
+    images: List[Optional[bytes]]
+    solver_chain: List[Any]
+    ocr_chain: List[Any]
+    ocr_text: str = ""
+    solver_text: str = ""
+    # 实际产出 solver_text 的候选（可能是故障转移后的备用 Provider）
+    solver_used: Optional[Any] = None
+    prompt_kind: str = "full"
+    sections: int = 0
+    warmup: Optional["asyncio.Task[Any]"] = field(default=None, repr=False)
+
+    @property
+    def question(self) -> str:
+        """合并用户输入的文字题目与 OCR 结果。"""
+        return "\n".join([s for s in (self.base_question, self.ocr_text) if s]).strip()
@@ -0,0 +1,155 @@
+import asyncio
+import html
+import re
+from typing import Any, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .assets import AssetStore
+from .cache import LRUCache
+from .render_pool import BrowserPool
+
+# 与 auto-render 的分隔符一致：先匹配 $$...$$，再匹配 $...$
+_MATH = (
+    r"(?<!\\)\$\$(?P<display>[\s\S]+?)(?<!\\)\$\$"
+    r"|(?<!\\)\$(?P<inline>[^$]+?)(?<!\\)\$"
+)
+_MATH_RE = re.compile(_MATH)
+# Markdown 中的代码（围栏代码块 / 行内代码）原样保留，auto-render 同样会跳过 <pre>/<code>
+_MATH_OR_CODE_RE = re.compile(r"(?P<code>```[\s\S]*?```|~~~[\s\S]*?~~~|`[^`\n]*`)|" + _MATH)
+_PLACEHOLDER = "TEACHERMATH{}X"
+_PLACEHOLDER_RE = re.compile(r"TEACHERMATH(\d+)X")
+
+_WORKER_JS = """
+([md, formulas]) => {
+    const rendered = formulas.map(([tex, display]) => {
+        try {
+            return katex.renderToString(tex, {displayMode: display, throwOnError: false});
+        } catch (e) {
+            return null;
+        }
+    });
+    return {html: md === null ? null : marked.parse(md), rendered: rendered};
+}
+"""
+
+
+def split_math(text: str, *, skip_code: bool = True) -> Tuple[str, List[Tuple[str, bool]]]:
+    """将公式替换为占位符，返回 (替换后文本, [(tex, 是否块级), ...])。
+
+    skip_code=False 用于题目框这类纯文本：其中没有代码语义，反引号内的公式同样渲染。
+    """
+    formulas: List[Tuple[str, bool]] = []
+
+    def repl(m: "re.Match[str]") -> str:
+        if m.groupdict().get("code") is not None:
+            return m.group(0)
+        display = m.group("display") is not None
+        formulas.append((m.group("display") if display else m.group("inline"), display))
+        return _PLACEHOLDER.format(len(formulas) - 1)
+
+    pattern = _MATH_OR_CODE_RE if skip_code else _MATH_RE
+    return pattern.sub(repl, text), formulas
+
+
+class KatexPrerenderer:
+    """在常驻的 worker 页面中把 Markdown 与公式预先转换成静态 HTML。
+
+    公式渲染结果按 (tex, 块级) 缓存在有界 LRU 中，重复出现的公式不会再次进入浏览器；
+    截图页面因此只需加载 KaTeX CSS，不必再执行 marked / auto-render。
+    """
+
+    def __init__(self, pool: BrowserPool, assets: AssetStore, *, cache_items: int = 4096, max_page_uses: int = 500):
+        self.pool = pool
+        self.assets = assets
+        self.cache = LRUCache(cache_items)
+        self.max_page_uses = max(1, int(max_page_uses))
+        self._page: Any = None
+        self._uses = 0
+        self._lock = asyncio.Lock()
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._close_page()
+
+    async def _close_page(self) -> None:
+        page, self._page = self._page, None
+        if page is not None:
+            try:
+                await page.context.close()
+            except Exception:
+                pass
+
+    async def warm(self) -> None:
+        """提前创建 worker 页面并加载脚本，使首次预渲染无需等待。"""
+        async with self._lock:
+            ready = self._page is not None and not self._page.is_closed()
+        if not ready:
+            await self._worker()
+
+    async def _worker(self) -> Any:
+        async with self._lock:
+            if self._page is not None and (self._page.is_closed() or self._uses >= self.max_page_uses):
+                await self._close_page()
+            if self._page is None:
+                page = await self.pool.open_page(1)
+                worker_html = (
+                    "<!doctype html><html><head><meta charset=\"utf-8\" />"
+                    f"<script src=\"{self.assets.url('/katex/katex.min.js')}\"></script>"
+                    f"<script src=\"{self.assets.url('/marked/marked.min.js')}\"></script>"
+                    "</head><body></body></html>"
+                )
+                url = self.assets.put_page(worker_html)
+                try:
+                    await page.goto(url, wait_until="load")
+                    await page.wait_for_function("() => window.katex && window.marked", timeout=10000)
+                except Exception:
+                    await page.context.close()
+                    raise
+                finally:
+                    self.assets.discard_page(url)
+                self._page, self._uses = page, 0
+            self._uses += 1
+            return self._page
+
+    async def _render(self, md: Optional[str], formulas: List[Tuple[str, bool]]) -> Tuple[Optional[str], List[str]]:
+        out: List[Optional[str]] = [self.cache.get(f"{int(d)}:{tex}") for tex, d in formulas]
+        missing = [i for i, v in enumerate(out) if v is None]
+        result_html = None
+        if md is not None or missing:
+            page = await self._worker()
+            try:
+                res = await page.evaluate(_WORKER_JS, [md, [list(formulas[i]) for i in missing]])
+            except Exception:
+                # worker 页面可能已随浏览器重启失效，下一次调用时重建
+                async with self._lock:
+                    await self._close_page()
+                raise
+            result_html = res.get("html")
+            for i, rendered in zip(missing, res.get("rendered") or []):
+                if rendered is not None:
+                    tex, display = formulas[i]
+                    self.cache.set(f"{int(display)}:{tex}", rendered)
+                out[i] = rendered
+        if missing:
+            logger.debug("公式预渲染：共 %d 个，缓存命中 %d 个", len(formulas), len(formulas) - len(missing))
+
+        final: List[str] = []
+        for (tex, display), rendered in zip(formulas, out):
+            if rendered is None:
+                delim = "$$" if display else "$"
+                rendered = html.escape(f"{delim}{tex}{delim}")
+            final.append(rendered)
+        return result_html, final
+
+    async def render_markdown(self, md: str) -> str:
+        """Markdown → 静态 HTML（公式已替换为 KaTeX 输出）。"""
+        text, formulas = split_math(md)
+        content_html, rendered = await self._render(text, formulas)
+        return _PLACEHOLDER_RE.sub(lambda m: rendered[int(m.group(1))], content_html or "")
+
+    async def render_text(self, text: str) -> str:
+        """纯文本（题目框）→ HTML：转义文本并渲染其中的公式。"""
+        plain, formulas = split_math(text, skip_code=False)
+        _html, rendered = await self._render(None, formulas)
+        return _PLACEHOLDER_RE.sub(lambda m: rendered[int(m.group(1))], html.escape(plain))
@@ -0,0 +1,169 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .resilience import CircuitBreaker, hedged
+from .streaming import iter_completion
+
+
+@dataclass(frozen=True)
+class ProviderChoice:
+    """候选链中的一项：Provider 实例、模型名与单次调用超时。"""
+
+    provider: Any
+    provider_id: str
+    model: Optional[str]
+    timeout: float
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider_id}/{self.model or '默认模型'}"
+
+
+def parse_provider_spec(entry: str) -> Tuple[str, Optional[str], Optional[float]]:
+    """解析备用 Provider 配置项：`provider_id[/model][@超时秒数]`。"""
+    spec = str(entry).strip()
+    timeout: Optional[float] = None
+    head, sep, tail = spec.rpartition("@")
+    if sep:
+        try:
+            timeout = float(tail)
+            spec = head
+        except ValueError:
+            pass
+    provider_id, _, model = spec.partition("/")
+    return provider_id.strip(), (model.strip() or None), timeout
+
+
+class ProviderRouter:
+    """按候选链调用 LLM：自动故障转移、可选对冲，并依据近期统计调整尝试顺序。
+
+    每个 Provider/模型 组合有独立的熔断器；错误率较高或处于熔断中的候选会被排到后面，
+    错误率相同时按近期成功调用的耗时中位数（取整到秒）排序，尚无耗时数据的排在有数据的之后，
+    其余情况保持配置顺序。调用超过超时时间的一半即视为过慢并计入错误率。
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        *,
+        hedge_delay: Optional[float] = None,
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 60,
+    ):
+        self.stage = stage
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def _breaker(self, choice: ProviderChoice) -> CircuitBreaker:
+        breaker = self.breakers.get(choice.name)
+        if breaker is None:
+            breaker = self.breakers[choice.name] = CircuitBreaker(
+                f"{self.stage}:{choice.name}",
+                failure_threshold=self.failure_threshold,
+                cooldown_seconds=self.cooldown_seconds,
+                slow_seconds=choice.timeout / 2,
+            )
+        return breaker
+
+    def order(self, choices: Iterable[ProviderChoice]) -> List[ProviderChoice]:
+        ranked = sorted(
+            enumerate(choices),
+            key=lambda item: (
+                self._breaker(item[1]).state == "open",
+                round(self._breaker(item[1]).error_rate, 1),
+                round(self._breaker(item[1]).latency) if self._breaker(item[1]).latency else float("inf"),
+                item[0],
+            ),
+        )
+        return [c for _i, c in ranked]
+
+    async def _call(self, choice: ProviderChoice, kwargs: Dict[str, Any]) -> Tuple[Any, ProviderChoice]:
+        func = getattr(choice.provider, "text_chat", None)
+        if not callable(func):
+            raise RuntimeError("所选 Provider 不支持 text_chat 方法")
+        try:
+            resp = await asyncio.wait_for(func(**kwargs, model=choice.model), timeout=choice.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{choice.name} 超过 {choice.timeout:.0f} 秒未返回") from None
+        if not (resp and (resp.completion_text or "").strip()):
+            raise RuntimeError(f"{choice.name} 未返回任何内容")
+        return resp, choice
+
+    async def chat(self, choices: Iterable[ProviderChoice], **kwargs: Any) -> Tuple[Any, ProviderChoice]:
+        """依次（或对冲地）调用候选链，返回 (响应, 实际使用的候选)；全部失败时抛出最后一个异常。"""
+        ordered = self.order(choices)
+        if not ordered:
+            raise RuntimeError(f"没有可用的 {self.stage} Provider")
+        attempts = [(c.name, (lambda c=c: self._call(c, kwargs))) for c in ordered]
+        breakers = {c.name: self._breaker(c) for c in ordered}
+        resp, used = await hedged(attempts, breakers=breakers, delay=self.hedge_delay)
+        if used is not ordered[0]:
+            logger.info("%s 已故障转移至 %s", self.stage, used.name)
+        return resp, used
+
+    async def stream(
+        self,
+        choices: Iterable[ProviderChoice],
+        *,
+        on_choice: Optional[Callable[[ProviderChoice], None]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """流式调用：收到首个分片之前失败或超时可转移到下一个候选，之后的错误直接抛出。
+
+        timeout 在流式模式下作为相邻两个分片之间的最长等待时间；
+        on_choice 在收到首个分片时以实际使用的候选调用一次。
+        """
+        ordered = self.order(choices)
+        if not ordered:
+            raise RuntimeError(f"没有可用的 {self.stage} Provider")
+        last_exc: Optional[BaseException] = None
+        loop = asyncio.get_running_loop()
+        attempted = False
+        # 第二轮仅在全部候选都处于熔断状态时进行：此时忽略熔断，按顺序尝试
+        for bypass in (False, True):
+            if attempted:
+                break
+            for choice in ordered:
+                breaker = self._breaker(choice)
+                if not bypass and not breaker.allow():
+                    logger.info("%s 处于熔断状态，已跳过", choice.name)
+                    continue
+                attempted = True
+                started = loop.time()
+                received = False
+                chunks = iter_completion(choice.provider, **kwargs, model=choice.model).__aiter__()
+                try:
+                    while True:
+                        try:
+                            delta = await asyncio.wait_for(chunks.__anext__(), timeout=choice.timeout)
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            raise TimeoutError(f"{choice.name} 超过 {choice.timeout:.0f} 秒无输出") from None
+                        if not received:
+                            # 首个分片的等待时间即为该候选的响应延迟
+                            received = True
+                            breaker.record(True, loop.time() - started)
+                            if choice is not ordered[0]:
+                                logger.info("%s 已故障转移至 %s", self.stage, choice.name)
+                            if on_choice is not None:
+                                on_choice(choice)
+                        yield delta
+                    if not received:
+                        raise RuntimeError(f"{choice.name} 未返回任何内容")
+                    return
+                except Exception as e:
+                    if received:
+                        raise
+                    breaker.record(False, loop.time() - started)
+                    last_exc = e
+                    logger.warning("%s 流式请求失败，尝试下一个候选: %s", choice.name, e)
+                finally:
+                    breaker.release_probe()
+                    await chunks.aclose()
+        raise last_exc or RuntimeError(f"没有可用的 {self.stage} Provider")
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+# 本模块也会被独立的渲染 worker 进程导入，因此不依赖 AstrBot；在插件进程内与 astrbot.api.logger 为同一个 logger
+logger = logging.getLogger("astrbot")
+
+
+class _PooledPage:
+    """池中的一个页面：每个页面独占一个 BrowserContext，便于按缩放倍率隔离。"""
+
+    __slots__ = ("context", "page", "uses", "generation")
+
+    def __init__(self, context: Any, page: Any, generation: int):
+        self.context = context
+        self.page = page
+        self.uses = 0
+        self.generation = generation
+
+
+class _ScaleSlot:
+    """某个 device_scale_factor 对应的页面子池。"""
+
+    def __init__(self):
+        self.idle: List[_PooledPage] = []
+        self.count = 0
+        self.cond = asyncio.Condition()
+
+
+class BrowserPool:
+    """常驻 Chromium 与按 device_scale_factor 分组的有界页面池。
+
+    - start() 启动浏览器并预热页面；close() 关闭全部资源
+    - page(scale) 以上下文管理器方式借出页面，用完自动归还
+    - 页面使用次数达到上限或 JS 堆超过阈值时回收重建
+    - 浏览器崩溃/断开后，下一次借用时自动重启
+    - on_new_context 在每个新建的 BrowserContext 上调用（如注册资源路由）
+    """
+
+    def __init__(
+        self,
+        *,
+        pages_per_scale: int = 2,
+        max_page_uses: int = 50,
+        max_page_heap_mb: int = 256,
+        launch_args: Optional[List[str]] = None,
+        on_new_context: Optional[Callable[[Any], Awaitable[None]]] = None,
+    ):
+        self.pages_per_scale = max(1, int(pages_per_scale))
+        self.max_page_uses = max(1, int(max_page_uses))
+        self.max_page_heap_bytes = max(0, int(max_page_heap_mb)) * 1024 * 1024
+        self.launch_args = launch_args or []
+        self.on_new_context = on_new_context
+
+        self._playwright: Any = None
+        self._browser: Any = None
+        self._generation = 0
+        self._launch_lock = asyncio.Lock()
+        self._slots: Dict[int, _ScaleSlot] = {}
+        self._closed = False
+
+    @property
+    def running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def start(self, prewarm_scales: Optional[List[int]] = None) -> None:
+        """启动浏览器，并为给定缩放倍率预先创建页面。"""
+        self._closed = False
+        await self._ensure_browser()
+        for scale in prewarm_scales or []:
+            slot = self._slot(scale)
+            async with slot.cond:
+                while slot.count < self.pages_per_scale:
+                    pooled = await self._new_page(scale)
+                    slot.count += 1
+                    slot.idle.append(pooled)
+        logger.info("常驻 Chromium 已启动，预热缩放倍率: %s", prewarm_scales or [])
+
+    async def close(self) -> None:
+        """关闭全部页面、浏览器与 Playwright 驱动。"""
+        self._closed = True
+        async with self._launch_lock:
+            for slot in self._slots.values():
+                async with slot.cond:
+                    for pooled in slot.idle:
+                        await self._dispose(pooled)
+                    slot.idle.clear()
+                    slot.count = 0
+                    slot.cond.notify_all()
+            await self._shutdown_browser()
+        logger.info("常驻 Chromium 已关闭")
+
+    @asynccontextmanager
+    async def page(self, device_scale: int = 2) -> AsyncIterator[Any]:
+        """借出一个指定缩放倍率的页面；异常退出时该页面会被丢弃而非归还。"""
+        if self._closed:
+            raise RuntimeError("浏览器池已关闭")
+        pooled = await self._acquire(device_scale)
+        ok = False
+        try:
+            yield pooled.page
+            ok = True
+        finally:
+            await self._release(device_scale, pooled, healthy=ok)
+
+    async def warm(self, device_scale: int = 2) -> None:
+        """确保该缩放倍率的子池有空闲页面可借；已有空闲页面或已达上限时不做任何事。"""
+        if self._closed:
+            return
+        await self._ensure_browser()
+        slot = self._slot(device_scale)
+        async with slot.cond:
+            if slot.idle or slot.count >= self.pages_per_scale:
+                return
+            slot.count += 1
+        try:
+            pooled = await self._new_page(device_scale)
+        except Exception:
+            async with slot.cond:
+                slot.count -= 1
+                slot.cond.notify()
+            raise
+        async with slot.cond:
+            slot.idle.append(pooled)
+            slot.cond.notify()
+
+    async def open_page(self, device_scale: int = 1) -> Any:
+        """创建一个不归池管理的独立页面（常驻 worker 用），调用方负责 page.context.close()。"""
+        await self._ensure_browser()
+        return (await self._new_page(device_scale)).page
+
+    def _slot(self, scale: int) -> _ScaleSlot:
+        slot = self._slots.get(scale)
+        if slot is None:
+            slot = self._slots[scale] = _ScaleSlot()
+        return slot
+
+    async def _ensure_browser(self) -> None:
+        if self.running:
+            return
+        async with self._launch_lock:
+            if self.running:
+                return
+            if self._browser is not None or self._playwright is not None:
+                logger.warning("检测到 Chromium 已断开，正在重启...")
+                await self._shutdown_browser()
+            try:
+                from playwright.async_api import async_playwright  # type: ignore
+            except Exception as e:
+                raise RuntimeError("本地渲染需要安装 playwright，请先 pip install playwright 并执行 playwright install chromium") from e
+
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(args=self.launch_args)
+            self._generation += 1
+            self._browser.on("disconnected", lambda _b: logger.warning("Chromium 进程已断开"))
+
+            # 旧浏览器的页面已全部失效，清空计数让子池重建
+            for slot in self._slots.values():
+                slot.idle.clear()
+                slot.count = 0
+                async with slot.cond:
+                    slot.cond.notify_all()
+
+    async def _shutdown_browser(self) -> None:
+        browser, pw = self._browser, self._playwright
+        self._browser = None
+        self._playwright = None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        if pw is not None:
+            try:
+                await pw.stop()
+            except Exception:
+                pass
+
+    async def _new_page(self, scale: int) -> _PooledPage:
+        context = await self._browser.new_context(device_scale_factor=scale)
+        if self.on_new_context is not None:
+            await self.on_new_context(context)
+        page = await context.new_page()
+        return _PooledPage(context, page, self._generation)
+
+    async def _dispose(self, pooled: _PooledPage) -> None:
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass
+
+    async def _acquire(self, scale: int) -> _PooledPage:
+        await self._ensure_browser()
+        slot = self._slot(scale)
+        async with slot.cond:
+            while True:
+                while slot.idle:
+                    pooled = slot.idle.pop()
+                    if pooled.generation == self._generation and not pooled.page.is_closed():
+                        return pooled
+                    slot.count -= 1
+                    await self._dispose(pooled)
+                if slot.count < self.pages_per_scale:
+                    slot.count += 1
+                    break
+                await slot.cond.wait()
+        try:
+            return await self._new_page(scale)
+        except Exception:
+            async with slot.cond:
+                slot.count -= 1
+                slot.cond.notify()
+            raise
+
+    async def _release(self, scale: int, pooled: _PooledPage, *, healthy: bool) -> None:
+        pooled.uses += 1
+        keep = healthy and pooled.generation == self._generation and not self._closed
+        if keep and pooled.uses >= self.max_page_uses:
+            logger.debug("页面已使用 %d 次，回收重建", pooled.uses)
+            keep = False
+        if keep and self.max_page_heap_bytes:
+            try:
+                heap = await pooled.page.evaluate(
+                    "() => (performance.memory && performance.memory.usedJSHeapSize) || 0"
+                )
+                if int(heap or 0) > self.max_page_heap_bytes:
+                    logger.info("页面 JS 堆 %.1f MB 超过阈值，回收重建", int(heap) / 1024 / 1024)
+                    keep = False
+            except Exception:
+                keep = False
+        if keep:
+            try:
+                await pooled.page.goto("about:blank")
+            except Exception:
+                keep = False
+
+        slot = self._slot(scale)
+        if not keep:
+            await self._dispose(pooled)
+        async with slot.cond:
+            if keep:
+                slot.idle.append(pooled)
+            elif pooled.generation == self._generation:
+                slot.count -= 1
+            slot.cond.notify()
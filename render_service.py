@@ -0,0 +1,302 @@
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .assets import AssetStore
+
+_WORKER_SCRIPT = Path(__file__).with_name("render_worker.py")
+
+# worker 写往 stderr 的日志行以级别名开头，按原级别转发；其余输出（Chromium 提示、异常堆栈）按 WARNING 转发
+_LOG_LEVELS = {name: getattr(logging, name) for name in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")}
+
+
+class RenderWorkerError(RuntimeError):
+    """渲染 worker 返回错误、无法启动或进程已退出。"""
+
+
+class RenderWorkerTimeout(RenderWorkerError):
+    """渲染 worker 未在时限内应答。"""
+
+
+class _WorkerProcess:
+    """一个渲染 worker 子进程及其请求/应答通道（协议见 render_worker.py）。"""
+
+    def __init__(self, index: int, assets: AssetStore, options: Dict[str, Any]):
+        self.index = index
+        self.assets = assets
+        self.options = options
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.lock = asyncio.Lock()
+        self.timeouts = 0
+        self._seq = itertools.count(1)
+        self._pending: Dict[int, "asyncio.Future[Dict[str, Any]]"] = {}
+        self._ready: Optional["asyncio.Future[Dict[str, Any]]"] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    @property
+    def load(self) -> int:
+        return len(self._pending)
+
+    async def start(self, timeout: float) -> None:
+        self._ready = asyncio.get_running_loop().create_future()
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            str(_WORKER_SCRIPT),
+            json.dumps(self.options),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=1024 * 1024,
+        )
+        self._tasks = [
+            asyncio.ensure_future(self._read_replies()),
+            asyncio.ensure_future(self._read_logs()),
+        ]
+        try:
+            await asyncio.wait_for(self._ready, timeout=timeout)
+        except Exception as e:
+            await self.stop()
+            raise RenderWorkerError(f"渲染 worker #{self.index} 启动失败: {e or type(e).__name__}") from e
+        self.timeouts = 0
+        logger.info("渲染 worker #%d 已启动（pid %d）", self.index, self.proc.pid)
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """关闭 stdin 让 worker 自行关闭浏览器并退出；超时仍未退出则强制结束。"""
+        proc, self.proc = self.proc, None
+        if proc is not None and proc.returncode is None:
+            try:
+                proc.stdin.close()
+                await asyncio.wait_for(proc.wait(), timeout=timeout)
+            except Exception:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._fail_pending(RenderWorkerError(f"渲染 worker #{self.index} 已停止"))
+
+    def _fail_pending(self, exc: BaseException) -> None:
+        for fut in [*self._pending.values(), self._ready]:
+            if fut is not None and not fut.done():
+                fut.set_exception(exc)
+        self._pending.clear()
+
+    def _send(self, msg: Dict[str, Any]) -> None:
+        if not self.alive:
+            raise RenderWorkerError(f"渲染 worker #{self.index} 未在运行")
+        self.proc.stdin.write(json.dumps(msg, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    async def call(self, op: str, timeout: float, **payload: Any) -> Dict[str, Any]:
+        """发送一个请求并等待应答；超时后通知 worker 取消该任务并抛出 RenderWorkerTimeout。"""
+        req_id = next(self._seq)
+        fut: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = fut
+        try:
+            self._send({"id": req_id, "op": op, **payload})
+            await self.proc.stdin.drain()
+            reply = await asyncio.wait_for(fut, timeout=timeout)
+        except asyncio.TimeoutError:
+            if op == "render":
+                try:
+                    self._send({"id": next(self._seq), "op": "cancel", "target": req_id})
+                except Exception:
+                    pass
+            raise RenderWorkerTimeout(f"渲染 worker #{self.index} 的 {op} 请求超过 {timeout:.0f} 秒未完成") from None
+        except (ConnectionError, OSError) as e:
+            raise RenderWorkerError(f"渲染 worker #{self.index} 通信失败: {e}") from e
+        finally:
+            self._pending.pop(req_id, None)
+        if not reply.get("ok"):
+            raise RenderWorkerError(f"渲染 worker #{self.index}: {reply.get('error') or '未知错误'}")
+        return reply.get("result") or {}
+
+    async def _read_replies(self) -> None:
+        proc = self.proc
+        try:
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    logger.warning("渲染 worker #%d 输出了无法解析的内容，已忽略", self.index)
+                    continue
+                op = msg.get("op")
+                if op == "ready":
+                    if self._ready is not None and not self._ready.done():
+                        self._ready.set_result(msg)
+                elif op == "asset":
+                    self._tasks.append(asyncio.ensure_future(self._serve_asset(msg)))
+                else:
+                    fut = self._pending.pop(msg.get("id"), None)
+                    if fut is not None and not fut.done():
+                        fut.set_result(msg)
+        finally:
+            if self.proc is proc:
+                self._fail_pending(RenderWorkerError(f"渲染 worker #{self.index} 已退出"))
+
+    async def _read_logs(self) -> None:
+        proc = self.proc
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                break
+            text = line.decode("utf-8", "replace").rstrip()
+            if not text:
+                continue
+            level, _, rest = text.partition(" ")
+            if level in _LOG_LEVELS:
+                logger.log(_LOG_LEVELS[level], "[渲染 worker #%d] %s", self.index, rest)
+            else:
+                logger.warning("[渲染 worker #%d] %s", self.index, text)
+
+    async def _serve_asset(self, msg: Dict[str, Any]) -> None:
+        """应答 worker 的资源请求：与进程内渲染共用同一个 AssetStore（含 CDN 回退与字体缓存）。"""
+        reply: Dict[str, Any] = {"reply": msg.get("id"), "ok": False}
+        try:
+            item = await self.assets.get(str(msg.get("path") or ""))
+            if item is not None:
+                body, ctype = item
+                encoded = await asyncio.to_thread(base64.b64encode, body)
+                reply.update(ok=True, body=encoded.decode("ascii"), content_type=ctype)
+        except Exception:
+            logger.exception("为渲染 worker 提供资源失败: %s", msg.get("path"))
+        try:
+            self._send(reply)
+            await self.proc.stdin.drain()
+        except Exception:
+            pass
+        finally:
+            task = asyncio.current_task()
+            if task in self._tasks:
+                self._tasks.remove(task)
+
+
+class RenderWorkerPool:
+    """进程外渲染：若干 worker 子进程各自运行常驻 Chromium，插件进程只负责派发任务与提供资源。
+
+    - 任务派发给进行中任务最少的 worker；worker 未启动或已退出时先（重新）启动
+    - 每个任务有独立超时，超时后通知 worker 取消；连续超时达到 max_timeouts 次的 worker 视为卡死并重启
+    - 后台定期 ping 已启动的 worker，无应答或进程已退出的会被重启
+    """
+
+    def __init__(
+        self,
+        assets: AssetStore,
+        worker_options: Dict[str, Any],
+        *,
+        size: int = 1,
+        job_timeout: float = 60,
+        health_interval: float = 30,
+        ping_timeout: float = 10,
+        startup_timeout: float = 60,
+        max_timeouts: int = 2,
+    ):
+        self.job_timeout = max(1.0, float(job_timeout))
+        self.health_interval = max(1.0, float(health_interval))
+        self.ping_timeout = max(1.0, float(ping_timeout))
+        self.startup_timeout = max(1.0, float(startup_timeout))
+        self.max_timeouts = max(1, int(max_timeouts))
+        self.restarts = 0
+        self._workers = [_WorkerProcess(i + 1, assets, worker_options) for i in range(max(1, int(size)))]
+        self._health_task: Optional["asyncio.Task[None]"] = None
+        self._closed = False
+
+    @property
+    def running(self) -> bool:
+        return any(w.alive for w in self._workers)
+
+    async def start(self) -> None:
+        """启动全部 worker（各自预热浏览器）与健康检查。"""
+        self._closed = False
+        results = await asyncio.gather(*(self._ensure(w) for w in self._workers), return_exceptions=True)
+        for r in results:
+            if isinstance(r, BaseException):
+                logger.warning("%s", r)
+        self._start_health_check()
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(w.stop() for w in self._workers), return_exceptions=True)
+        logger.info("渲染 worker 已全部关闭")
+
+    async def render(
+        self, html: str, *, out_dir: Path, suffix: str, options: Dict[str, Any]
+    ) -> Tuple[List[str], Dict[str, float]]:
+        """在 worker 中渲染 HTML，返回 (写入 out_dir 的图片路径（按顺序）, worker 内各步耗时)。"""
+        if self._closed:
+            raise RenderWorkerError("渲染 worker 池已关闭")
+        self._start_health_check()
+        worker = min(self._workers, key=lambda w: (not w.alive, w.load))
+        await self._ensure(worker)
+        try:
+            result = await worker.call(
+                "render", self.job_timeout, html=html, out_dir=str(out_dir), suffix=suffix, options=options
+            )
+        except RenderWorkerTimeout:
+            worker.timeouts += 1
+            if worker.timeouts >= self.max_timeouts:
+                logger.warning("渲染 worker #%d 连续 %d 次超时，视为卡死并重启", worker.index, worker.timeouts)
+                asyncio.ensure_future(self._restart(worker))
+            raise
+        worker.timeouts = 0
+        timings = {str(k): float(v) for k, v in (result.get("timings") or {}).items()}
+        return [str(p) for p in result.get("paths") or []], timings
+
+    async def _ensure(self, worker: _WorkerProcess) -> None:
+        async with worker.lock:
+            if worker.alive:
+                return
+            if worker.proc is not None:
+                self.restarts += 1
+                logger.warning("渲染 worker #%d 已退出（返回码 %s），正在重启", worker.index, worker.proc.returncode)
+                await worker.stop()
+            await worker.start(self.startup_timeout)
+
+    async def _restart(self, worker: _WorkerProcess) -> None:
+        async with worker.lock:
+            self.restarts += 1
+            await worker.stop()
+            try:
+                await worker.start(self.startup_timeout)
+            except RenderWorkerError as e:
+                logger.warning("%s，将在下一个任务时重试", e)
+
+    def _start_health_check(self) -> None:
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def _health_loop(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self.health_interval)
+            for worker in self._workers:
+                if worker.proc is None or worker.lock.locked():
+                    # 尚未启动（按需启动）或正在重启
+                    continue
+                try:
+                    if not worker.alive:
+                        raise RenderWorkerError(f"进程已退出（返回码 {worker.proc.returncode}）")
+                    await worker.call("ping", self.ping_timeout)
+                except RenderWorkerError as e:
+                    logger.warning("渲染 worker #%d 健康检查失败: %s，正在重启", worker.index, e)
+                    await self._restart(worker)
+                except Exception:
+                    logger.exception("渲染 worker 健康检查出错")
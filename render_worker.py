@@ -0,0 +1,232 @@
+"""独立的渲染 worker 进程：在 AstrBot 进程之外运行常驻 Chromium，经 stdin/stdout 上的 JSON Lines 与插件通信。
+
+由 render_service.RenderWorkerPool 以 `python render_worker.py '<JSON 选项>'` 启动，不依赖 AstrBot。
+
+请求（插件 → worker，每行一个 JSON 对象）：
+- {"id": n, "op": "render", "html": ..., "out_dir": ..., "suffix": ".png", "options": {...}}
+  打开页面并按 options（pagination.capture_pages 的参数）截图写入 out_dir，
+  返回 {"id": n, "ok": true, "result": {"paths": [...], "timings": {步骤: 秒}}}
+- {"id": n, "op": "ping"}：健康检查，返回浏览器状态与进行中的任务数
+- {"id": n, "op": "cancel", "target": m}：取消仍在进行的任务 m（插件端已超时）
+失败时返回 {"id": n, "ok": false, "error": "..."}；stdin 关闭后 worker 关闭浏览器并退出。
+
+页面引用的虚拟源资源由 worker 反向向插件请求（{"op": "asset", "id": k, "path": ...}），
+插件以 {"reply": k, "ok": ..., "body": base64, "content_type": ...} 应答；页面 HTML 之外的资源在 worker 内缓存。
+stdout 专用于协议：原 stdout 被重定向到 stderr，日志同样写往 stderr，由插件转发到 AstrBot 日志。
+"""
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from pagination import capture_pages  # noqa: E402
+from render_pool import BrowserPool  # noqa: E402
+
+logger = logging.getLogger("astrbot")
+
+# 等待插件返回资源的上限（秒）；首次请求可能需要插件从 CDN 下载
+_ASSET_TIMEOUT = 30.0
+
+# worker 内资源缓存的上限：条目数与总字节数（与插件端 AssetStore 的文件缓存一致）
+_ASSET_CACHE_ITEMS = 1024
+_ASSET_CACHE_BYTES = 128 * 1024 * 1024
+
+
+class _AssetCache:
+    """按条目数与总字节数限制的 LRU；worker 不依赖 AstrBot，故不复用 cache.LRUCache。"""
+
+    def __init__(self, max_items: int, max_bytes: int):
+        self.max_items = max(1, int(max_items))
+        self.max_bytes = max(0, int(max_bytes))
+        self._data: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        item = self._data.get(key)
+        if item is not None:
+            self._data.move_to_end(key)
+        return item
+
+    def set(self, key: str, item: Tuple[bytes, str]) -> None:
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[0])
+        if self.max_bytes and len(item[0]) > self.max_bytes:
+            return
+        self._data[key] = item
+        self._bytes += len(item[0])
+        while len(self._data) > self.max_items or (self.max_bytes and self._bytes > self.max_bytes):
+            _key, (body, _ctype) = self._data.popitem(last=False)
+            self._bytes -= len(body)
+
+
+class RenderWorker:
+    def __init__(self, options: Dict[str, Any], proto: BinaryIO):
+        self.asset_origin = str(options["asset_origin"])
+        self.prewarm_scales = [int(s) for s in options.get("prewarm_scales") or []]
+        self.pool = BrowserPool(
+            pages_per_scale=int(options.get("pages_per_scale", 2) or 2),
+            max_page_uses=int(options.get("max_page_uses", 50) or 50),
+            max_page_heap_mb=int(options.get("max_page_heap_mb", 256) or 0),
+            on_new_context=lambda ctx: ctx.route(f"{self.asset_origin}/**", self.handle_route),
+        )
+        self._proto = proto
+        self._seq = itertools.count(1)
+        self._pages: Dict[str, str] = {}
+        self._assets = _AssetCache(_ASSET_CACHE_ITEMS, _ASSET_CACHE_BYTES)
+        self._asset_waiters: Dict[int, "asyncio.Future[Dict[str, Any]]"] = {}
+        self._jobs: Dict[Any, "asyncio.Task[None]"] = {}
+
+    def _send(self, msg: Dict[str, Any]) -> None:
+        # 应答都很小，直接同步写入管道
+        self._proto.write(json.dumps(msg, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._proto.flush()
+
+    async def _fetch_asset(self, route_path: str) -> Optional[Tuple[bytes, str]]:
+        item = self._assets.get(route_path)
+        if item is not None:
+            return item
+        req_id = next(self._seq)
+        fut: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+        self._asset_waiters[req_id] = fut
+        try:
+            self._send({"op": "asset", "id": req_id, "path": route_path})
+            reply = await asyncio.wait_for(fut, timeout=_ASSET_TIMEOUT)
+        finally:
+            self._asset_waiters.pop(req_id, None)
+        if not reply.get("ok"):
+            return None
+        item = (base64.b64decode(reply.get("body") or ""), str(reply.get("content_type") or ""))
+        self._assets.set(route_path, item)
+        return item
+
+    async def handle_route(self, route: Any) -> None:
+        """Playwright 路由处理器：页面 HTML 取自本进程，其余资源向插件请求。"""
+        route_path = urlparse(route.request.url).path
+        item: Optional[Tuple[bytes, str]] = None
+        try:
+            if route_path.startswith("/page/"):
+                html = self._pages.get(route_path)
+                if html is not None:
+                    item = (html.encode("utf-8"), "text/html; charset=utf-8")
+            else:
+                item = await self._fetch_asset(route_path)
+        except Exception as e:
+            logger.warning("渲染资源获取失败: %s (%s)", route_path, e)
+        if item is None:
+            await route.fulfill(status=404, body=b"")
+            return
+        body, ctype = item
+        await route.fulfill(
+            status=200,
+            body=body,
+            headers={
+                "Content-Type": ctype,
+                "Access-Control-Allow-Origin": "*",
+                "Cache-Control": "no-store" if route_path.startswith("/page/") else "max-age=31536000",
+            },
+        )
+
+    async def render(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        options = dict(msg.get("options") or {})
+        out_dir = Path(msg["out_dir"])
+        suffix = str(msg.get("suffix") or ".png")
+        route_path = f"/page/{uuid.uuid4().hex}.html"
+        self._pages[route_path] = str(msg.get("html") or "")
+        timings: Dict[str, float] = {}
+        t0 = time.perf_counter()
+        async with self.pool.page(int(options.get("device_scale", 2) or 2)) as page:
+            t1 = time.perf_counter()
+            timings["acquire"] = t1 - t0
+            try:
+                await page.goto(self.asset_origin + route_path, wait_until="load")
+            finally:
+                self._pages.pop(route_path, None)
+            timings["goto"] = time.perf_counter() - t1
+            paths = await capture_pages(
+                page, lambda: str(out_dir / f"{uuid.uuid4().hex}{suffix}"), **options, timings=timings
+            )
+        return {"paths": paths, "timings": timings}
+
+    async def handle(self, msg: Dict[str, Any]) -> None:
+        req_id, op = msg.get("id"), msg.get("op")
+        try:
+            if op == "render":
+                result = await self.render(msg)
+            elif op == "ping":
+                result = {"browser": self.pool.running, "jobs": len(self._jobs), "pid": os.getpid()}
+            elif op == "cancel":
+                task = self._jobs.get(msg.get("target"))
+                if task is not None:
+                    task.cancel()
+                result = {"cancelled": task is not None}
+            else:
+                raise ValueError(f"未知操作: {op}")
+        except asyncio.CancelledError:
+            self._send({"id": req_id, "ok": False, "error": "任务已取消"})
+            return
+        except Exception as e:
+            logger.warning("渲染任务 %s 失败: %s", req_id, e)
+            self._send({"id": req_id, "ok": False, "error": f"{type(e).__name__}: {e}"})
+            return
+        finally:
+            self._jobs.pop(req_id, None)
+        self._send({"id": req_id, "ok": True, "result": result})
+
+    async def serve(self) -> None:
+        try:
+            await self.pool.start(prewarm_scales=self.prewarm_scales)
+        except Exception as e:
+            logger.warning("Chromium 启动失败，将在首个任务时重试: %s", e)
+        self._send({"op": "ready", "pid": os.getpid()})
+
+        stdin = sys.stdin.buffer
+        try:
+            while True:
+                line = await asyncio.to_thread(stdin.readline)
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    logger.warning("忽略无法解析的请求行")
+                    continue
+                if "reply" in msg:
+                    waiter = self._asset_waiters.get(msg["reply"])
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(msg)
+                    continue
+                task = asyncio.ensure_future(self.handle(msg))
+                if msg.get("op") == "render":
+                    self._jobs[msg.get("id")] = task
+        finally:
+            for task in list(self._jobs.values()):
+                task.cancel()
+            await self.pool.close()
+
+
+def main() -> None:
+    options = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+    # 协议独占原 stdout；其余写往 stdout 的输出（如第三方库的 print）改到 stderr，避免破坏协议
+    proto = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(levelname)s %(message)s")
+    try:
+        asyncio.run(RenderWorker(options, proto).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Sequence, Tuple, TypeVar
+
+from astrbot.api import logger
+
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """单个后端（渲染器 / Provider）的熔断器与近期健康统计。
+
+    - 最近 window 次调用中失败（含超过 slow_seconds 的慢调用）达到 failure_threshold 次即熔断
+    - 熔断 cooldown_seconds 后进入半开状态，只放行一次探测调用，成功则恢复、失败则再次熔断
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = 3,
+        window: int = 20,
+        cooldown_seconds: float = 60,
+        slow_seconds: float = 0,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_seconds = max(0.0, float(cooldown_seconds))
+        self.slow_seconds = max(0.0, float(slow_seconds))
+        self._outcomes: Deque[bool] = deque(maxlen=max(1, int(window)))
+        self._latencies: Deque[float] = deque(maxlen=max(1, int(window)))
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.cooldown_seconds:
+            return "open"
+        return "half_open"
+
+    @property
+    def error_rate(self) -> float:
+        return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    @property
+    def latency(self) -> float:
+        """近期成功调用的耗时中位数（秒），无数据时为 0。"""
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        return ordered[len(ordered) // 2]
+
+    def allow(self) -> bool:
+        """是否允许调用；半开状态下同一时间只放行一次探测。"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        if ok:
+            self._latencies.append(elapsed)
+        if ok and self.slow_seconds and elapsed > self.slow_seconds:
+            ok = False
+        self._outcomes.append(ok)
+        was_probing, self._probing = self._probing, False
+        if ok:
+            if self._opened_at is not None:
+                logger.info("后端 %s 已恢复，关闭熔断", self.name)
+                self._opened_at = None
+                self._outcomes.clear()
+            return
+        if was_probing or self._outcomes.count(False) >= self.failure_threshold:
+            if self._opened_at is None or was_probing:
+                logger.warning(
+                    "后端 %s 近期失败 %d 次，熔断 %.0f 秒",
+                    self.name,
+                    self._outcomes.count(False),
+                    self.cooldown_seconds,
+                )
+            self._opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """探测调用被取消（未得出结果）时归还探测名额。"""
+        self._probing = False
+
+
+async def hedged(
+    attempts: Sequence[Tuple[str, Callable[[], Awaitable[T]]]],
+    *,
+    breakers: Dict[str, CircuitBreaker],
+    delay: Optional[float] = None,
+) -> T:
+    """按顺序尝试多个后端，返回最先成功的结果。
+
+    - 已熔断的后端被跳过；全部熔断时仍按原顺序尝试，避免完全不可用
+    - delay 为 None 时仅在前一个失败后才启动下一个；否则前一个运行超过 delay 秒仍未完成时
+      提前启动下一个（对冲），先完成者胜出，其余被取消
+    - 在胜者之前启动的落败者计为一次失败：正是它过慢才触发了对冲
+    """
+    queue = list(attempts)
+    if not queue:
+        raise RuntimeError("没有可用的后端")
+    bypass = False
+
+    running: Dict["asyncio.Task[T]", Tuple[str, float]] = {}
+    last_exc: Optional[BaseException] = None
+
+    def launch() -> bool:
+        while queue:
+            name, factory = queue.pop(0)
+            if not bypass and not breakers[name].allow():
+                logger.info("后端 %s 处于熔断状态，已跳过", name)
+                continue
+            running[asyncio.ensure_future(factory())] = (name, time.monotonic())
+            return True
+        return False
+
+    if not launch():
+        logger.warning("全部后端均处于熔断状态，仍按顺序尝试")
+        bypass = True
+        queue.extend(attempts)
+        launch()
+    try:
+        while running:
+            timeout = delay if queue and delay is not None else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.info("当前后端超过 %.1f 秒未完成，对冲启动下一个后端", delay)
+                launch()
+                continue
+            for task in done:
+                name, started = running.pop(task)
+                elapsed = time.monotonic() - started
+                exc = task.exception()
+                breakers[name].record(exc is None, elapsed)
+                if exc is None:
+                    now = time.monotonic()
+                    for loser_name, loser_started in running.values():
+                        if loser_started < started:
+                            breakers[loser_name].record(False, now - loser_started)
+                    return task.result()
+                last_exc = exc
+                logger.warning("后端 %s 失败（%.2f 秒）: %s", name, elapsed, exc)
+            if not running:
+                launch()
+    finally:
+        for task, (name, _started) in running.items():
+            task.cancel()
+            breakers[name].release_probe()
+    raise last_exc or RuntimeError("没有可用的后端")
@@ -0,0 +1,222 @@
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+
+class SchedulerBusy(Exception):
+    """积压超过阈值，请求在入口处被拒绝。"""
+
+
+class StageTicket:
+    """某个阶段的一次占位申请：创建时若有空位立即获得，否则进入公平队列等待。"""
+
+    def __init__(self, limiter: "StageLimiter", group: str, user: str):
+        self._limiter = limiter
+        self.group = group
+        self.user = user
+        self._future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._released = False
+
+    @property
+    def granted(self) -> bool:
+        return self._future.done() and not self._future.cancelled()
+
+    @property
+    def position(self) -> int:
+        """在队列中的名次（1 起），已获得空位时为 0。"""
+        return 0 if self.granted else self._limiter.position_of(self)
+
+    async def wait(self) -> None:
+        try:
+            await asyncio.shield(self._future)
+        except asyncio.CancelledError:
+            self.release()
+            raise
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        if self.granted:
+            self._limiter._on_release()
+        else:
+            self._future.cancel()
+            self._limiter._remove(self)
+
+
+class StageLimiter:
+    """单阶段并发上限 + 按群/用户轮转的公平队列。
+
+    空位释放时先在群之间轮转，再在同一群的用户之间轮转，
+    避免某个群或某个用户的连续请求占满全部名额。
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.active = 0
+        self._queues: "OrderedDict[str, OrderedDict[str, Deque[StageTicket]]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for users in self._queues.values() for q in users.values())
+
+    def set_limit(self, limit: int) -> None:
+        """调整并发上限：调高时立即放行等待者，调低时已在运行的任务不受影响。"""
+        self.limit = max(1, int(limit))
+        self._fill()
+
+    def request(self, group: str, user: str) -> StageTicket:
+        ticket = StageTicket(self, group, user)
+        self._queues.setdefault(group, OrderedDict()).setdefault(user, deque()).append(ticket)
+        self._fill()
+        return ticket
+
+    @asynccontextmanager
+    async def slot(self, group: str, user: str) -> AsyncIterator[StageTicket]:
+        ticket = self.request(group, user)
+        try:
+            await ticket.wait()
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _dispatch_order(self) -> List[StageTicket]:
+        """按轮转规则推演出当前等待者的出队顺序（不修改队列）。"""
+        groups: "OrderedDict[str, OrderedDict[str, List[StageTicket]]]" = OrderedDict(
+            (g, OrderedDict((u, list(q)) for u, q in users.items())) for g, users in self._queues.items()
+        )
+        order: List[StageTicket] = []
+        while groups:
+            g, users = next(iter(groups.items()))
+            groups.move_to_end(g)
+            u, q = next(iter(users.items()))
+            users.move_to_end(u)
+            order.append(q.pop(0))
+            if not q:
+                del users[u]
+            if not users:
+                del groups[g]
+        return order
+
+    def position_of(self, ticket: StageTicket) -> int:
+        try:
+            return self._dispatch_order().index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def _pop_next(self) -> Optional[StageTicket]:
+        while self._queues:
+            g, users = next(iter(self._queues.items()))
+            self._queues.move_to_end(g)
+            u, q = next(iter(users.items()))
+            users.move_to_end(u)
+            ticket = q.popleft()
+            if not q:
+                del users[u]
+            if not users:
+                del self._queues[g]
+            if not ticket._future.done():
+                return ticket
+        return None
+
+    def _on_release(self) -> None:
+        self.active -= 1
+        self._fill()
+
+    def _fill(self) -> None:
+        while self.active < self.limit:
+            ticket = self._pop_next()
+            if ticket is None:
+                break
+            self.active += 1
+            ticket._future.set_result(None)
+
+    def _remove(self, ticket: StageTicket) -> None:
+        users = self._queues.get(ticket.group)
+        q = users.get(ticket.user) if users else None
+        if q is None:
+            return
+        try:
+            q.remove(ticket)
+        except ValueError:
+            return
+        if not q:
+            del users[ticket.user]
+        if not users:
+            del self._queues[ticket.group]
+
+
+class RequestScheduler:
+    """/g 请求的准入控制与各阶段（ocr / solver / render）的并发调度。"""
+
+    def __init__(self, limits: Dict[str, int], *, max_pending: int = 0, max_pending_per_user: int = 0):
+        self.stages: Dict[str, StageLimiter] = {}
+        self.pending = 0
+        self._per_user: Dict[Tuple[str, str], int] = {}
+        self.configure(limits, max_pending=max_pending, max_pending_per_user=max_pending_per_user)
+
+    def configure(self, limits: Dict[str, int], *, max_pending: int = 0, max_pending_per_user: int = 0) -> None:
+        """更新各阶段并发上限与入口积压上限，已排队与运行中的请求保留。"""
+        for name, n in limits.items():
+            limiter = self.stages.get(name)
+            if limiter is None:
+                self.stages[name] = StageLimiter(name, n)
+            else:
+                limiter.set_limit(n)
+        self.max_pending = max(0, int(max_pending))
+        self.max_pending_per_user = max(0, int(max_pending_per_user))
+
+    def stage(self, name: str) -> StageLimiter:
+        return self.stages[name]
+
+    @asynccontextmanager
+    async def admit(self, group: str, user: str) -> AsyncIterator[None]:
+        """入口准入：总积压或单用户积压超限时抛出 SchedulerBusy。"""
+        key = (group, user)
+        if self.max_pending and self.pending >= self.max_pending:
+            raise SchedulerBusy(f"当前积压 {self.pending} 个请求")
+        if self.max_pending_per_user and self._per_user.get(key, 0) >= self.max_pending_per_user:
+            raise SchedulerBusy("该用户已有请求在处理中")
+        self.pending += 1
+        self._per_user[key] = self._per_user.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+            left = self._per_user.get(key, 1) - 1
+            if left > 0:
+                self._per_user[key] = left
+            else:
+                self._per_user.pop(key, None)
+
+    def snapshot(self) -> Dict[str, Tuple[int, int, int]]:
+        """各阶段 (运行中, 等待中, 上限)。"""
+        return {name: (s.active, s.waiting, s.limit) for name, s in self.stages.items()}
+
+
+class SingleFlight:
+    """相同键的并发请求只执行一次：首个请求负责处理，其余请求等待并复用它的结果。"""
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Future] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def join(self, key: str) -> Tuple[asyncio.Future, bool]:
+        """返回 (结果 future, 是否为负责处理的首个请求)。"""
+        fut = self._flights.get(key)
+        if fut is not None:
+            return fut, False
+        fut = asyncio.get_running_loop().create_future()
+        self._flights[key] = fut
+        return fut, True
+
+    def finish(self, key: str, result: Any) -> None:
+        """由首个请求调用（无论成功与否），唤醒全部等待者。"""
+        fut = self._flights.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(result)
@@ -0,0 +1,85 @@
+import asyncio
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, Optional
+
+from astrbot.api import logger
+
+
+class SpoolDir:
+    """渲染中间产物（HTML/PNG）的专用目录。
+
+    - new_path() 生成不会冲突的唯一文件名
+    - gc() 删除超过最长保留时间的文件，并在总大小超限时从最旧的开始删除
+    - start()/stop() 管理后台定期清理任务
+    """
+
+    def __init__(self, root: Path, *, max_age_seconds: float = 3600, max_bytes: int = 0, interval_seconds: float = 300):
+        self.root = Path(root)
+        self.max_age_seconds = max(0.0, float(max_age_seconds))
+        self.max_bytes = max(0, int(max_bytes))
+        self.interval_seconds = max(10.0, float(interval_seconds))
+        self._task: Optional[asyncio.Task] = None
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def new_path(self, suffix: str) -> Path:
+        return self.root / f"{uuid.uuid4().hex}{suffix}"
+
+    def gc(self, extra: Iterable[Path] = ()) -> int:
+        """同步清理，返回删除的文件数。extra 为额外需要按年龄清理的文件（如旧版本遗留的临时文件）。"""
+        now = time.time()
+        removed = 0
+        files = []
+        for p in [*self.root.iterdir(), *extra]:
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if not p.is_file():
+                continue
+            if self.max_age_seconds and now - st.st_mtime > self.max_age_seconds:
+                try:
+                    p.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+                continue
+            if p.parent == self.root:
+                files.append((st.st_mtime, st.st_size, p))
+
+        if self.max_bytes:
+            total = sum(f[1] for f in files)
+            for _mtime, size, p in sorted(files, key=lambda f: f[0]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    p.unlink()
+                    removed += 1
+                    total -= size
+                except OSError:
+                    pass
+        if removed:
+            logger.debug("渲染临时目录清理 %d 个文件", removed)
+        return removed
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await asyncio.to_thread(self.gc)
+            except Exception:
+                logger.exception("渲染临时目录清理失败")
@@ -0,0 +1,85 @@
+import re
+from typing import Any, AsyncIterator, List
+
+# 二级标题（## ）开始一个新段落；### 及更深的标题属于所在段落
+_SECTION_RE = re.compile(r"^##(?!#)\s")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+
+class SectionSplitter:
+    """把流式输出的 Markdown 按二级标题切分为完整段落。
+
+    feed() 每收到一段增量文本，返回此前已经完整（后面出现了下一个 ## 标题）的段落；
+    代码围栏内以 ## 开头的行不视为标题。首个标题之前的内容并入第一个段落。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._line = ""
+        self._section: List[str] = []
+        self._has_heading = False
+        self._fence = ""
+
+    def feed(self, delta: str) -> List[str]:
+        self.text += delta
+        done: List[str] = []
+        lines = (self._line + delta).split("\n")
+        self._line = lines.pop()
+        for line in lines:
+            section = self._push_line(line)
+            if section:
+                done.append(section)
+        return done
+
+    def flush(self) -> List[str]:
+        """流结束时调用，返回剩余的最后一个段落。"""
+        if self._line:
+            self._section.append(self._line)
+            self._line = ""
+        rest = "\n".join(self._section).strip()
+        self._section = []
+        return [rest] if rest else []
+
+    def _push_line(self, line: str) -> str:
+        m = _FENCE_RE.match(line)
+        if m:
+            if not self._fence:
+                self._fence = m.group(1)
+            elif m.group(1) == self._fence:
+                self._fence = ""
+        elif not self._fence and _SECTION_RE.match(line):
+            if self._has_heading:
+                section = "\n".join(self._section).strip()
+                self._section = [line]
+                return section
+            # 首个标题之前的引言并入第一个段落，不单独发送
+            self._has_heading = True
+        self._section.append(line)
+        return ""
+
+
+async def iter_completion(provider: Any, **kwargs: Any) -> AsyncIterator[str]:
+    """逐段产出模型输出的增量文本。
+
+    优先使用 provider.text_chat_stream；分片响应（is_chunk）的 completion_text 为增量，
+    最后的完整响应只补发尚未收到的部分。Provider 不支持流式接口时退回 text_chat 一次性产出。
+    """
+    stream = getattr(provider, "text_chat_stream", None)
+    if not callable(stream):
+        resp = await provider.text_chat(**kwargs)
+        text = resp.completion_text if resp else ""
+        if text:
+            yield text
+        return
+
+    received = ""
+    async for resp in stream(**kwargs):
+        text = (resp.completion_text if resp else "") or ""
+        if getattr(resp, "is_chunk", False):
+            if text:
+                received += text
+                yield text
+        elif text.startswith(received) and len(text) > len(received):
+            tail = text[len(received):]
+            received = text
+            yield tail
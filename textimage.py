@@ -0,0 +1,356 @@
+import io
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, List, Tuple
+
+# 需要浏览器渲染的内容：公式与 LaTeX 转义、代码块（围栏或缩进）、表格、HTML 标签与实体、图片，
+# 以及 CJK 字体通常不含的 emoji；出现任意一项即不走轻量渲染
+_RICH_RE = re.compile(
+    r"\$|\\"
+    r"|^\s*(```|~~~)"
+    r"|^ {4,}\S"
+    r"|^\s*\|.*\|"
+    r"|^\s*:?-{3,}:?\s*\|"
+    r"|<[A-Za-z/!]|&[A-Za-z#][A-Za-z0-9]*;"
+    r"|!\["
+    r"|[\u2600-\u27bf\U00010000-\U0010ffff]",
+    re.M,
+)
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_QUOTE_RE = re.compile(r"^\s*>\s?(.*)$")
+_HR_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_CJK_RE = re.compile(r"[\u2e80-\u9fff\uf900-\ufaff\uff00-\uffef\u3000-\u303f]")
+# 换行时的最小单位：连续的非 CJK 非空白字符为一个词，CJK 字符与空白各自成词
+_TOKEN_RE = re.compile(r"[^\s\u2e80-\u9fff\uf900-\ufaff\uff00-\uffef\u3000-\u303f]+|\s|.")
+
+# 文件名中包含这些片段的字体视为含中文字形
+_CJK_FONT_HINTS = (
+    "notosanscjk", "notoserifcjk", "notosanssc", "notoserifsc", "sourcehansans", "sourcehanserif",
+    "wqy", "msyh", "simhei", "simsun", "pingfang", "hiraginosansgb", "droidsansfallback", "arphic",
+)
+_SYSTEM_FONT_DIRS = (
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    "~/.fonts",
+    "~/.local/share/fonts",
+    "/System/Library/Fonts",
+    "/Library/Fonts",
+    "C:/Windows/Fonts",
+)
+_FONT_FILE_SUFFIXES = (".ttf", ".ttc", ".otf", ".otc")
+
+# 与 main.TMPL 的样式对应的尺寸（CSS 像素）与颜色
+_PAGE_PADDING = 64
+_CONTENT_WIDTH = 1036
+_BODY_SIZE = 16
+_LINE_HEIGHT = 1.8
+_HEADING_SIZES = {1: 22, 2: 20, 3: 18}
+_TEXT_COLOR = (34, 34, 34)
+_MUTED_COLOR = (102, 102, 102)
+_ACCENT_COLOR = (0, 123, 255)
+_RULE_COLOR = (224, 224, 224)
+_QUOTE_BAR_COLOR = (221, 221, 221)
+_BOX_COLOR = (248, 249, 250)
+
+
+def is_simple_markdown(text: str) -> bool:
+    """不含公式、代码块、表格、HTML 与 emoji，只用到标题、列表、引用、强调等简单语法的文本。"""
+    return not _RICH_RE.search(text or "")
+
+
+def _strip_inline(text: str) -> str:
+    """去掉行内强调、行内代码与链接标记，只保留文字。"""
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"(\*\*|__)(.+?)\1", r"\2", text)
+    text = re.sub(r"(?<![\w*])([*_])(?!\s)(.+?)(?<!\s)\1(?![\w*])", r"\2", text)
+    return text.replace("`", "")
+
+
+def _join_lines(lines: List[str]) -> str:
+    """按 Markdown 软换行规则合并段落内的行：CJK 之间直接相连，其余以空格分隔。"""
+    out = ""
+    for line in lines:
+        line = line.strip()
+        if out and not (_CJK_RE.match(out[-1]) and _CJK_RE.match(line[:1])):
+            out += " "
+        out += line
+    return out
+
+
+def parse_blocks(markdown: str) -> List[Tuple[str, Any, str]]:
+    """把简单 Markdown 拆为 (类型, 参数, 文本) 块：heading(级别)、item(缩进层级, 标记)、quote、para、hr。"""
+    blocks: List[Tuple[str, Any, str]] = []
+    para: List[str] = []
+    quote: List[str] = []
+
+    def flush() -> None:
+        if para:
+            blocks.append(("para", None, _strip_inline(_join_lines(para))))
+            para.clear()
+        if quote:
+            blocks.append(("quote", None, _strip_inline(_join_lines(quote))))
+            quote.clear()
+
+    for line in (markdown or "").splitlines():
+        if not line.strip():
+            flush()
+            continue
+        m = _QUOTE_RE.match(line)
+        if m:
+            if para:
+                flush()
+            quote.append(m.group(1))
+            continue
+        if quote:
+            flush()
+        if _HR_RE.match(line):
+            flush()
+            blocks.append(("hr", None, ""))
+            continue
+        m = _HEADING_RE.match(line)
+        if m:
+            flush()
+            blocks.append(("heading", len(m.group(1)), _strip_inline(m.group(2))))
+            continue
+        m = _LIST_RE.match(line)
+        if m:
+            flush()
+            marker = m.group(2)
+            blocks.append(("item", (len(m.group(1).expandtabs(4)) // 2, marker if marker[0].isdigit() else "•"), _strip_inline(m.group(3))))
+            continue
+        if blocks and blocks[-1][0] == "item" and not para and line[:1].isspace():
+            # 列表项的续行
+            kind, arg, text = blocks.pop()
+            blocks.append((kind, arg, _join_lines([text, _strip_inline(line)])))
+            continue
+        para.append(line)
+    flush()
+    return blocks
+
+
+def to_plain_text(markdown: str) -> str:
+    """把简单 Markdown 转为适合直接作为聊天消息发送的纯文本。"""
+    lines: List[str] = []
+    for kind, arg, text in parse_blocks(markdown):
+        if kind == "heading":
+            if lines:
+                lines.append("")
+            lines.append(f"【{text}】")
+        elif kind == "item":
+            lines.append("  " * arg[0] + f"{arg[1]} {text}")
+        elif kind == "quote":
+            lines.append(f"「{text}」")
+        elif kind == "hr":
+            lines.append("——")
+        else:
+            lines.append(text)
+    return "\n".join(lines).strip()
+
+
+def find_cjk_font(preferred: str = "", extra_dirs: Iterable[str] = ()) -> str:
+    """查找可用于轻量渲染的中文字体文件：优先使用 preferred，其次自定义字体目录与系统字体目录中文件名像中文字体的。
+
+    找不到时返回空字符串。会遍历目录树，应在启动或配置变化时调用一次。
+    """
+    if preferred:
+        path = Path(preferred).expanduser()
+        return str(path) if path.is_file() else ""
+    candidates: List[Path] = []
+    for d in [*extra_dirs, *_SYSTEM_FONT_DIRS]:
+        root = Path(str(d)).expanduser()
+        if not root.is_dir():
+            continue
+        for dirpath, _dirs, files in os.walk(root):
+            for name in files:
+                lower = name.lower()
+                key = re.sub(r"[\s_-]", "", lower)
+                if lower.endswith(_FONT_FILE_SUFFIXES) and any(h in key for h in _CJK_FONT_HINTS):
+                    candidates.append(Path(dirpath) / name)
+        if candidates:
+            break
+    # 同一目录下优先常规字重
+    candidates.sort(key=lambda p: (not any(w in p.name.lower() for w in ("regular", "medium", "msyh.", "wqy")), len(p.name)))
+    return str(candidates[0]) if candidates else ""
+
+
+@lru_cache(maxsize=32)
+def _font(path: str, size: int) -> Any:
+    from PIL import ImageFont  # type: ignore
+
+    return ImageFont.truetype(path, size)
+
+
+@lru_cache(maxsize=16384)
+def _text_width(font: Any, text: str) -> float:
+    return font.getlength(text)
+
+
+def _wrap(text: str, font: Any, width: float) -> List[str]:
+    """按宽度折行：每个词只测量一次并累加行宽，长文本的折行耗时随长度线性增长。"""
+    lines: List[str] = []
+    line = ""
+    line_w = 0.0
+    for token in _TOKEN_RE.findall(text):
+        if not line and token.isspace():
+            continue
+        token_w = _text_width(font, token)
+        if line_w + token_w <= width:
+            line += token
+            line_w += token_w
+            continue
+        if line:
+            lines.append(line.rstrip())
+            line, line_w = "", 0.0
+            if token.isspace():
+                continue
+            if token_w <= width:
+                line, line_w = token, token_w
+                continue
+        # 单个词比整行还宽时按字符断开
+        for ch in token:
+            ch_w = _text_width(font, ch)
+            if line and line_w + ch_w > width:
+                lines.append(line)
+                line, line_w = "", 0.0
+            line += ch
+            line_w += ch_w
+    if line.strip():
+        lines.append(line.rstrip())
+    return lines or [""]
+
+
+class _Block:
+    """已排好版的一块内容：高度与相对块顶部的绘制指令。"""
+
+    __slots__ = ("height", "ops")
+
+    def __init__(self) -> None:
+        self.height = 0.0
+        self.ops: List[Tuple[str, tuple]] = []
+
+
+def _layout(question: str, content: str, font_path: str) -> List[_Block]:
+    blocks: List[_Block] = []
+
+    def text_block(text: str, size: int, color: tuple, *, indent: float = 0, prefix: str = "", top: float = 12, bottom: float = 12) -> _Block:
+        font = _font(font_path, size)
+        line_h = size * _LINE_HEIGHT
+        block = _Block()
+        y = top
+        offset = font.getlength(prefix + " ") if prefix else 0
+        for i, line in enumerate(_wrap(text, font, _CONTENT_WIDTH - indent - offset)):
+            if prefix and i == 0:
+                block.ops.append(("text", (indent, y, prefix, size, color)))
+            block.ops.append(("text", (indent + offset, y, line, size, color)))
+            y += line_h
+        block.height = y + bottom
+        return block
+
+    if question:
+        header = text_block("题目解析", 24, _TEXT_COLOR, top=0, bottom=8)
+        small = text_block("由 AstrBot 插件 astrbot_teacher 生成", 13, _MUTED_COLOR, top=0, bottom=24)
+        for op in small.ops:
+            header.ops.append((op[0], (op[1][0], op[1][1] + header.height, *op[1][2:])))
+        header.height += small.height
+        blocks.append(header)
+
+        box = _Block()
+        title = text_block("题目", 18, _ACCENT_COLOR, indent=24, top=16, bottom=8)
+        box.ops.extend(title.ops)
+        y = title.height
+        for para in question.split("\n"):
+            para_block = text_block(para, 15, (51, 51, 51), indent=24, top=0, bottom=0)
+            box.ops.extend(("text", (op[1][0], op[1][1] + y, *op[1][2:])) for op in para_block.ops)
+            y += para_block.height
+        bottom = y + 16
+        box.height = bottom + 20
+        box.ops.insert(0, ("rect", (0, 0, _CONTENT_WIDTH, bottom, _BOX_COLOR)))
+        box.ops.insert(1, ("rect", (0, 0, 4, bottom, _ACCENT_COLOR)))
+        blocks.append(box)
+
+    for kind, arg, text in parse_blocks(content):
+        if kind == "heading":
+            size = _HEADING_SIZES.get(arg, _BODY_SIZE)
+            block = text_block(text, size, (0, 0, 0) if arg == 1 else _TEXT_COLOR, top=24 if arg <= 2 else 20, bottom=12 if arg == 1 else 8)
+            if arg == 1:
+                block.ops.append(("rect", (0, block.height - 4, _CONTENT_WIDTH, block.height - 2, _RULE_COLOR)))
+                block.height += 8
+        elif kind == "item":
+            depth, marker = arg
+            block = text_block(text, _BODY_SIZE, _TEXT_COLOR, indent=28 * (depth + 1) - 18, prefix=marker, top=6, bottom=6)
+        elif kind == "quote":
+            block = text_block(text, _BODY_SIZE, _MUTED_COLOR, indent=20, top=16, bottom=16)
+            block.ops.insert(0, ("rect", (0, 16, 4, block.height - 16, _QUOTE_BAR_COLOR)))
+        elif kind == "hr":
+            block = _Block()
+            block.ops.append(("rect", (0, 24, _CONTENT_WIDTH, 25, _RULE_COLOR)))
+            block.height = 49
+        else:
+            block = text_block(text, _BODY_SIZE, _TEXT_COLOR)
+        blocks.append(block)
+    return blocks
+
+
+def render_text_image(
+    question: str,
+    content: str,
+    *,
+    font_path: str,
+    scale: int = 2,
+    max_page_height: int = 0,
+    max_pages: int = 20,
+    fmt: str = "png",
+    quality: int = 85,
+) -> List[bytes]:
+    """不经浏览器、直接用 Pillow 把简单解答排版为与 HTML 模板相近的卡片图片，返回各页的编码字节。
+
+    只支持 parse_blocks 能处理的简单 Markdown（调用前应以 is_simple_markdown 判断）；
+    max_page_height > 0 时在块之间分页，超出 max_pages 的内容并入最后一页。
+    依赖 Pillow，未安装时抛出 ImportError。CPU 密集，应在线程中调用。
+    """
+    from PIL import Image, ImageDraw  # type: ignore
+
+    scale = max(1, int(scale))
+    blocks = _layout(question, content, font_path)
+    pages: List[List[_Block]] = [[]]
+    used = 0.0
+    for block in blocks:
+        if max_page_height > 0 and pages[-1] and used + block.height > max_page_height - 2 * _PAGE_PADDING and len(pages) < max_pages:
+            pages.append([])
+            used = 0.0
+        pages[-1].append(block)
+        used += block.height
+
+    out: List[bytes] = []
+    for page in pages:
+        height = sum(b.height for b in page) + 2 * _PAGE_PADDING
+        img = Image.new("RGB", (int((_CONTENT_WIDTH + 2 * _PAGE_PADDING) * scale), int(height * scale)), (255, 255, 255))
+        draw = ImageDraw.Draw(img)
+        top = float(_PAGE_PADDING)
+        for block in page:
+            for op, args in block.ops:
+                if op == "rect":
+                    x0, y0, x1, y1, color = args
+                    draw.rectangle(
+                        [(_PAGE_PADDING + x0) * scale, (top + y0) * scale, (_PAGE_PADDING + x1) * scale - 1, (top + y1) * scale - 1],
+                        fill=color,
+                    )
+                else:
+                    x, y, text, size, color = args
+                    font = _font(font_path, size * scale)
+                    # 文字在行高内垂直居中
+                    draw.text(((_PAGE_PADDING + x) * scale, (top + y + size * (_LINE_HEIGHT - 1) / 2) * scale), text, font=font, fill=color)
+            top += block.height
+        buf = io.BytesIO()
+        if fmt == "jpeg":
+            img.save(buf, format="JPEG", quality=max(1, min(95, int(quality))), optimize=True)
+        elif fmt == "webp":
+            img.save(buf, format="WEBP", quality=max(1, min(95, int(quality))), method=4)
+        else:
+            img.save(buf, format="PNG", optimize=True)
+        out.append(buf.getvalue())
+    return out